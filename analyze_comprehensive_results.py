@@ -13,10 +13,7 @@ import json
 import argparse
 import numpy as np
 import pandas as pd
-from scipy import stats
 from collections import defaultdict
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 
 # ============================================================================
@@ -97,6 +94,8 @@ def run_paired_comparison(df, cue_family, cond1, cond2):
     vals1 = df_matched[cond1].values
     vals2 = df_matched[cond2].values
 
+    from scipy import stats
+
     # Paired t-test
     t_stat, p_value = stats.ttest_rel(vals1, vals2)
 
@@ -264,6 +263,8 @@ def plot_paired_comparison(df, cue_family, cond1, cond2, output_file=None):
     vals1 = df_matched[cond1].values
     vals2 = df_matched[cond2].values
 
+    import matplotlib.pyplot as plt
+
     # Create plot
     fig, ax = plt.subplots(figsize=(8, 6))
 
@@ -304,6 +305,8 @@ def plot_family_summary(df, output_file=None):
     # Compute means across stimulus sets
     summary = df.groupby(['cue_family', 'condition'])['class_mass'].agg(['mean', 'sem']).reset_index()
 
+    import matplotlib.pyplot as plt
+
     # Create plot
     fig, ax = plt.subplots(figsize=(14, 6))
 
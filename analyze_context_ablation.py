@@ -3,16 +3,15 @@
 Analyze Context-Length Ablation Results
 
 Generates:
-- Summary tables with mean±CI by k for each condition
+- Summary tables with mean±CI by k for each condition (bootstrap CIs
+  vectorized in bootstrap_stats)
 - Plots: target_mass vs k for each condition (one per cue family)
 """
 
 import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy import stats
+from bootstrap_stats import bootstrap_ci_columns
 
 
 # ============================================================================
@@ -31,20 +30,27 @@ def bootstrap_ci(data, n_bootstrap=10000, ci_level=0.95):
     Returns:
         (lower, upper) bounds
     """
-    if len(data) == 0:
-        return np.nan, np.nan
+    lower, upper = bootstrap_ci_many([data], n_bootstrap, ci_level)
+    return lower[0], upper[0]
 
-    bootstrap_means = []
 
-    for _ in range(n_bootstrap):
-        sample = np.random.choice(data, size=len(data), replace=True)
-        bootstrap_means.append(np.mean(sample))
+def bootstrap_ci_many(columns, n_bootstrap=10000, ci_level=0.95):
+    """
+    Bootstrap confidence intervals for the mean of several arrays at once.
 
-    alpha = 1 - ci_level
-    lower = np.percentile(bootstrap_means, alpha / 2 * 100)
-    upper = np.percentile(bootstrap_means, (1 - alpha / 2) * 100)
+    Resamples are drawn from the global np.random state in column order, so
+    after np.random.seed(s) the bounds equal those of bootstrap_ci called on
+    each array in turn.
 
-    return lower, upper
+    Args:
+        columns: List of value arrays
+        n_bootstrap: Number of bootstrap samples
+        ci_level: Confidence level
+
+    Returns:
+        (lower, upper) arrays, NaN for empty arrays
+    """
+    return bootstrap_ci_columns(columns, n_bootstrap=n_bootstrap, ci=ci_level, rng=np.random)
 
 
 # ============================================================================
@@ -75,6 +81,7 @@ def generate_summary_tables(df, output_prefix):
 
         # Create summary table
         summary_rows = []
+        value_columns = []
 
         for condition in df_family['condition'].unique():
             df_cond = df_family[df_family['condition'] == condition]
@@ -95,7 +102,7 @@ def generate_summary_tables(df, output_prefix):
                 mean = values.mean()
                 std = values.std()
                 sem = values.std() / np.sqrt(len(values))
-                ci_lower, ci_upper = bootstrap_ci(values)
+                value_columns.append(values)
 
                 summary_rows.append({
                     'condition': condition,
@@ -104,12 +111,15 @@ def generate_summary_tables(df, output_prefix):
                     'mean': mean,
                     'std': std,
                     'sem': sem,
-                    'ci_lower': ci_lower,
-                    'ci_upper': ci_upper,
                 })
 
         summary_df = pd.DataFrame(summary_rows)
 
+        # Bootstrap CIs for every (condition, k) row in one vectorized pass
+        ci_lower, ci_upper = bootstrap_ci_many(value_columns)
+        summary_df['ci_lower'] = ci_lower
+        summary_df['ci_upper'] = ci_upper
+
         # Save to CSV
         output_file = f'{output_prefix}_{cue_family}_summary.csv'
         summary_df.to_csv(output_file, index=False)
@@ -137,6 +147,8 @@ def plot_ablation_curves(df, output_prefix):
         df: Results DataFrame
         output_prefix: Prefix for output files
     """
+    import matplotlib.pyplot as plt
+
     print("=" * 80)
     print("GENERATING PLOTS")
     print("=" * 80)
@@ -163,33 +175,26 @@ def plot_ablation_curves(df, output_prefix):
 
             # Aggregate by sentence, then compute mean and CI across sentences
             means = []
-            cis_lower = []
-            cis_upper = []
+            value_columns = []
 
             for k in k_order:
                 df_k = df_cond[df_cond['k'] == k]
 
                 if len(df_k) == 0:
                     means.append(np.nan)
-                    cis_lower.append(np.nan)
-                    cis_upper.append(np.nan)
+                    value_columns.append(np.array([]))
                     continue
 
                 # Aggregate by sentence
                 df_agg = df_k.groupby('sentence_id')['target_mass'].mean().reset_index()
                 values = df_agg['target_mass'].values
 
-                mean = values.mean()
-                ci_lower, ci_upper = bootstrap_ci(values)
-
-                means.append(mean)
-                cis_lower.append(ci_lower)
-                cis_upper.append(ci_upper)
+                means.append(values.mean())
+                value_columns.append(values)
 
-            # Convert to arrays
+            # Convert to arrays (empty k values get NaN bounds)
             means = np.array(means)
-            cis_lower = np.array(cis_lower)
-            cis_upper = np.array(cis_upper)
+            cis_lower, cis_upper = bootstrap_ci_many(value_columns)
 
             # Remove NaN entries
             valid = ~np.isnan(means)
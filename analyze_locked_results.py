@@ -5,7 +5,8 @@ Statistical Analysis for Locked Design Morphosyntax Audit
 Computes:
 - Key paired differences (Jabberwocky vs each scramble condition)
 - FDR-corrected p-values (Benjamini-Hochberg)
-- Bootstrap confidence intervals
+- Sign-flip permutation p-values (exact for small n, Monte Carlo otherwise)
+- Bootstrap confidence intervals (percentile or BCa, vectorized in bootstrap_stats)
 - Effect sizes (Cohen's d)
 - Summary tables per cue family
 
@@ -19,13 +20,15 @@ Usage:
     python analyze_locked_results.py locked_audit_gpt2.json
 """
 
-import json
 import argparse
 import numpy as np
 import pandas as pd
-from scipy import stats
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
 import warnings
+from results_table import read_locked_results
+from bootstrap_stats import CI_METHODS, benjamini_hochberg, bootstrap_ci_columns
+from permutation_tests import (DEFAULT_PERMUTATIONS, EXACT_MAX_N, EXACT_MAX_N_LIMIT,
+                               check_exact_max_n, permutation_pvalues, print_permutation_stats)
 warnings.filterwarnings('ignore')
 
 
@@ -34,10 +37,21 @@ warnings.filterwarnings('ignore')
 # ============================================================================
 
 def paired_ttest(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
-    """Paired t-test returning (t-statistic, p-value)."""
-    with np.errstate(invalid='ignore'):
-        result = stats.ttest_rel(x, y)
-    return result.statistic, result.pvalue
+    """
+    Paired t-test returning (t-statistic, p-value).
+
+    Same numbers as scipy.stats.ttest_rel, computed from the t distribution's
+    CDF in scipy.special: importing scipy.stats costs over a second at
+    startup, which dominated the run time of this script.
+    """
+    from scipy.special import stdtr
+
+    diff = np.asarray(x, dtype=float) - np.asarray(y, dtype=float)
+    n = len(diff)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stat = np.mean(diff) / (np.std(diff, ddof=1) / np.sqrt(n))
+        p_value = 2 * stdtr(n - 1, -np.abs(t_stat))
+    return float(t_stat), float(p_value)
 
 
 def cohens_d_paired(x: np.ndarray, y: np.ndarray) -> float:
@@ -50,20 +64,13 @@ def bootstrap_ci(
     data: np.ndarray,
     n_bootstrap: int = 10000,
     ci: float = 0.95,
-    seed: int = 42
+    seed: int = 42,
+    method: str = 'percentile'
 ) -> Tuple[float, float]:
-    """Bootstrap confidence interval for mean."""
-    rng = np.random.RandomState(seed)
-    boot_means = []
-
-    for _ in range(n_bootstrap):
-        boot_sample = rng.choice(data, size=len(data), replace=True)
-        boot_means.append(np.mean(boot_sample))
-
-    lower = np.percentile(boot_means, (1 - ci) / 2 * 100)
-    upper = np.percentile(boot_means, (1 + ci) / 2 * 100)
-
-    return lower, upper
+    """Bootstrap confidence interval for mean (see bootstrap_stats)."""
+    lower, upper = bootstrap_ci_columns([data], n_bootstrap=n_bootstrap, ci=ci,
+                                        seed=seed, method=method)
+    return lower[0], upper[0]
 
 
 def fdr_correction(p_values: np.ndarray, alpha: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
@@ -73,85 +80,75 @@ def fdr_correction(p_values: np.ndarray, alpha: float = 0.05) -> Tuple[np.ndarra
     Returns:
         (adjusted_p_values, significant_mask)
     """
-    n = len(p_values)
-    if n == 0:
-        return np.array([]), np.array([], dtype=bool)
-
-    # Sort p-values
-    sorted_idx = np.argsort(p_values)
-    sorted_p = p_values[sorted_idx]
-
-    # Calculate adjusted p-values
-    adjusted_p = np.zeros(n)
-    for i, p in enumerate(sorted_p):
-        adjusted_p[i] = p * n / (i + 1)
-
-    # Ensure monotonicity (from end to start)
-    for i in range(n - 2, -1, -1):
-        adjusted_p[i] = min(adjusted_p[i], adjusted_p[i + 1])
-
-    # Cap at 1
-    adjusted_p = np.minimum(adjusted_p, 1.0)
-
-    # Restore original order
-    result = np.zeros(n)
-    result[sorted_idx] = adjusted_p
-
-    significant = result < alpha
-
-    return result, significant
+    return benjamini_hochberg(p_values, alpha)
 
 
 # ============================================================================
 # ANALYSIS FUNCTIONS
 # ============================================================================
 
-def load_results(filepath: str) -> Tuple[Dict, pd.DataFrame]:
-    """Load results JSON into metadata dict and DataFrame."""
-    with open(filepath, 'r') as f:
-        data = json.load(f)
+# Planned paired contrasts (cond_a - cond_b), tested in every cue family
+CONTRASTS = [
+    ('SENTENCE', 'JABBERWOCKY'),
+    ('JABBERWOCKY', 'FULL_SCRAMBLED'),
+    ('JABBERWOCKY', 'CONTENT_SCRAMBLED'),
+    ('JABBERWOCKY', 'FUNCTION_SCRAMBLED'),
+    ('JABBERWOCKY', 'CUE_DELETED'),
+]
 
-    metadata = data['metadata']
-    results = data['results']
+def load_results(filepath: str) -> Tuple[Dict, pd.DataFrame]:
+    """
+    Load results into metadata dict and DataFrame.
 
-    df = pd.DataFrame(results)
-    return metadata, df
+    Reads the columnar copy (results_table) when it is up to date with the
+    JSON; class_mass is flattened into class_mass.<CLASS> columns.
+    """
+    metadata, table = read_locked_results(filepath)
+    return metadata, table.to_dataframe()
 
 
-def compute_contrasts(df: pd.DataFrame, context_k: str = 'full') -> pd.DataFrame:
+def compute_contrasts(df: pd.DataFrame, context_k: str = 'full',
+                      ci_method: str = 'percentile',
+                      permutations: int = DEFAULT_PERMUTATIONS,
+                      exact_max_n: int = EXACT_MAX_N,
+                      perm_workers: int = 1) -> pd.DataFrame:
     """
     Compute key paired contrasts for each cue family.
 
+    Each (family, condition) cell is located once with a single groupby;
+    bootstrap CIs for all contrasts are computed together in one
+    vectorized pass (bootstrap_stats.bootstrap_ci_columns) after the loop,
+    followed by a sign-flip permutation p-value per contrast (p_perm;
+    permutation_tests, exact for n <= exact_max_n). permutations=0 skips the
+    permutation tests. Their run statistics are in df.attrs['permutation'].
+
     Returns DataFrame with statistical results.
     """
     # Filter to specified context length
     df_k = df[df['context_k'] == context_k].copy()
 
-    contrasts = [
-        ('SENTENCE', 'JABBERWOCKY'),
-        ('JABBERWOCKY', 'FULL_SCRAMBLED'),
-        ('JABBERWOCKY', 'CONTENT_SCRAMBLED'),
-        ('JABBERWOCKY', 'FUNCTION_SCRAMBLED'),
-        ('JABBERWOCKY', 'CUE_DELETED'),
-    ]
-
     results = []
+    diff_columns = []
 
-    for family in df_k['cue_family'].unique():
-        df_fam = df_k[df_k['cue_family'] == family]
-
-        for cond_a, cond_b in contrasts:
-            # Get paired values by set_id
-            df_a = df_fam[df_fam['condition'] == cond_a].set_index('set_id')['target_mass']
-            df_b = df_fam[df_fam['condition'] == cond_b].set_index('set_id')['target_mass']
+    # (set_ids, target masses) of every (family, condition) cell, in one groupby pass
+    cells = {
+        key: (cell['set_id'].to_numpy(), cell['target_mass'].to_numpy())
+        for key, cell in df_k.groupby(['cue_family', 'condition'], sort=False)
+    }
+    empty = (np.array([]), np.array([]))
 
-            # Ensure alignment
-            common_ids = df_a.index.intersection(df_b.index)
-            if len(common_ids) == 0:
+    for family in df_k['cue_family'].unique():
+        for cond_a, cond_b in CONTRASTS:
+            # Pair values by set_id, in the order of cond_a's rows
+            ids_a, mass_a = cells.get((family, cond_a), empty)
+            ids_b, mass_b = cells.get((family, cond_b), empty)
+            position_b = {set_id: i for i, set_id in enumerate(ids_b)}
+            common = [(i, position_b[set_id]) for i, set_id in enumerate(ids_a) if set_id in position_b]
+            if len(common) == 0:
                 continue
 
-            x = df_a.loc[common_ids].values
-            y = df_b.loc[common_ids].values
+            x = mass_a[[i for i, _ in common]]
+            y = mass_b[[j for _, j in common]]
 
             # Statistics
             mean_a = np.mean(x)
@@ -160,9 +157,8 @@ def compute_contrasts(df: pd.DataFrame, context_k: str = 'full') -> pd.DataFrame
             t_stat, p_val = paired_ttest(x, y)
             d = cohens_d_paired(x, y)
 
-            # Bootstrap CI for difference
-            diff_vals = x - y
-            ci_low, ci_high = bootstrap_ci(diff_vals)
+            # Bootstrap CI for difference (computed below for all contrasts)
+            diff_columns.append(x - y)
 
             results.append({
                 'cue_family': family,
@@ -172,23 +168,35 @@ def compute_contrasts(df: pd.DataFrame, context_k: str = 'full') -> pd.DataFrame
                 'mean_a': mean_a,
                 'mean_b': mean_b,
                 'diff': diff,
-                'ci_low': ci_low,
-                'ci_high': ci_high,
+                'ci_low': np.nan,
+                'ci_high': np.nan,
                 't_stat': t_stat,
                 'p_value': p_val,
                 'cohens_d': d,
-                'n': len(common_ids),
+                'n': len(common),
             })
 
     df_results = pd.DataFrame(results)
 
-    # Apply FDR correction
     if len(df_results) > 0:
+        # Bootstrap CIs, one shared index matrix per contrast length
+        ci_low, ci_high = bootstrap_ci_columns(diff_columns, method=ci_method)
+        df_results['ci_low'] = ci_low
+        df_results['ci_high'] = ci_high
+
+        # Apply FDR correction
         p_vals = df_results['p_value'].values
         adjusted_p, significant = fdr_correction(p_vals)
         df_results['p_adjusted'] = adjusted_p
         df_results['significant'] = significant
 
+        # Nonparametric confirmation: paired sign-flip permutation test
+        if permutations > 0:
+            p_perm, perm_stats = permutation_pvalues(diff_columns, permutations, exact_max_n,
+                                                     workers=perm_workers)
+            df_results['p_perm'] = p_perm
+            df_results.attrs['permutation'] = perm_stats
+
     return df_results
 
 
@@ -245,8 +253,22 @@ def main():
     parser.add_argument('results_file', type=str, help='Path to results JSON')
     parser.add_argument('--output-prefix', type=str, default=None,
                        help='Prefix for output files')
+    parser.add_argument('--ci-method', type=str, choices=CI_METHODS, default='percentile',
+                       help='Bootstrap interval: percentile or BCa (default: percentile)')
+    parser.add_argument('--permutations', type=int, default=DEFAULT_PERMUTATIONS,
+                       help='Random sign flips per Monte-Carlo permutation test; 0 skips the '
+                            f'p_perm column (default: {DEFAULT_PERMUTATIONS})')
+    parser.add_argument('--exact-max-n', type=int, default=EXACT_MAX_N,
+                       help=f'Enumerate all sign flips for contrasts with at most this many pairs, '
+                            f'at most {EXACT_MAX_N_LIMIT} (default: {EXACT_MAX_N})')
+    parser.add_argument('--perm-workers', type=int, default=1,
+                       help='Processes for the permutation tests (default: 1)')
 
     args = parser.parse_args()
+    try:
+        check_exact_max_n(args.exact_max_n)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Determine output prefix
     if args.output_prefix is None:
@@ -287,14 +309,21 @@ def main():
     print("=" * 80)
     print()
 
-    contrasts = compute_contrasts(df, context_k='full')
+    contrasts = compute_contrasts(df, context_k='full', ci_method=args.ci_method,
+                                  permutations=args.permutations, exact_max_n=args.exact_max_n,
+                                  perm_workers=args.perm_workers)
 
     # Format for display
     display_cols = ['cue_family', 'contrast', 'diff', 'ci_low', 'ci_high',
                    'p_value', 'p_adjusted', 'cohens_d', 'significant']
+    if 'p_perm' in contrasts:
+        display_cols.insert(display_cols.index('p_adjusted') + 1, 'p_perm')
 
     print(contrasts[display_cols].round(4).to_string(index=False))
     print()
+    if 'permutation' in contrasts.attrs:
+        print_permutation_stats(contrasts.attrs['permutation'])
+        print()
 
     # Save contrasts
     contrasts_file = f"{args.output_prefix}_contrasts.csv"
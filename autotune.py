@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Per-Machine, Per-Model Scoring Auto-Tuner
+
+Batch size, torch intra-op threads, sequence packing and precision interact
+strongly on CPU, and the best setting for gpt2 is not the best for
+gpt2-large. This module times short micro-benchmarks over the real
+locked-audit context distribution and remembers the fastest setting per
+(host, model); the batched next-token entry points pick it up automatically.
+
+Method:
+- Contexts: the unique token sequences a locked audit with k ∈ {1, 2, 4, 8,
+  full} would score (via the stimulus bundle), sampled evenly to
+  `n_contexts`
+- For each dtype and packing mode (off / `pack_tokens`): sweep batch size at
+  the machine's full thread count, then sweep intra-op threads at the best
+  batch size (coordinate search; each point is one warm-up pass plus a timed
+  pass over the sample)
+- The fastest point overall, in contexts/s, is saved with the timings of
+  every trial
+
+Only fp32 is tried unless --dtypes asks for reduced precision, so a tuned
+config never changes the numerics of a run unless that was requested at
+tuning time. Inter-op threads are not swept: torch only allows setting them
+once per process, before any parallel work, and the scoring path runs no
+inter-op parallel work.
+
+Entry points that use the tuned config (via resolve_settings, for flags not
+given on the command line; --no-autotune turns it off):
+- run_locked_audit.py (not with --server, which batches on the server)
+- run_context_ablation.py
+
+The other scoring scripts take only explicit flags: run_comprehensive_audit,
+modal_diagnostics, pos_audit and morphosyntax_audit_refined score one
+context at a time, and run_experiment_local batches word-level metrics over
+whole texts, a workload the tuner does not measure. Their --dtype (and
+run_experiment_local's --batch-size) default to fp32 (and 8) regardless of
+the tuned config.
+
+Config: $MORPHOSYNTAX_CACHE/autotune.json (default ~/.cache/morphosyntax/autotune.json)
+
+Usage:
+    python autotune.py --model gpt2 --stimuli stimuli_locked.json
+    python autotune.py --model gpt2 --dtypes fp32 bf16 int8-dynamic
+    python autotune.py --show
+
+    # Entry points use the tuned values for flags that are not given
+    python run_locked_audit.py --model gpt2                 # tuned batch/threads/packing/dtype
+    python run_locked_audit.py --model gpt2 --batch-size 8  # explicit flags win
+    python run_locked_audit.py --model gpt2 --no-autotune
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+
+from precision import DTYPES
+from vocab_annotations import get_cache_root
+
+BATCH_SIZES = (1, 4, 8, 16, 32, 64)
+PACKED_BATCH_SIZES = (1, 2, 4, 8)
+
+# Used for anything neither the command line nor a tuned config sets
+DEFAULT_SETTINGS = {'batch_size': 1, 'threads': 0, 'pack_tokens': 0, 'dtype': 'fp32'}
+
+FORMAT_VERSION = 1
+
+
+# ============================================================================
+# CONFIG FILE
+# ============================================================================
+
+def get_config_path() -> str:
+    """Location of the tuned-settings file."""
+    return os.path.join(get_cache_root(), 'autotune.json')
+
+
+def config_key(model_name: str, host: Optional[str] = None) -> str:
+    return f'{host or socket.gethostname()}|{model_name}'
+
+
+def read_config(path: Optional[str] = None) -> Dict:
+    """All tuned entries ({} if there is no config yet)."""
+    try:
+        with open(path or get_config_path()) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if config.get('format_version') != FORMAT_VERSION:
+        return {}
+    return config.get('entries', {})
+
+
+def write_entry(model_name: str, entry: Dict, path: Optional[str] = None):
+    """Add or replace this host's entry for a model (atomic rewrite of the file)."""
+    path = path or get_config_path()
+    entries = read_config(path)
+    entries[config_key(model_name)] = entry
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'entries': entries}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_tuned_settings(model_name: str, path: Optional[str] = None) -> Optional[Dict]:
+    """Tuned entry for (this host, model), or None."""
+    return read_config(path).get(config_key(model_name))
+
+
+def resolve_settings(
+    model_name: str,
+    batch_size: Optional[int] = None,
+    threads: Optional[int] = None,
+    pack_tokens: Optional[int] = None,
+    dtype: Optional[str] = None,
+    autotune: bool = True,
+    allow_packing: bool = True,
+) -> Dict:
+    """
+    Fill settings the caller left as None from the tuned config, then defaults.
+
+    Args:
+        model_name: Model the settings are for
+        batch_size / threads / pack_tokens / dtype: Explicit values (None = unset)
+        autotune: Use the tuned config at all
+        allow_packing: Whether a tuned pack_tokens may be applied (off when
+            the run uses something packing cannot be combined with)
+
+    Returns:
+        Dict with batch_size, threads, pack_tokens, dtype and 'source'
+        ('autotune' or 'defaults') for the values that were filled in
+    """
+    tuned = load_tuned_settings(model_name) if autotune else None
+    fallback = dict(DEFAULT_SETTINGS)
+    if tuned is not None:
+        fallback.update({name: tuned[name] for name in DEFAULT_SETTINGS})
+        if not allow_packing:
+            fallback['pack_tokens'] = 0
+
+    explicit = {'batch_size': batch_size, 'threads': threads, 'pack_tokens': pack_tokens, 'dtype': dtype}
+    settings = {name: value if value is not None else fallback[name] for name, value in explicit.items()}
+    settings['source'] = 'autotune' if tuned is not None else 'defaults'
+    settings['tuned'] = [name for name, value in explicit.items() if value is None] if tuned is not None else []
+    return settings
+
+
+def print_settings(model_name: str, settings: Dict):
+    """One line saying which settings came from the tuned config."""
+    if settings['tuned']:
+        tuned = ', '.join(f"{name}={settings[name]}" for name in settings['tuned'])
+        print(f"Autotuned settings for {config_key(model_name)}: {tuned}")
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def audit_token_ids(stimuli_file: str, tokenizer, context_lengths: Sequence[int] = (1, 2, 4, 8, -1)) -> List[List[int]]:
+    """Unique token sequences a locked audit over stimuli_file would score."""
+    from batched_inference import plan_unique_contexts
+    from stimulus_bundle import load_stimulus_bundle
+
+    with open(stimuli_file) as f:
+        stimuli = json.load(f)
+    bundle = load_stimulus_bundle(stimuli_file, tokenizer, stimuli)
+
+    token_ids = []
+    for stim_idx, stim in enumerate(stimuli):
+        cue_position = stim['cue_position']
+        for condition in bundle.conditions:
+            words = stim[condition].split()
+            for k in context_lengths:
+                start = 0 if k == -1 else max(0, cue_position + 1 - k)
+                if bundle.exact and start <= cue_position < len(words):
+                    token_ids.append(bundle.context_token_ids(stim_idx, condition, start, cue_position))
+                elif words[start:cue_position + 1]:
+                    token_ids.append(tokenizer(' '.join(words[start:cue_position + 1]))['input_ids'])
+    return plan_unique_contexts(token_ids)[0]
+
+
+def sample_evenly(items: List, n: int, seed: int = 0) -> List:
+    """Deterministic sample of n items that keeps the length distribution (all if n >= len)."""
+    if n <= 0 or n >= len(items):
+        return list(items)
+    order = sorted(range(len(items)), key=lambda i: (len(items[i]), i))
+    step = len(items) / n
+    chosen = [items[order[int(j * step)]] for j in range(n)]
+    random.Random(seed).shuffle(chosen)
+    return chosen
+
+
+def thread_candidates(max_threads: Optional[int] = None) -> List[int]:
+    """Powers of two up to the core count, plus the core count itself."""
+    max_threads = max_threads or os.cpu_count() or 1
+    candidates = {max_threads}
+    n = 1
+    while n < max_threads:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def time_setting(model, token_ids: List[List[int]], pad_token_id: int, batch_size: int,
+                 threads: int, pack_tokens: int, device: str) -> float:
+    """Contexts/s for one setting (one untimed warm-up pass over a slice, then one timed pass)."""
+    import torch
+    from batched_inference import iter_token_id_probs
+
+    torch.set_num_threads(threads)
+    warmup = token_ids[:max(batch_size, 8)]
+    for _ in iter_token_id_probs(model, warmup, pad_token_id, batch_size=batch_size,
+                                 device=device, pack_tokens=pack_tokens):
+        pass
+
+    start = time.perf_counter()
+    for _ in iter_token_id_probs(model, token_ids, pad_token_id, batch_size=batch_size,
+                                 device=device, pack_tokens=pack_tokens):
+        pass
+    return len(token_ids) / (time.perf_counter() - start)
+
+
+def run_autotune(
+    model_name: str,
+    stimuli_file: str,
+    dtypes: Sequence[str] = ('fp32',),
+    pack_tokens: int = 64,
+    n_contexts: int = 256,
+    max_threads: Optional[int] = None,
+) -> Dict:
+    """
+    Search batch size, threads, packing and dtype for this host and model.
+
+    Args:
+        model_name: HuggingFace model name or path
+        stimuli_file: Locked stimuli JSON (for the context length distribution)
+        dtypes: Precisions to consider (see precision.DTYPES)
+        pack_tokens: Tokens per packed row for the packing-on candidates (0 = never pack)
+        n_contexts: Contexts per timed pass
+        max_threads: Largest intra-op thread count to try (default: all cores)
+
+    Returns:
+        Config entry: the best setting, its contexts/s, the untuned baseline
+        (batch 1, fp32, default threads) and every trial
+    """
+    import torch
+    from transformers import AutoTokenizer
+    from batched_inference import get_pad_token_id
+    from precision import load_scoring_model
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    token_ids = sample_evenly(audit_token_ids(stimuli_file, tokenizer), n_contexts)
+    pad_token_id = get_pad_token_id(tokenizer)
+    threads_list = thread_candidates(max_threads)
+    default_threads = torch.get_num_threads()
+    packing_modes = (0, pack_tokens) if pack_tokens > 0 else (0,)
+
+    print(f"Tuning {model_name} on {socket.gethostname()}: {len(token_ids)} contexts, "
+          f"dtypes {list(dtypes)}, threads {threads_list}, packing {list(packing_modes)}")
+
+    trials = []
+
+    def trial(model, dtype, device, batch_size, threads, pack):
+        rate = time_setting(model, token_ids, pad_token_id, batch_size, threads, pack, device)
+        trials.append({'dtype': dtype, 'pack_tokens': pack, 'batch_size': batch_size,
+                       'threads': threads, 'contexts_per_s': rate})
+        print(f"  {dtype:<13} pack={pack:<3} batch={batch_size:<3} threads={threads:<3} {rate:8.1f} ctx/s")
+        return rate
+
+    baseline = None
+    try:
+        for dtype in dtypes:
+            device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+            model = load_scoring_model(model_name, dtype, device)
+            if dtype == 'fp32':
+                baseline = trial(model, dtype, device, 1, default_threads, 0)
+
+            for pack in packing_modes:
+                sizes = PACKED_BATCH_SIZES if pack else BATCH_SIZES
+                rates = {b: trial(model, dtype, device, b, threads_list[-1], pack) for b in sizes}
+                best_batch = max(rates, key=rates.get)
+                for threads in threads_list[:-1]:
+                    trial(model, dtype, device, best_batch, threads, pack)
+            del model
+    finally:
+        torch.set_num_threads(default_threads)
+
+    best = max(trials, key=lambda t: t['contexts_per_s'])
+    return {
+        'host': socket.gethostname(),
+        'model': model_name,
+        'batch_size': best['batch_size'],
+        'threads': best['threads'],
+        'interop_threads': torch.get_num_interop_threads(),
+        'pack_tokens': best['pack_tokens'],
+        'dtype': best['dtype'],
+        'contexts_per_s': best['contexts_per_s'],
+        'baseline_contexts_per_s': baseline,
+        'n_contexts': len(token_ids),
+        'cpu_count': os.cpu_count(),
+        'torch_version': torch.__version__,
+        'stimuli_file': os.path.abspath(stimuli_file),
+        'tuned_at': datetime.now().isoformat(),
+        'trials': trials,
+    }
+
+
+def print_entry(entry: Dict):
+    """Best setting and its speedup over the untuned baseline."""
+    print(f"{entry['host']} | {entry['model']}: batch_size={entry['batch_size']} threads={entry['threads']} "
+          f"pack_tokens={entry['pack_tokens']} dtype={entry['dtype']} "
+          f"→ {entry['contexts_per_s']:.1f} ctx/s", end='')
+    if entry.get('baseline_contexts_per_s'):
+        print(f" ({entry['contexts_per_s'] / entry['baseline_contexts_per_s']:.2f}x vs batch 1, "
+              f"default threads)", end='')
+    print(f"  [tuned {entry['tuned_at'][:19]}]")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Tune batch size, threads, packing and dtype for this machine and a model'
+    )
+    parser.add_argument('--model', action='append', default=None,
+                        help='HuggingFace model name (repeatable, default: gpt2)')
+    parser.add_argument('--stimuli', type=str, default='stimuli_locked.json',
+                        help='Locked stimuli JSON for the context length distribution (default: stimuli_locked.json)')
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=['fp32'],
+                        help='Precisions to consider (default: fp32 only)')
+    parser.add_argument('--pack-tokens', type=int, default=64,
+                        help='Tokens per packed row for the packing candidates, 0 = never pack (default: 64)')
+    parser.add_argument('--n-contexts', type=int, default=256,
+                        help='Contexts per timed pass (default: 256)')
+    parser.add_argument('--max-threads', type=int, default=None,
+                        help='Largest intra-op thread count to try (default: all cores)')
+    parser.add_argument('--show', action='store_true',
+                        help='Print the tuned settings on file and exit')
+    args = parser.parse_args()
+
+    if args.show:
+        entries = read_config()
+        if not entries:
+            print(f"No tuned settings in {get_config_path()}")
+        for entry in entries.values():
+            print_entry(entry)
+        return
+
+    for model_name in args.model or ['gpt2']:
+        entry = run_autotune(model_name, args.stimuli, dtypes=args.dtypes, pack_tokens=args.pack_tokens,
+                             n_contexts=args.n_contexts, max_threads=args.max_threads)
+        write_entry(model_name, entry)
+        print()
+        print_entry(entry)
+        print(f"Saved to {get_config_path()}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Batched Next-Token Inference
+
+Shared helpers for scoring many short contexts with a causal LM in padded
+batches instead of one batch-size-1 forward pass per context.
+
+Method:
+- Tokenize every context once, up front
+- Sort contexts by token length and cut them into length buckets of at most
+  `batch_size` rows, so rows in a bucket need little or no padding
+- Right-pad each bucket and pass an attention mask; under causal attention
+  the real tokens never attend to the padding, so the logits at each row's
+  last real token match the unpadded forward pass
+- Run only the transformer body and apply the LM head to those last-token
+  hidden states, never materializing the [batch, seq_len, vocab] logits
+- Hand the distributions back in input order
+
+Logits leave this module as float32 whatever the model's dtype, so every
+softmax, entropy and class mass downstream is computed in fp32. A row with
+inf/NaN logits is re-run alone through the fp32 reference model
+(precision.load_scoring_model) instead of being passed on or zeroed.
+
+With pack_tokens > 0, contexts are concatenated into packed rows with
+block-diagonal causal masks instead of padded (see sequence_packing).
+
+A scoring_server.RemoteModel can stand in for the model: next_token_logits
+and iter_next_token_probs then send token ids to the warm-model daemon
+instead of running a forward pass here.
+
+Usage:
+    from batched_inference import iter_next_token_probs
+
+    for idx, probs, num_tokens in iter_next_token_probs(model, tokenizer, contexts, batch_size=32):
+        ...
+"""
+
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+
+# ============================================================================
+# TOKENIZATION AND BUCKETING
+# ============================================================================
+
+def get_pad_token_id(tokenizer) -> int:
+    """
+    Pick a padding id for tokenizers without one (GPT-2 and Pythia have none).
+
+    The value never reaches the model's output because padded positions are
+    masked out and sit after every real token.
+    """
+    if tokenizer.pad_token_id is not None:
+        return tokenizer.pad_token_id
+    if tokenizer.eos_token_id is not None:
+        return tokenizer.eos_token_id
+    return 0
+
+
+def tokenize_contexts(tokenizer, contexts: List[str]) -> List[List[int]]:
+    """Tokenize each context without padding (same ids as tokenizer(context))."""
+    return [tokenizer(context)['input_ids'] for context in contexts]
+
+
+def plan_unique_contexts(token_ids: List[List[int]]) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Deduplicate contexts by token id sequence.
+
+    Ablation contexts repeat heavily (every k=1 infinitival context is "to"),
+    so each distinct sequence only needs one forward pass; its distribution
+    is then fanned back out to every context that shares it.
+
+    Args:
+        token_ids: Token ids per context
+
+    Returns:
+        (unique_token_ids, groups), where groups[u] lists the indices into
+        token_ids whose sequence is unique_token_ids[u] (first occurrence first)
+    """
+    unique_index = {}
+    unique_token_ids, groups = [], []
+    for idx, ids in enumerate(token_ids):
+        key = tuple(ids)
+        if key not in unique_index:
+            unique_index[key] = len(unique_token_ids)
+            unique_token_ids.append(ids)
+            groups.append([])
+        groups[unique_index[key]].append(idx)
+    return unique_token_ids, groups
+
+
+def dedup_report(groups: List[List[int]]) -> Dict:
+    """Contexts, unique contexts and dedup ratio (contexts per unique context) of a plan."""
+    n_contexts = sum(len(group) for group in groups)
+    return {
+        'contexts': n_contexts,
+        'unique_contexts': len(groups),
+        'dedup_ratio': n_contexts / len(groups) if groups else None,
+    }
+
+
+def make_length_buckets(
+    token_ids: List[List[int]],
+    batch_size: int
+) -> List[List[int]]:
+    """
+    Group context indices into length-sorted buckets.
+
+    Args:
+        token_ids: Token ids per context
+        batch_size: Maximum rows per bucket
+
+    Returns:
+        List of buckets, each a list of indices into token_ids
+    """
+    order = sorted(range(len(token_ids)), key=lambda i: (len(token_ids[i]), i))
+    batch_size = max(1, batch_size)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def pad_batch(
+    rows: List[List[int]],
+    pad_token_id: int,
+    device: str = 'cpu'
+) -> Tuple['torch.Tensor', 'torch.Tensor', 'torch.Tensor']:
+    """
+    Right-pad token id rows into a batch.
+
+    Returns:
+        (input_ids, attention_mask, lengths)
+    """
+    import torch
+
+    lengths = torch.tensor([len(row) for row in rows], dtype=torch.long)
+    max_len = int(lengths.max())
+
+    input_ids = torch.full((len(rows), max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), max_len), dtype=torch.long)
+
+    for i, row in enumerate(rows):
+        input_ids[i, :len(row)] = torch.tensor(row, dtype=torch.long)
+        attention_mask[i, :len(row)] = 1
+
+    return input_ids.to(device), attention_mask.to(device), lengths.to(device)
+
+
+# ============================================================================
+# BATCHED SCORING
+# ============================================================================
+
+def position_logits(
+    model,
+    input_ids: 'torch.Tensor',
+    positions: Optional['torch.Tensor'] = None,
+    attention_mask: Optional['torch.Tensor'] = None,
+    **model_kwargs
+) -> Tuple['torch.Tensor', object]:
+    """
+    LM-head logits at one position per row, without the full logits tensor.
+
+    Runs only the transformer body (model.base_model: GPT-2's `transformer`,
+    GPT-NeoX's `gpt_neox`), gathers the final hidden state at each row's
+    requested position, and applies the unembedding to those rows alone.
+    The full model would build a [batch, seq_len, vocab_size] tensor and
+    throw away all but one position per row.
+
+    Args:
+        model: HuggingFace causal LM
+        input_ids: Token ids [batch, seq_len]
+        positions: Position per row to unembed (default: last column)
+        attention_mask: Optional attention mask [batch, seq_len]
+        **model_kwargs: Passed to the body (e.g. past_key_values, use_cache)
+
+    Returns:
+        (logits [batch, vocab_size], body outputs incl. past_key_values)
+    """
+    import torch
+
+    head = model.get_output_embeddings()
+
+    with torch.no_grad():
+        if head is None:
+            # No separable LM head: fall back to the full model
+            outputs = model(input_ids=input_ids, attention_mask=attention_mask, **model_kwargs)
+            hidden = outputs.logits
+        else:
+            outputs = model.base_model(input_ids=input_ids, attention_mask=attention_mask, **model_kwargs)
+            hidden = outputs.last_hidden_state
+
+        rows = torch.arange(input_ids.shape[0], device=input_ids.device)
+        if positions is None:
+            positions = torch.full_like(rows, input_ids.shape[1] - 1)
+        hidden = hidden[rows, positions.to(input_ids.device), :]
+
+        logits = hidden if head is None else head(hidden)
+
+    return logits, outputs
+
+
+def last_token_logits(
+    model,
+    input_ids: 'torch.Tensor',
+    attention_mask: Optional['torch.Tensor'] = None,
+    lengths: Optional['torch.Tensor'] = None
+) -> 'torch.Tensor':
+    """
+    Run one (padded) batch and unembed only each row's last real token.
+
+    Args:
+        lengths: Real tokens per row (default: every row fills the batch)
+
+    Returns:
+        Tensor of shape [batch, vocab_size]
+    """
+    positions = None if lengths is None else lengths - 1
+    logits, _ = position_logits(model, input_ids, positions, attention_mask)
+    return logits
+
+
+# ============================================================================
+# NON-FINITE ROW GUARD
+# ============================================================================
+
+def fp32_reference(model):
+    """fp32 model for recomputing bad rows: the reduced-precision model's reference, else the model itself."""
+    loader = getattr(model, 'fp32_reference', None)
+    return loader() if loader is not None else model
+
+
+def _count_rows(model, n_rows: int, n_bad: int = 0, n_unresolved: int = 0):
+    stats = getattr(model, 'precision_stats', None)
+    if stats is not None:
+        stats['rows'] += n_rows
+        stats['nonfinite'] += n_bad
+        stats['recomputed'] += n_bad
+        stats['unresolved'] += n_unresolved
+
+
+def guard_logits(model, logits: 'torch.Tensor', token_rows: List[List[int]]) -> 'torch.Tensor':
+    """
+    Cast next-token logits to float32 and recompute non-finite rows in fp32.
+
+    Each row is checked on its own. A row with any inf/NaN is re-run alone,
+    without padding, through fp32_reference(model); if it is still
+    non-finite it stays NaN (never zeroed) and is counted as unresolved.
+
+    Args:
+        model: Model that produced the logits
+        logits: [batch, vocab_size] logits in any dtype
+        token_rows: Token ids of the context behind each row
+
+    Returns:
+        float32 tensor [batch, vocab_size]
+    """
+    import torch
+
+    logits = logits.float()
+    bad = (~torch.isfinite(logits).all(dim=-1)).nonzero().flatten().tolist()
+    if not bad:
+        _count_rows(model, len(logits))
+        return logits
+
+    reference = fp32_reference(model)
+    device = next(reference.parameters()).device
+    unresolved = 0
+    for row in bad:
+        input_ids = torch.tensor([token_rows[row]], dtype=torch.long, device=device)
+        row_logits = position_logits(reference, input_ids)[0][0].float()
+        unresolved += not bool(torch.isfinite(row_logits).all())
+        logits[row] = row_logits.to(logits.device)
+
+    _count_rows(model, len(logits), len(bad), unresolved)
+    return logits
+
+
+def guard_sequence_logits(model, logits: 'torch.Tensor', token_rows: List[List[int]]) -> 'torch.Tensor':
+    """
+    guard_logits for full-sequence logits [batch, seq_len, vocab_size].
+
+    Only each row's real (unpadded) positions are checked; a bad row is
+    re-run alone through the fp32 reference model.
+    """
+    import torch
+
+    logits = logits.float()
+    bad = [row for row, ids in enumerate(token_rows)
+           if not bool(torch.isfinite(logits[row, :len(ids)]).all())]
+    if not bad:
+        _count_rows(model, len(token_rows))
+        return logits
+
+    reference = fp32_reference(model)
+    device = next(reference.parameters()).device
+    unresolved = 0
+    for row in bad:
+        n = len(token_rows[row])
+        input_ids = torch.tensor([token_rows[row]], dtype=torch.long, device=device)
+        with torch.no_grad():
+            row_logits = reference(input_ids=input_ids).logits[0].float()
+        unresolved += not bool(torch.isfinite(row_logits).all())
+        logits[row, :n] = row_logits.to(logits.device)
+
+    _count_rows(model, len(token_rows), len(bad), unresolved)
+    return logits
+
+
+def next_token_logits(
+    model,
+    token_ids: List[int],
+    prefix_cache=None,
+    dist_cache=None,
+) -> 'torch.Tensor':
+    """
+    Next-token logits for one context, through the optional caches.
+
+    Checks the on-disk distribution cache first, then the prefix KV cache,
+    and only then runs the model; fresh results are written back to the
+    distribution cache. A distribution-cache hit returns log-probabilities,
+    which give the same softmax as the logits.
+
+    Args:
+        model: HuggingFace causal LM (in eval mode)
+        token_ids: Token ids of the context (no padding)
+        prefix_cache: Optional prefix_cache.PrefixKVCache
+        dist_cache: Optional distribution_cache.DistributionCache
+
+    Returns:
+        float32 tensor of shape [vocab_size]
+    """
+    import torch
+
+    if getattr(model, 'is_remote', False):
+        return model.next_token_logits(token_ids)
+
+    if dist_cache is not None:
+        cached = dist_cache.get(token_ids)
+        if cached is not None:
+            return cached
+
+    if prefix_cache is not None:
+        logits = prefix_cache.next_token_logits(model, token_ids)
+    else:
+        device = next(model.parameters()).device
+        input_ids = torch.tensor([token_ids], dtype=torch.long, device=device)
+        logits = guard_logits(model, last_token_logits(model, input_ids), [token_ids])[0]
+
+    if dist_cache is not None:
+        dist_cache.put(token_ids, logits)
+    return logits
+
+
+def iter_next_token_probs(
+    model,
+    tokenizer,
+    contexts: List[str],
+    batch_size: int = 1,
+    device: str = 'cpu',
+    prefix_cache=None,
+    dist_cache=None,
+    pack_tokens: int = 0,
+) -> Iterator[Tuple[int, 'torch.Tensor', int]]:
+    """
+    Compute next-token distributions for many contexts in length buckets.
+
+    Rows are yielded bucket by bucket (not in input order) so that only one
+    bucket of full-vocabulary distributions is alive at a time.
+
+    Args:
+        model: HuggingFace causal LM (already on `device`, in eval mode)
+        tokenizer: Matching tokenizer
+        contexts: Context strings to score
+        batch_size: Maximum contexts per forward pass (1 = unbatched)
+        device: Device the model lives on
+        prefix_cache: Optional prefix_cache.PrefixKVCache; if given, contexts
+            run one at a time in token order so shared prefixes are reused
+            (batch_size is ignored)
+        dist_cache: Optional distribution_cache.DistributionCache; cached
+            contexts are yielded first and only the misses reach the model
+        pack_tokens: Tokens per packed row (0 = padded length buckets); when
+            on, batch_size counts packed rows per forward pass
+
+    Yields:
+        (context_index, probs, num_tokens) with probs a CPU tensor [vocab_size]
+    """
+    token_ids = tokenize_contexts(tokenizer, contexts)
+    yield from iter_token_id_probs(model, token_ids, get_pad_token_id(tokenizer), batch_size=batch_size,
+                                   device=device, prefix_cache=prefix_cache, dist_cache=dist_cache,
+                                   pack_tokens=pack_tokens)
+
+
+def iter_token_id_probs(
+    model,
+    token_ids: List[List[int]],
+    pad_token_id: int,
+    batch_size: int = 1,
+    device: str = 'cpu',
+    prefix_cache=None,
+    dist_cache=None,
+    pack_tokens: int = 0,
+) -> Iterator[Tuple[int, 'torch.Tensor', int]]:
+    """iter_next_token_probs for contexts that are already tokenized."""
+    import torch
+
+    if getattr(model, 'is_remote', False):
+        yield from model.iter_next_token_probs(token_ids, batch_size=batch_size)
+        return
+
+    pending = list(range(len(token_ids)))
+
+    if dist_cache is not None:
+        misses = []
+        for idx in pending:
+            log_probs = dist_cache.get(token_ids[idx])
+            if log_probs is None:
+                misses.append(idx)
+            else:
+                yield idx, torch.softmax(log_probs, dim=-1), len(token_ids[idx])
+        pending = misses
+
+    if prefix_cache is not None:
+        # Lexicographic token order puts contexts with shared prefixes next to
+        # each other, which keeps the LRU cache hot
+        for idx in sorted(pending, key=lambda i: token_ids[i]):
+            logits = prefix_cache.next_token_logits(model, token_ids[idx])
+            if dist_cache is not None:
+                dist_cache.put(token_ids[idx], logits)
+            yield idx, torch.softmax(logits, dim=-1).cpu(), len(token_ids[idx])
+        return
+
+    if pack_tokens > 0:
+        from sequence_packing import iter_packed_token_probs
+
+        yield from iter_packed_token_probs(model, token_ids, pad_token_id, pack_tokens, batch_size=batch_size,
+                                           device=device, indices=pending, dist_cache=dist_cache)
+        return
+
+    for bucket in make_length_buckets([token_ids[i] for i in pending], batch_size):
+        bucket = [pending[i] for i in bucket]
+        input_ids, attention_mask, lengths = pad_batch(
+            [token_ids[i] for i in bucket], pad_token_id, device
+        )
+        logits = guard_logits(model, last_token_logits(model, input_ids, attention_mask, lengths),
+                              [token_ids[i] for i in bucket])
+        probs = torch.softmax(logits, dim=-1).cpu()
+
+        for row, idx in enumerate(bucket):
+            if dist_cache is not None:
+                dist_cache.put(token_ids[idx], logits[row])
+            yield idx, probs[row], len(token_ids[idx])
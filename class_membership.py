@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Vocabulary × Word-Class Membership Matrices
+
+Class mass used to be computed by looping in Python over the top-1000 tokens
+of every distribution, decoding each token and looking its word up in the
+class sets. This module compiles a tokenizer's vocabulary once into a dense
+[vocab_size × num_classes] 0/1 matrix M, so class mass for one context (or a
+whole batch of contexts) is a single `probs @ M`.
+
+Token → word mapping is the same as WordLevelAnalyzer's:
+- Only word-start tokens (decoded string begins with space or newline) count
+- Word = decoded string stripped, lowercased, and stripped of .,!?;:"'-
+- Special tokens (<|endoftext|>, <unk>, <pad>) never count
+
+Usage:
+    from class_membership import ClassMembership
+
+    membership = ClassMembership.from_word_sets(tokenizer, {'VERB': VERB_SET})
+    mass = membership.class_mass_dict(probs, top_k=1000)   # {'VERB': 0.42}
+    mass = membership.class_mass(batch_probs)              # [batch, 1], full vocab
+"""
+
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
+
+from vocab_annotations import load_vocab_annotations
+
+if TYPE_CHECKING:
+    import torch
+
+
+# ============================================================================
+# VOCABULARY DECODING
+# ============================================================================
+
+def decode_vocabulary(tokenizer) -> Tuple[List[str], List[Optional[str]]]:
+    """
+    Decoded string and normalized word per token id.
+
+    Read from the cached per-tokenizer annotation table (vocab_annotations),
+    so no tokenizer.decode calls happen here after the first run.
+
+    Returns:
+        (token_strs, words): words are None for non-word-start tokens
+    """
+    annotations = load_vocab_annotations(tokenizer)
+    return annotations.token_strs(), annotations.words()
+
+
+# ============================================================================
+# MEMBERSHIP MATRIX
+# ============================================================================
+
+class ClassMembership:
+    """
+    Dense vocabulary × class membership matrix for one tokenizer.
+
+    Attributes:
+        class_names: Column order of the matrix
+        matrix: Float tensor [vocab_size, num_classes] with 1.0 where the
+            token's word belongs to the class
+    """
+
+    def __init__(self, class_names: List[str], matrix: 'torch.Tensor'):
+        self.class_names = list(class_names)
+        self.matrix = matrix
+
+    @classmethod
+    def from_word_sets(cls, tokenizer, word_sets: Dict[str, Set[str]]) -> 'ClassMembership':
+        """
+        Build from class word sets (a word may belong to several classes).
+
+        Args:
+            tokenizer: HuggingFace tokenizer
+            word_sets: Dict mapping class names to word sets
+        """
+        import torch
+
+        _, words = decode_vocabulary(tokenizer)
+        class_names = list(word_sets)
+        matrix = torch.zeros((len(words), len(class_names)), dtype=torch.float32)
+
+        for col, class_name in enumerate(class_names):
+            word_set = word_sets[class_name]
+            rows = [i for i, word in enumerate(words) if word is not None and word in word_set]
+            matrix[rows, col] = 1.0
+
+        return cls(class_names, matrix)
+
+    @classmethod
+    def from_classifier(
+        cls,
+        tokenizer,
+        class_names: List[str],
+        classify: Callable[[str, str], Optional[str]]
+    ) -> 'ClassMembership':
+        """
+        Build from an exclusive bucket classifier over word-start tokens.
+
+        Args:
+            tokenizer: HuggingFace tokenizer
+            class_names: Bucket names (matrix columns)
+            classify: Function (word, token_str) -> bucket name, called once
+                per word-start token; None or an unknown name means no bucket
+        """
+        import torch
+
+        token_strs, words = decode_vocabulary(tokenizer)
+        col_index = {name: col for col, name in enumerate(class_names)}
+        matrix = torch.zeros((len(words), len(class_names)), dtype=torch.float32)
+
+        for i, (token_str, word) in enumerate(zip(token_strs, words)):
+            if word is None:
+                continue
+            col = col_index.get(classify(word, token_str))
+            if col is not None:
+                matrix[i, col] = 1.0
+
+        return cls(class_names, matrix)
+
+    def _matrix_for(self, probs: 'torch.Tensor') -> 'torch.Tensor':
+        """Matrix on probs' device/dtype, zero-padded if the LM head is wider than the tokenizer."""
+        import torch
+
+        vocab_size = probs.shape[-1]
+        matrix = self.matrix
+        if matrix.shape[0] < vocab_size:
+            padding = torch.zeros((vocab_size - matrix.shape[0], matrix.shape[1]), dtype=matrix.dtype)
+            matrix = torch.cat([matrix, padding])
+            self.matrix = matrix
+        return matrix[:vocab_size].to(device=probs.device, dtype=probs.dtype)
+
+    def class_mass(self, probs: 'torch.Tensor', top_k: Optional[int] = None) -> 'torch.Tensor':
+        """
+        Probability mass per class.
+
+        Args:
+            probs: Distribution(s) over the vocabulary, [vocab] or [batch, vocab]
+            top_k: Only count the top_k most probable tokens of each row
+                (the original truncation); None or 0 uses the full vocabulary
+
+        Returns:
+            Tensor [num_classes] or [batch, num_classes]
+        """
+        import torch
+
+        if top_k and top_k < probs.shape[-1]:
+            top_k_ids = torch.topk(probs, top_k, dim=-1).indices
+            probs = torch.zeros_like(probs).scatter_(-1, top_k_ids, probs.gather(-1, top_k_ids))
+
+        # Accumulate in float64, like the Python-float sums this replaces
+        probs = probs.double()
+        return probs @ self._matrix_for(probs)
+
+    def class_mass_dict(self, probs: 'torch.Tensor', top_k: Optional[int] = None) -> Dict[str, float]:
+        """Class mass for a single distribution as {class_name: mass}."""
+        mass = self.class_mass(probs, top_k=top_k).tolist()
+        return dict(zip(self.class_names, mass))
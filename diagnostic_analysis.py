@@ -3,12 +3,13 @@ Diagnostic analysis: Deep dive into tokenization and probability distributions.
 Investigates why stripped nonsense has low entropy.
 """
 
-import openai
 import numpy as np
 import json
 import os
 from collections import defaultdict
 
+from openai_logprobs import LogprobClient
+
 # Try to load from .env file if it exists
 try:
     from dotenv import load_dotenv
@@ -16,8 +17,6 @@ try:
 except ImportError:
     pass
 
-openai.api_key = os.environ.get("OPENAI_API_KEY")
-
 def calculate_entropy(logprobs_list):
     """Calculate Shannon entropy from logprobs."""
     probs = [np.exp(lp) for lp in logprobs_list]
@@ -27,51 +26,50 @@ def calculate_entropy(logprobs_list):
     entropy = -sum(p * np.log2(p) if p > 0 else 0 for p in probs)
     return entropy
 
+# One concurrent, rate-limited, disk-cached client per model
+_CLIENTS = {}
+
+def get_client(model="gpt-3.5-turbo"):
+    """Shared LogprobClient for a model."""
+    if model not in _CLIENTS:
+        _CLIENTS[model] = LogprobClient(model=model, concurrency=8)
+    return _CLIENTS[model]
+
+def prefetch_logprobs(texts, model="gpt-3.5-turbo"):
+    """Fetch logprobs for many texts concurrently; later get_detailed_logprobs calls hit the cache."""
+    get_client(model).run(list(dict.fromkeys(texts)), top_logprobs=20, max_tokens=1)
+
 def get_detailed_logprobs(text, model="gpt-3.5-turbo"):
     """Get detailed token and logprob information."""
-    try:
-        response = openai.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": text}],
-            max_tokens=1,
-            logprobs=True,
-            top_logprobs=20
-        )
-
-        if not response.choices[0].logprobs or not response.choices[0].logprobs.content:
-            return None
-
-        content_logprobs = response.choices[0].logprobs.content
-
-        detailed_tokens = []
-        for idx, token_data in enumerate(content_logprobs):
-            token_info = {
-                'position': idx,
-                'token': token_data.token,
-                'logprob': token_data.logprob,
-                'top_logprobs': []
-            }
-
-            if token_data.top_logprobs:
-                for item in token_data.top_logprobs:
-                    token_info['top_logprobs'].append({
-                        'token': item.token,
-                        'logprob': item.logprob,
-                        'prob': np.exp(item.logprob)
-                    })
-
-                # Calculate entropy at this position
-                logprob_values = [item.logprob for item in token_data.top_logprobs]
-                token_info['entropy'] = calculate_entropy(logprob_values)
-
-            detailed_tokens.append(token_info)
-
-        return detailed_tokens
-
-    except Exception as e:
-        print(f"Error: {e}")
+    content_logprobs = get_client(model).get(text, top_logprobs=20, max_tokens=1)
+    if not content_logprobs:
         return None
 
+    detailed_tokens = []
+    for idx, token_data in enumerate(content_logprobs):
+        token_info = {
+            'position': idx,
+            'token': token_data['token'],
+            'logprob': token_data['logprob'],
+            'top_logprobs': []
+        }
+
+        if token_data['top_logprobs']:
+            for item in token_data['top_logprobs']:
+                token_info['top_logprobs'].append({
+                    'token': item['token'],
+                    'logprob': item['logprob'],
+                    'prob': np.exp(item['logprob'])
+                })
+
+            # Calculate entropy at this position
+            logprob_values = [item['logprob'] for item in token_data['top_logprobs']]
+            token_info['entropy'] = calculate_entropy(logprob_values)
+
+        detailed_tokens.append(token_info)
+
+    return detailed_tokens
+
 def print_section_header(title):
     """Print formatted section header."""
     print("\n" + "=" * 80)
@@ -90,9 +88,11 @@ def analyze_stimulus_set(stimuli_file="stimuli.json", set_id=1):
     print_section_header(f"DIAGNOSTIC ANALYSIS: STIMULUS SET {set_id}")
 
     results = {}
+    conditions = ['sentence', 'jabberwocky', 'stripped', 'nonwords']
+    prefetch_logprobs([stim_set[condition] for condition in conditions])
 
     # Analyze each condition
-    for condition in ['sentence', 'jabberwocky', 'stripped', 'nonwords']:
+    for condition in conditions:
         text = stim_set[condition]
         print(f"\n{'*' * 80}")
         print(f"CONDITION: {condition.upper()}")
@@ -150,6 +150,7 @@ def analyze_function_word_effects(stimuli_file="stimuli.json", set_id=1):
         stimuli = json.load(f)
 
     stim_set = [s for s in stimuli if s['set_id'] == set_id][0]
+    prefetch_logprobs([stim_set['jabberwocky'], stim_set['stripped']])
 
     # Analyze Jabberwocky condition
     print("\n" + "*" * 80)
@@ -224,7 +225,10 @@ def analyze_systematic_patterns(stimuli_file="stimuli.json"):
         stimuli = json.load(f)
 
     # Analyze first 5 sets
-    for condition in ['sentence', 'jabberwocky', 'stripped', 'nonwords']:
+    conditions = ['sentence', 'jabberwocky', 'stripped', 'nonwords']
+    prefetch_logprobs([stim_set[condition] for condition in conditions for stim_set in stimuli[:5]])
+
+    for condition in conditions:
         print(f"\n{'*' * 80}")
         print(f"CONDITION: {condition.upper()}")
         print(f"{'*' * 80}\n")
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed On-Disk Cache of Next-Token Distributions
+
+Changing a word set or a classification rule does not change what the model
+predicts, but re-running an audit used to redo every forward pass. This
+module stores next-token log-probabilities on disk so later runs only pay for
+contexts they have never scored.
+
+Key (SHA-256 over):
+- model name
+- weights fingerprint (names, shapes, dtypes and a strided sample of every
+  parameter tensor, so re-trained or re-quantized weights never collide)
+- parameter dtype
+- storage format (full vector or top-k)
+- token-id sequence up to and including the scored position, and the position
+
+Storage per entry (one .npz file, sharded by the first two hex digits):
+- full:  float32 log-probabilities over the whole vocabulary
+- top-k: float16 log-probabilities of the k most probable tokens plus the
+         residual mass, which is spread uniformly over the remaining tokens
+         when the distribution is rebuilt
+
+The cache is size-capped: when it grows past max_bytes the least recently
+used entries (by file mtime, refreshed on every hit) are deleted until it is
+back under 90% of the cap.
+
+Cache location: $MORPHOSYNTAX_CACHE/dists (default ~/.cache/morphosyntax/dists)
+
+Usage:
+    from distribution_cache import DistributionCache
+
+    dist_cache = DistributionCache(model, max_bytes=2 * 1024 ** 3, top_k=0)
+    log_probs = dist_cache.get(token_ids)          # None on a miss
+    dist_cache.put(token_ids, logits)
+    dist_cache.print_report()
+
+    python distribution_cache.py --stats
+    python distribution_cache.py --clear
+"""
+
+import os
+import json
+import hashlib
+import weakref
+import argparse
+import tempfile
+import numpy as np
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from vocab_annotations import get_cache_root
+
+if TYPE_CHECKING:
+    import torch
+
+# Elements sampled per parameter tensor for the weights fingerprint
+FINGERPRINT_SAMPLE = 4096
+
+# Eviction trims the cache down to this fraction of max_bytes
+EVICTION_TARGET = 0.9
+
+FORMAT_VERSION = 1
+
+# Fingerprints already computed in this process, by model object. Weak keys:
+# an id() key could be reused by a new model once the old one is collected.
+_FINGERPRINTS: 'weakref.WeakKeyDictionary[object, str]' = weakref.WeakKeyDictionary()
+
+
+# ============================================================================
+# KEYS
+# ============================================================================
+
+def get_cache_dir() -> str:
+    """Root directory for cached distributions."""
+    return os.path.join(get_cache_root(), 'dists')
+
+
+def _state_tensors(state_dict):
+    """(name, tensor) pairs of a state dict, unpacking int8 packed-parameter tuples."""
+    import torch
+
+    for name, value in state_dict.items():
+        if torch.is_tensor(value):
+            yield name, value
+        elif isinstance(value, (tuple, list)):
+            for i, item in enumerate(value):
+                if torch.is_tensor(item):
+                    yield f'{name}.{i}', item
+
+
+def weights_fingerprint(model) -> str:
+    """
+    Cheap content hash of a model's weights.
+
+    Hashes every parameter's name, shape and dtype plus a strided sample of
+    FINGERPRINT_SAMPLE values, which is enough to tell checkpoints apart
+    without reading gigabytes of weights.
+    """
+    import torch
+
+    if model in _FINGERPRINTS:
+        return _FINGERPRINTS[model]
+
+    h = hashlib.sha256()
+    with torch.no_grad():
+        for name, tensor in _state_tensors(model.state_dict()):
+            if tensor.is_quantized:
+                tensor = tensor.int_repr()
+            flat = tensor.detach().reshape(-1)
+            step = max(1, flat.numel() // FINGERPRINT_SAMPLE)
+            sample = flat[::step][:FINGERPRINT_SAMPLE].to(torch.float32).cpu().numpy()
+            h.update(f'{name}|{tuple(tensor.shape)}|{tensor.dtype}|'.encode('utf-8'))
+            h.update(sample.tobytes())
+
+    _FINGERPRINTS[model] = h.hexdigest()[:16]
+    return _FINGERPRINTS[model]
+
+
+def model_dtype(model) -> str:
+    """Parameter dtype as a short string ('float32', 'bfloat16', ...)."""
+    return str(next(model.parameters()).dtype).replace('torch.', '')
+
+
+def scan_entries(directory: str):
+    """(path, size, mtime) of every cache entry under directory."""
+    entries = []
+    if not os.path.isdir(directory):
+        return entries
+    for shard in os.scandir(directory):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith('.npz') and not entry.name.startswith('.tmp_'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class DistributionCache:
+    """
+    Persistent next-token log-probability cache for one model.
+
+    Attributes:
+        max_bytes: Disk budget for this cache directory (0 = unbounded)
+        top_k: Tokens stored per distribution (0 = full vector)
+        stats: Counters for lookups, hits, misses, writes and evictions
+    """
+
+    def __init__(
+        self,
+        model,
+        model_name: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 2 * 1024 ** 3,
+        top_k: int = 0,
+    ):
+        self.model_name = model_name or getattr(model, 'name_or_path', '') or type(model).__name__
+        self.weights_hash = weights_fingerprint(model)
+        self.dtype = model_dtype(model)
+        self.directory = cache_dir or get_cache_dir()
+        self.max_bytes = max_bytes
+        self.top_k = top_k
+        self._bytes = None
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'bytes_written': 0,
+            'evictions': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Keys and paths
+    # ------------------------------------------------------------------
+
+    def key(self, token_ids: List[int], position: Optional[int] = None) -> str:
+        """
+        Content address of the distribution after token_ids[position].
+
+        Only the tokens up to the position matter under causal attention, so
+        the same prefix scored inside a longer text shares its entry.
+        """
+        if position is None:
+            position = len(token_ids) - 1
+        payload = json.dumps([
+            FORMAT_VERSION, self.model_name, self.weights_hash, self.dtype,
+            self.top_k, list(token_ids[:position + 1]), position
+        ])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.npz')
+
+    # ------------------------------------------------------------------
+    # Lookup and storage
+    # ------------------------------------------------------------------
+
+    def get(self, token_ids: List[int], position: Optional[int] = None) -> Optional['torch.Tensor']:
+        """
+        Cached log-probabilities for the next token, or None on a miss.
+
+        Returns:
+            float32 CPU tensor [vocab_size]; softmax of it gives the
+            distribution back (exactly for full storage)
+        """
+        import torch
+
+        self.stats['lookups'] += 1
+        path = self._path(self.key(token_ids, position))
+
+        try:
+            with np.load(path) as entry:
+                if 'log_probs' in entry:
+                    log_probs = torch.from_numpy(entry['log_probs'].astype(np.float32))
+                else:
+                    log_probs = self._expand_top_k(entry)
+        except (OSError, ValueError, KeyError):
+            self.stats['misses'] += 1
+            return None
+
+        try:
+            os.utime(path)  # Refresh LRU position
+        except OSError:
+            pass
+
+        self.stats['hits'] += 1
+        return log_probs
+
+    @staticmethod
+    def _expand_top_k(entry) -> 'torch.Tensor':
+        """Rebuild a full log-probability vector from a top-k entry."""
+        import torch
+
+        vocab_size = int(entry['vocab_size'])
+        token_ids = entry['token_ids'].astype(np.int64)
+        residual = float(entry['residual'])
+
+        n_rest = vocab_size - len(token_ids)
+        fill = np.log(residual / n_rest) if residual > 0 and n_rest > 0 else -np.inf
+        log_probs = np.full(vocab_size, fill, dtype=np.float32)
+        log_probs[token_ids] = entry['top_log_probs'].astype(np.float32)
+        return torch.from_numpy(log_probs)
+
+    def put(self, token_ids: List[int], logits: 'torch.Tensor', position: Optional[int] = None):
+        """Store the distribution given by next-token logits [vocab_size]."""
+        import torch
+
+        log_probs = torch.log_softmax(logits.detach().float(), dim=-1).cpu()
+
+        if self.top_k and self.top_k < log_probs.shape[-1]:
+            top_log_probs, top_ids = torch.topk(log_probs, self.top_k)
+            residual = max(0.0, 1.0 - float(top_log_probs.double().exp().sum()))
+            arrays = {
+                'vocab_size': np.array(log_probs.shape[-1], dtype=np.int64),
+                'token_ids': top_ids.numpy().astype(np.int32),
+                'top_log_probs': top_log_probs.numpy().astype(np.float16),
+                'residual': np.array(residual, dtype=np.float64),
+            }
+        else:
+            arrays = {'log_probs': log_probs.numpy()}
+
+        path = self._path(self.key(token_ids, position))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Atomic write: readers never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"  Warning: could not write distribution cache entry {path}: {e}")
+            return
+
+        size = os.path.getsize(path)
+        self.stats['writes'] += 1
+        self.stats['bytes_written'] += size
+
+        if self.max_bytes:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in scan_entries(self.directory))
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+
+    def _evict(self):
+        """Delete least-recently-used entries until under EVICTION_TARGET × max_bytes."""
+        entries = sorted(scan_entries(self.directory), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = EVICTION_TARGET * self.max_bytes
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Another process got there first
+            total -= size
+            self.stats['evictions'] += 1
+
+        self._bytes = total
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict:
+        """Summary statistics (hit rate, writes, evictions)."""
+        stats = dict(self.stats)
+        stats['hit_rate'] = stats['hits'] / max(stats['lookups'], 1)
+        stats['model_name'] = self.model_name
+        stats['weights_hash'] = self.weights_hash
+        stats['dtype'] = self.dtype
+        stats['top_k'] = self.top_k
+        stats['directory'] = self.directory
+        return stats
+
+    def print_report(self):
+        """Print the cache summary at the end of a run."""
+        stats = self.report()
+        print("Distribution cache:")
+        print(f"  Lookups:   {stats['lookups']}")
+        print(f"  Hit rate:  {stats['hit_rate']:.1%} "
+              f"({stats['hits']} hits, {stats['misses']} misses)")
+        print(f"  Written:   {stats['writes']} entries, {stats['bytes_written'] / 1024 ** 2:.1f} MB "
+              f"({stats['evictions']} evicted)")
+        print(f"  Location:  {stats['directory']}")
+
+
+def make_dist_cache(model, model_name: str, dist_cache_mb: int, top_k: int = 0) -> Optional[DistributionCache]:
+    """DistributionCache with a dist_cache_mb budget, or None if dist_cache_mb <= 0."""
+    if dist_cache_mb <= 0:
+        return None
+    print(f"Distribution cache: {dist_cache_mb} MB at {get_cache_dir()} "
+          f"({'top-' + str(top_k) if top_k else 'full vectors'})")
+    return DistributionCache(model, model_name=model_name,
+                             max_bytes=dist_cache_mb * 1024 ** 2, top_k=top_k)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect or clear the on-disk next-token distribution cache'
+    )
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Cache root (default: $MORPHOSYNTAX_CACHE/dists)')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print entry count and size')
+    parser.add_argument('--clear', action='store_true',
+                        help='Delete every cached distribution')
+    args = parser.parse_args()
+
+    directory = args.cache_dir or get_cache_dir()
+    entries = scan_entries(directory)
+
+    if args.clear:
+        for path, _, _ in entries:
+            os.remove(path)
+        print(f"Removed {len(entries)} entries from {directory}")
+    else:
+        total = sum(size for _, size, _ in entries)
+        print(f"{directory}: {len(entries)} entries, {total / 1024 ** 2:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Distribution Store for Post-Hoc Reanalysis
+
+Class mass is a cheap function of the next-token distribution, but the
+distribution itself needs the model. run_locked_audit and
+run_comprehensive_audit can dump every full next-token distribution they
+compute into a store; this module then recomputes class mass under new word
+sets, other top_k values, or the modal VerbOnly / VPStart target definitions
+over the whole store without loading the model.
+
+Layout of a store directory:
+- store.json           model, tokenizer, vocab size, row count, shard list
+- index.jsonl          one JSON object per row (set_id, condition, context_k,
+                       cue position, cue word, context, ...)
+- shard_00000.npy ...  float16 [rows, vocab_size] probability shards
+                       (memory-mapped on read)
+
+store.json is written last, so an interrupted run never leaves a store that
+looks complete.
+
+Usage:
+    # Write (done by the audit scripts)
+    python run_locked_audit.py --model gpt2-large --dump-distributions dists_gpt2-large/
+
+    # Reanalyze
+    from distribution_store import DistributionStore
+
+    store = DistributionStore('dists_gpt2-large/')
+    df = store.class_mass_frame({'VERB': NEW_VERB_SET}, top_k=1000)
+    df = store.modal_targets(top_k=1000)
+
+    python distribution_store.py dists_gpt2-large/ --modal
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple
+
+from class_membership import ClassMembership
+
+if TYPE_CHECKING:
+    import torch
+
+FORMAT_VERSION = 1
+
+# Rows per shard file (~100 MB per shard for a 50k vocabulary)
+DEFAULT_SHARD_ROWS = 1024
+
+STORE_FILE = 'store.json'
+INDEX_FILE = 'index.jsonl'
+
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+class DistributionStoreWriter:
+    """
+    Append next-token distributions (float16) with a row index.
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        model_name: str,
+        tokenizer_name: Optional[str] = None,
+        shard_rows: int = DEFAULT_SHARD_ROWS,
+        metadata: Optional[Dict] = None,
+    ):
+        self.directory = directory
+        self.model_name = model_name
+        self.tokenizer_name = tokenizer_name or model_name
+        self.shard_rows = shard_rows
+        self.metadata = metadata or {}
+
+        self.vocab_size = None
+        self.shards: List[str] = []
+        self.n_rows = 0
+        self._buffer: List[np.ndarray] = []
+
+        os.makedirs(directory, exist_ok=True)
+        # Start from an empty index; a stale store.json would describe old shards
+        for name in (STORE_FILE, INDEX_FILE):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self._index = open(os.path.join(directory, INDEX_FILE), 'w')
+
+    def add(self, probs: 'torch.Tensor', row: Dict):
+        """
+        Append one distribution.
+
+        Args:
+            probs: Next-token probabilities [vocab_size]
+            row: JSON-serializable row metadata (set_id, condition, ...)
+        """
+        probs = probs.detach().float().cpu().numpy().astype(np.float16)
+        if self.vocab_size is None:
+            self.vocab_size = len(probs)
+        elif len(probs) != self.vocab_size:
+            raise ValueError(f"Expected vocab size {self.vocab_size}, got {len(probs)}")
+
+        self._buffer.append(probs)
+        self._index.write(json.dumps(row) + '\n')
+        self.n_rows += 1
+
+        if len(self._buffer) >= self.shard_rows:
+            self._flush()
+
+    def _flush(self):
+        """Write buffered rows as the next shard."""
+        if not self._buffer:
+            return
+        name = f'shard_{len(self.shards):05d}.npy'
+        tmp_path = os.path.join(self.directory, f'.tmp_{name}')
+        np.save(tmp_path, np.stack(self._buffer))
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        self.shards.append(name)
+        self._buffer = []
+
+    def close(self):
+        """Flush the last shard and write store.json."""
+        self._flush()
+        self._index.close()
+
+        with open(os.path.join(self.directory, STORE_FILE), 'w') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'model': self.model_name,
+                'tokenizer': self.tokenizer_name,
+                'vocab_size': self.vocab_size,
+                'dtype': 'float16',
+                'n_rows': self.n_rows,
+                'shard_rows': self.shard_rows,
+                'shards': self.shards,
+                'created': datetime.now().isoformat(),
+                **self.metadata,
+            }, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def make_store_writer(directory: Optional[str], model_name: str, **metadata) -> Optional[DistributionStoreWriter]:
+    """DistributionStoreWriter for directory, or None if no directory was given."""
+    if not directory:
+        return None
+    print(f"Dumping next-token distributions to: {directory}")
+    return DistributionStoreWriter(directory, model_name, metadata=metadata)
+
+
+# ============================================================================
+# READER / REANALYSIS
+# ============================================================================
+
+class DistributionStore:
+    """
+    Read-only view of a distribution store (shards are memory-mapped).
+
+    Attributes:
+        metadata: Contents of store.json
+        index: Row metadata, one dict per row
+    """
+
+    def __init__(self, directory: str):
+        store_path = os.path.join(directory, STORE_FILE)
+        if not os.path.exists(store_path):
+            raise ValueError(f"{directory} is not a complete distribution store (no {STORE_FILE})")
+
+        with open(store_path) as f:
+            self.metadata = json.load(f)
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = [json.loads(line) for line in f if line.strip()]
+
+        self.directory = directory
+        self.shards = [np.load(os.path.join(directory, name), mmap_mode='r')
+                       for name in self.metadata['shards']]
+        self._offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+        self._tokenizer = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def vocab_size(self) -> int:
+        return self.metadata['vocab_size']
+
+    def load_tokenizer(self):
+        """The store's tokenizer (no model weights are loaded)."""
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.metadata['tokenizer'])
+        return self._tokenizer
+
+    def frame(self) -> pd.DataFrame:
+        """Row index as a DataFrame."""
+        return pd.DataFrame(self.index)
+
+    def select(self, **filters) -> np.ndarray:
+        """Row numbers whose metadata equals every given value, e.g. select(condition='SENTENCE')."""
+        return np.array([
+            i for i, row in enumerate(self.index)
+            if all(row.get(key) == value for key, value in filters.items())
+        ], dtype=np.int64)
+
+    def iter_blocks(self, block_size: int = 1024) -> Iterator[Tuple[int, 'torch.Tensor']]:
+        """
+        Yield (first_row, float32 probs [rows, vocab_size]) in row order.
+
+        Blocks never straddle shards, so each is one contiguous memmap read.
+        """
+        import torch
+
+        for shard_idx, shard in enumerate(self.shards):
+            for start in range(0, len(shard), block_size):
+                block = np.asarray(shard[start:start + block_size], dtype=np.float32)
+                yield int(self._offsets[shard_idx]) + start, torch.from_numpy(block)
+
+    def class_mass(
+        self,
+        membership: ClassMembership,
+        top_k: Optional[int] = None,
+        block_size: int = 1024,
+    ) -> np.ndarray:
+        """
+        Class mass for every row.
+
+        Args:
+            membership: Vocabulary × class matrix for the store's tokenizer
+            top_k: Only count each row's top_k tokens (None/0 = full vocabulary)
+            block_size: Rows per vectorized read
+
+        Returns:
+            float64 array [n_rows, num_classes] in membership.class_names order
+        """
+        mass = np.zeros((len(self), len(membership.class_names)), dtype=np.float64)
+        for start, probs in self.iter_blocks(block_size):
+            mass[start:start + len(probs)] = membership.class_mass(probs, top_k=top_k).numpy()
+        return mass
+
+    def class_mass_frame(
+        self,
+        word_sets: Dict[str, Set[str]],
+        top_k: Optional[int] = None,
+        tokenizer=None,
+    ) -> pd.DataFrame:
+        """
+        Row index plus one mass column per word set (and their sum as 'target_mass').
+
+        Args:
+            word_sets: Dict mapping class names to word sets
+            top_k: Only count each row's top_k tokens (None/0 = full vocabulary)
+            tokenizer: Override for the store's tokenizer
+        """
+        tokenizer = tokenizer or self.load_tokenizer()
+        membership = ClassMembership.from_word_sets(tokenizer, word_sets)
+        mass = self.class_mass(membership, top_k=top_k)
+
+        df = self.frame()
+        for col, class_name in enumerate(membership.class_names):
+            df[class_name] = mass[:, col]
+        df['target_mass'] = mass.sum(axis=1)
+        return df
+
+    def modal_targets(self, top_k: Optional[int] = 1000, tokenizer=None) -> pd.DataFrame:
+        """
+        modal_diagnostics mass decomposition for every row.
+
+        Adds the bucket columns (mass_VERB, mass_BEHAVE, ...) and the two
+        target definitions: VerbOnly = VERB, VPStart = VERB + BEHAVE + NEG.
+        """
+        from modal_diagnostics import get_bucket_membership
+
+        tokenizer = tokenizer or self.load_tokenizer()
+        membership = get_bucket_membership(tokenizer)
+        mass = self.class_mass(membership, top_k=top_k)
+
+        df = self.frame()
+        for col, bucket in enumerate(membership.class_names):
+            df[f'mass_{bucket}'] = mass[:, col]
+        df['mass_VerbOnly'] = df['mass_VERB']
+        df['mass_VPStart'] = df['mass_VERB'] + df['mass_BEHAVE'] + df['mass_NEG']
+        return df
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize or reanalyze a dumped next-token distribution store'
+    )
+    parser.add_argument('store', type=str,
+                        help='Store directory (written with --dump-distributions)')
+    parser.add_argument('--modal', action='store_true',
+                        help='Print VerbOnly / VPStart mass per condition and context_k')
+    parser.add_argument('--top-k', type=int, default=1000,
+                        help='Top tokens per row for class mass, 0 = full vocabulary (default: 1000)')
+    args = parser.parse_args()
+
+    store = DistributionStore(args.store)
+    meta = store.metadata
+    print(f"Store: {args.store}")
+    print(f"  Model:      {meta['model']}")
+    print(f"  Rows:       {len(store)} in {len(store.shards)} shards")
+    print(f"  Vocab size: {store.vocab_size} ({meta['dtype']})")
+    print()
+
+    if args.modal:
+        df = store.modal_targets(top_k=args.top_k)
+        group_cols = [c for c in ['condition', 'context_k'] if c in df.columns]
+        summary = df.groupby(group_cols)[['mass_VerbOnly', 'mass_VPStart']].mean()
+        print(summary.round(4).to_string())
+
+
+if __name__ == '__main__':
+    main()
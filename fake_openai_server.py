@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-Compatible Chat Completions Server
+
+A local stand-in for POST /v1/chat/completions with logprobs, so the
+logprob client (openai_logprobs.py) and the scripts that use it can be run
+without network access or an API key.
+
+Behaviour:
+- Tokens are whitespace-split words of the prompt; the i-th generated token
+  and its top_logprobs are a deterministic function of the prompt, so the
+  same request always gets the same answer
+- --fail-rate injects 429 (with Retry-After) and 500 responses at random
+- --latency-ms adds a fixed delay per request, to make concurrency visible
+- GET /stats reports request and injected-failure counts
+
+Usage:
+    python fake_openai_server.py --port 8123 --fail-rate 0.2 --latency-ms 200
+
+    client = LogprobClient(base_url='http://127.0.0.1:8123/v1')
+    python run_experiment.py --base-url http://127.0.0.1:8123/v1
+"""
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+# ============================================================================
+# FAKE LOGPROBS
+# ============================================================================
+
+def _rng(*parts) -> np.random.Generator:
+    seed = hashlib.sha256('|'.join(map(str, parts)).encode('utf-8')).digest()[:8]
+    return np.random.default_rng(int.from_bytes(seed, 'little'))
+
+
+def fake_logprobs(model: str, prompt: str, max_tokens: int, top_logprobs: int) -> List[Dict]:
+    """Deterministic logprobs.content for a prompt, shaped like the real API's."""
+    words = prompt.split() or ['']
+    content = []
+    for position in range(max(1, max_tokens)):
+        rng = _rng(model, prompt, position)
+        n = max(1, top_logprobs)
+        logits = rng.normal(0.0, 2.0, size=n + 1)
+        log_probs = logits - np.log(np.exp(logits).sum())
+        order = np.argsort(-log_probs[:n])
+        # Prompt words as candidate tokens, suffixed to stay distinct when there are few words
+        candidates = [f' {words[(position + i) % len(words)]}' + (str(i // len(words)) if i >= len(words) else '')
+                      for i in range(n)]
+        top = [
+            {'token': candidates[rank], 'logprob': float(log_probs[idx]),
+             'bytes': list(candidates[rank].encode('utf-8'))}
+            for rank, idx in enumerate(order)
+        ]
+        content.append({
+            'token': top[0]['token'],
+            'logprob': top[0]['logprob'],
+            'bytes': top[0]['bytes'],
+            'top_logprobs': top[:top_logprobs],
+        })
+    return content
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with failure injection and counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, fail_rate: float = 0.0, latency_ms: float = 0.0, seed: int = 0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.fail_rate = fail_rate
+        self.latency = latency_ms / 1000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'server_errors': 0, 'max_in_flight': 0}
+        self.in_flight = 0
+
+    def serve_in_background(self) -> threading.Thread:
+        """Start serving on a daemon thread (for scripts that host the server themselves)."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            self._send(200, self.server.stats)
+        else:
+            self._send(404, {'error': {'message': f'Unknown endpoint: {self.path}'}})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {'error': {'message': f'Unknown endpoint: {self.path}'}})
+            return
+
+        with server.lock:
+            server.stats['requests'] += 1
+            server.in_flight += 1
+            server.stats['max_in_flight'] = max(server.stats['max_in_flight'], server.in_flight)
+            roll = server.random.random()
+
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+
+            if roll < server.fail_rate / 2:
+                with server.lock:
+                    server.stats['rate_limited'] += 1
+                self._send(429, {'error': {'message': 'Rate limit reached (fake)', 'type': 'requests',
+                                           'code': 'rate_limit_exceeded'}},
+                           headers={'Retry-After': '0.05'})
+                return
+            if roll < server.fail_rate:
+                with server.lock:
+                    server.stats['server_errors'] += 1
+                self._send(500, {'error': {'message': 'Internal server error (fake)', 'type': 'server_error'}})
+                return
+
+            model = request.get('model', 'fake')
+            prompt = ' '.join(m.get('content', '') for m in request.get('messages', []))
+            max_tokens = int(request.get('max_tokens') or 1)
+            top_logprobs = int(request.get('top_logprobs') or 0)
+            content = fake_logprobs(model, prompt, max_tokens, top_logprobs)
+
+            with server.lock:
+                server.stats['ok'] += 1
+            self._send(200, {
+                'id': f'chatcmpl-fake-{server.stats["requests"]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(c['token'] for c in content)},
+                    'logprobs': {'content': content if request.get('logprobs') else None, 'refusal': None},
+                    'finish_reason': 'length',
+                }],
+                'usage': {
+                    'prompt_tokens': len(prompt.split()),
+                    'completion_tokens': len(content),
+                    'total_tokens': len(prompt.split()) + len(content),
+                },
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI-compatible chat completions server')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with 429 or 500 (default: 0)')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Delay per request in ms (default: 0)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer((args.host, args.port), fail_rate=args.fail_rate,
+                              latency_ms=args.latency_ms, seed=args.seed)
+    print(f"Fake OpenAI server on {server.base_url} (fail rate {args.fail_rate}, "
+          f"latency {args.latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{server.stats}")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
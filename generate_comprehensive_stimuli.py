@@ -17,10 +17,10 @@ This makes the analysis airtight by controlling for:
 import json
 import random
 import hashlib
+import argparse
 
-# Load existing stimuli (base sentences + jabberwocky)
-with open('stimuli_infinitival_to.json', 'r') as f:
-    base_stimuli = json.load(f)
+# Existing stimuli (base sentences + jabberwocky)
+BASE_STIMULI_FILE = 'stimuli_infinitival_to.json'
 
 # Function words (never treated as content)
 FUNCTION_WORDS = {
@@ -154,9 +154,12 @@ def cue_deletion(sentence, cue_word='to', replacement='ke'):
 
     return ' '.join(result)
 
-def generate_comprehensive_stimuli():
+def generate_comprehensive_stimuli(base_file=BASE_STIMULI_FILE):
     """Generate all 6 conditions for each base stimulus."""
 
+    with open(base_file, 'r') as f:
+        base_stimuli = json.load(f)
+
     comprehensive_stimuli = []
 
     print("=" * 80)
@@ -275,6 +278,11 @@ def verify_conditions(stimuli):
     print("✓ Verification complete")
 
 def main():
+    parser = argparse.ArgumentParser(
+        description=f'Generate the 6-condition comprehensive stimulus set from {BASE_STIMULI_FILE}'
+    )
+    parser.parse_args()
+
     # Generate stimuli
     comprehensive_stimuli = generate_comprehensive_stimuli()
 
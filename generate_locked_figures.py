@@ -28,18 +28,16 @@ Usage:
     python generate_locked_figures.py locked_audit_gpt2.json locked_audit_gpt2-medium.json --models gpt2 gpt2-medium
 """
 
-import json
 import argparse
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import seaborn as sns
 from typing import List, Dict, Optional
 from pathlib import Path
 
+from results_table import read_locked_results
+
 # Publication-quality settings
-plt.rcParams.update({
+RC_PARAMS = {
     'font.size': 10,
     'axes.titlesize': 11,
     'axes.labelsize': 10,
@@ -50,7 +48,7 @@ plt.rcParams.update({
     'savefig.dpi': 300,
     'savefig.bbox': 'tight',
     'font.family': 'sans-serif',
-})
+}
 
 # Color palette
 CONDITION_COLORS = {
@@ -94,16 +92,23 @@ MODEL_COLORS = ['#2c3e50', '#e74c3c', '#27ae60', '#8e44ad', '#f39c12']
 MODEL_MARKERS = ['o', 's', '^', 'D', 'v']
 
 
+def pyplot():
+    """matplotlib.pyplot with the publication settings (imported on first plot)."""
+    import matplotlib.pyplot as plt
+
+    plt.rcParams.update(RC_PARAMS)
+    return plt
+
+
 # ============================================================================
 # DATA LOADING
 # ============================================================================
 
 def load_results(filepath: str) -> pd.DataFrame:
-    """Load results JSON into DataFrame."""
-    with open(filepath, 'r') as f:
-        data = json.load(f)
-    df = pd.DataFrame(data['results'])
-    df['model'] = data['metadata']['model']
+    """Load results into DataFrame (from the columnar copy when up to date)."""
+    metadata, table = read_locked_results(filepath)
+    df = table.to_dataframe()
+    df['model'] = metadata['model']
     return df
 
 
@@ -132,6 +137,8 @@ def plot_slot_constraint(
 
     Creates a 2×3 grid of panels (one per cue family).
     """
+    plt = pyplot()
+
     df_k = df[df['context_k'] == context_k].copy()
     models = df_k['model'].unique()
     n_models = len(models)
@@ -207,6 +214,8 @@ def plot_slot_constraint_lines(
     """
     Alternative line plot version for multiple models.
     """
+    plt = pyplot()
+
     df_k = df[df['context_k'] == context_k].copy()
     models = df_k['model'].unique()
 
@@ -269,6 +278,8 @@ def plot_paired_differences(
     - Jabberwocky - ContentScrambled
     - Jabberwocky - FunctionScrambled
     """
+    plt = pyplot()
+
     df_k = df[df['context_k'] == context_k].copy()
 
     contrasts = [
@@ -341,6 +352,8 @@ def plot_paired_differences_summary(
     """
     Summary plot: Mean differences with 95% CI across all cue families.
     """
+    plt = pyplot()
+
     df_k = df[df['context_k'] == context_k].copy()
 
     contrasts = [
@@ -406,6 +419,8 @@ def plot_context_ablation(
     """
     Context ablation curves: Target mass vs context length k.
     """
+    plt = pyplot()
+
     # Map context_k to numeric for plotting
     k_order = ['1', '2', '4', '8', 'full']
     k_numeric = {'1': 1, '2': 2, '4': 4, '8': 8, 'full': 16}  # Use 16 for 'full'
@@ -467,6 +482,8 @@ def plot_context_ablation_jab_vs_scramble(
     """
     Focused ablation: Compare Jabberwocky to scrambled conditions only.
     """
+    plt = pyplot()
+
     k_order = ['1', '2', '4', '8', 'full']
     k_numeric = {'1': 1, '2': 2, '4': 4, '8': 8, 'full': 16}
 
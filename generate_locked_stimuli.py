@@ -28,6 +28,7 @@ Author: Morphosyntax Experiment Framework v2
 
 import json
 import random
+import argparse
 import hashlib
 import re
 from typing import Dict, List, Tuple, Set
@@ -755,6 +756,10 @@ def sanity_check_stimuli(stimuli: List[Dict], log_file: str):
 
 def main():
     """Generate locked design stimuli for all cue families."""
+    parser = argparse.ArgumentParser(
+        description='Generate locked design stimuli for all cue families'
+    )
+    parser.parse_args()
 
     print("=" * 80)
     print("LOCKED DESIGN STIMULUS GENERATOR")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Hierarchical Bootstrap Across Items and Models
+
+Cross-model scaling claims (SCALING_VALIDATION_PLAN.md) compared per-model
+means by eye. Every model is scored on the same stimulus items, so per-model
+effects are correlated through the items; resampling each model's items
+independently would understate the uncertainty of differences and slopes.
+
+Method:
+- Results of every model are stacked into one long table (model, item,
+  condition, value) and pivoted to a dense effect matrix
+  D[model, item] = value(cond_a) - value(cond_b) (NaN where an item is
+  missing for a model)
+- Level 1 (items): one resample-index matrix over items is shared by all
+  models, so each replicate resamples the same items for every model;
+  D[:, idx] gathers every model's replicate at once (chunked with
+  bootstrap_stats.resample_index_chunks)
+- Level 2 (models): each replicate also resamples the models, and the
+  scaling slope (effect per decade of parameters, OLS on log10 params) is
+  fitted across the resampled models; replicates that draw a single model
+  size have no slope and are dropped (counted)
+- Reported: per-model Δ with item-level CIs, and the slope with an item-only
+  CI (these models, new items) and a two-level CI (new items and models)
+
+Usage:
+    # Locked audits (model and size from metadata), target mass at k=full
+    python hierarchical_bootstrap.py locked_audit_gpt2.json locked_audit_gpt2-medium.json \\
+        locked_audit_gpt2-large.json
+
+    # Experiment results: FILE:PARAMS_IN_MILLIONS, any per-condition metric
+    python hierarchical_bootstrap.py experiment_results_gpt2_final.json:124 \\
+        experiment_results_gpt2_medium_final.json:355 experiment_results_gpt2_large_final.json:774 \\
+        --metric mean_word_entropy --contrast JABBERWOCKY SCRAMBLED_JABBERWOCKY
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bootstrap_stats import DEFAULT_MAX_BYTES, percentile_interval, resample_index_chunks
+from results_table import ResultsTable, load_fresh_table
+
+# Parameter counts (millions) of the audited models, for the scaling slope
+MODEL_PARAMS = {
+    'distilgpt2': 82,
+    'gpt2': 124,
+    'gpt2-medium': 355,
+    'gpt2-large': 774,
+    'gpt2-xl': 1558,
+    'EleutherAI/pythia-160m': 162,
+    'EleutherAI/pythia-410m': 410,
+    'EleutherAI/pythia-1b': 1012,
+    'EleutherAI/pythia-2.8b': 2775,
+}
+
+# Experiment-results condition names -> locked-design names
+CONDITION_ALIASES = {'JABBERWOCKY_MATCHED': 'JABBERWOCKY'}
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+def locked_audit_table(df: pd.DataFrame, metric: str = 'target_mass', context_k: str = 'full') -> pd.DataFrame:
+    """
+    Long table (item, condition, value) of one locked audit's results.
+
+    Items are stimuli, identified by cue family and set_id (set_ids repeat
+    across families).
+    """
+    df = df[df['context_k'] == context_k]
+    long = df.groupby(['cue_family', 'set_id', 'condition'])[metric].mean().reset_index()
+    long.insert(0, 'item', long.pop('cue_family') + '/' + long.pop('set_id').astype(str))
+    long.columns = ['item', 'condition', 'value']
+    return long
+
+
+def experiment_results_table(data: List[Dict], metric: str = 'mean_word_entropy') -> pd.DataFrame:
+    """Long table (item, condition, value) of one run_experiment results list."""
+    rows = [
+        {'item': entry['set_id'], 'condition': condition.upper(), 'value': cond[metric]}
+        for entry in data
+        for condition, cond in entry['conditions'].items()
+        if cond.get(metric) is not None
+    ]
+    return pd.DataFrame(rows)
+
+
+def load_models(specs: Sequence[str], metric: Optional[str] = None, context_k: str = 'full') -> pd.DataFrame:
+    """
+    Stack the results of every model into one long table.
+
+    Args:
+        specs: Result files, optionally suffixed with :PARAMS (millions)
+        metric: Value column (default: target_mass for locked audits,
+            mean_word_entropy for experiment results)
+        context_k: Context length of locked-audit rows to use
+
+    Returns:
+        DataFrame with model, params, item, condition, value
+
+    Raises:
+        ValueError: If a model's parameter count is unknown and not given
+    """
+    frames = []
+    for spec in specs:
+        path, _, params = spec.partition(':')
+        table = load_fresh_table(path)
+        if table is None:
+            with open(path) as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                table = ResultsTable.from_records(data['results'], data['metadata'])
+        if table is not None:
+            model = table.metadata['model']
+            long = locked_audit_table(table.to_dataframe(), metric or 'target_mass', context_k)
+        else:
+            model = Path(path).stem.replace('experiment_results_', '')
+            long = experiment_results_table(data, metric or 'mean_word_entropy')
+
+        if params:
+            params = float(params)
+        elif model in MODEL_PARAMS:
+            params = MODEL_PARAMS[model]
+        else:
+            raise ValueError(f"No parameter count for {model} ({path}); pass {path}:PARAMS_IN_MILLIONS")
+
+        long['condition'] = long['condition'].replace(CONDITION_ALIASES)
+        long['model'] = model
+        long['params'] = params
+        frames.append(long)
+    return pd.concat(frames, ignore_index=True)
+
+
+def effect_matrix(long: pd.DataFrame, cond_a: str, cond_b: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Dense per-item effect matrix from the long table.
+
+    Returns:
+        (models, params [M], D [M, items]) with D = value(cond_a) - value(cond_b),
+        NaN where a model lacks the item in either condition
+    """
+    wide = long.set_index(['model', 'params', 'item', 'condition'])['value'].unstack('condition')
+    for cond in (cond_a, cond_b):
+        if cond not in wide.columns:
+            raise ValueError(f"Condition {cond} not in results (have: {', '.join(wide.columns)})")
+    diff = (wide[cond_a] - wide[cond_b]).unstack('item')
+
+    # Order models by size, keeping the input order for ties
+    order = list(dict.fromkeys(long['model']))
+    diff = diff.reset_index().set_index('model').loc[order].sort_values('params', kind='stable')
+    params = diff.pop('params').to_numpy(dtype=float)
+    return list(diff.index), params, diff.to_numpy(dtype=float)
+
+
+# ============================================================================
+# BOOTSTRAP
+# ============================================================================
+
+def ols_slopes(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """OLS slope of y on x along the last axis; NaN where x has no spread."""
+    xc = x - x.mean(axis=-1, keepdims=True)
+    yc = y - y.mean(axis=-1, keepdims=True)
+    sxx = (xc * xc).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(sxx > 0, (xc * yc).sum(axis=-1) / np.where(sxx > 0, sxx, 1), np.nan)
+
+
+def hierarchical_bootstrap(
+    effects: np.ndarray,
+    params: np.ndarray,
+    n_bootstrap: int = 10000,
+    ci: float = 0.95,
+    seed: int = 42,
+    max_bytes: int = DEFAULT_MAX_BYTES
+) -> Dict:
+    """
+    Two-level bootstrap of per-model effects and the scaling slope.
+
+    Args:
+        effects: D [M, items] of per-item effects (NaN = missing)
+        params: Parameter counts [M] (the slope is per log10 unit)
+        n_bootstrap: Replicates
+        ci: Confidence level
+        seed: RandomState seed (items are drawn first, then models)
+        max_bytes: Memory bound on each gathered chunk
+
+    Returns:
+        Dict with per-model delta/ci_low/ci_high, slope, slope CIs for the
+        item level and for both levels, degenerate replicate count, seconds
+    """
+    start_time = time.time()
+    rng = np.random.RandomState(seed)
+    n_models, n_items = effects.shape
+    x = np.log10(params)
+
+    present = (~np.isnan(effects)).astype(float)
+    filled = np.nan_to_num(effects)
+
+    chunk_size = max(1, int(max_bytes // (8 * n_models * n_items)))
+    model_means = np.empty((n_models, n_bootstrap))
+    start = 0
+    for idx in resample_index_chunks(n_items, n_bootstrap, rng, chunk_size):
+        # Same resampled items for every model: [M, rows, items] -> means [M, rows],
+        # skipping missing items (a replicate with none of a model's items is NaN)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            model_means[:, start:start + len(idx)] = (filled[:, idx].sum(axis=-1) /
+                                                      present[:, idx].sum(axis=-1))
+        start += len(idx)
+
+    # Level 2: resample models per replicate and refit the slope
+    model_idx = rng.randint(0, n_models, size=(n_bootstrap, n_models))
+    replicate = np.arange(n_bootstrap)[:, None]
+    two_level = ols_slopes(x[model_idx], model_means.T[replicate, model_idx])
+    item_level = ols_slopes(np.broadcast_to(x, (n_bootstrap, n_models)), model_means.T)
+    valid = np.isfinite(two_level)
+
+    delta = np.nanmean(effects, axis=1)
+    low, high = percentile_interval(model_means, ci)
+    item_low, item_high = percentile_interval(item_level[None, :], ci)
+    two_low, two_high = (percentile_interval(two_level[valid][None, :], ci) if valid.any()
+                         else (np.array([np.nan]), np.array([np.nan])))
+
+    return {
+        'delta': delta,
+        'ci_low': low,
+        'ci_high': high,
+        'n_items': present.sum(axis=1).astype(int),
+        'slope': float(ols_slopes(x, delta)),
+        'slope_item_ci': (float(item_low[0]), float(item_high[0])),
+        'slope_two_level_ci': (float(two_low[0]), float(two_high[0])),
+        'degenerate': int((~valid).sum()),
+        'n_bootstrap': n_bootstrap,
+        'ci': ci,
+        'seconds': time.time() - start_time,
+    }
+
+
+def run_scaling_bootstrap(specs: Sequence[str], cond_a: str = 'SENTENCE', cond_b: str = 'JABBERWOCKY',
+                          metric: Optional[str] = None, context_k: str = 'full',
+                          n_bootstrap: int = 10000, ci: float = 0.95, seed: int = 42) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Load every model's results and bootstrap Δ(cond_a - cond_b) and its scaling slope.
+
+    Returns:
+        (per-model DataFrame, bootstrap result dict; models with no finite
+        effect are listed in result['dropped'])
+    """
+    long = load_models(specs, metric, context_k)
+    models, params, effects = effect_matrix(long, cond_a, cond_b)
+
+    # Models without a single finite effect (e.g. all-NaN runs) carry no information
+    keep = ~np.isnan(effects).all(axis=1)
+    dropped = [m for m, k in zip(models, keep) if not k]
+    models = [m for m, k in zip(models, keep) if k]
+    params, effects = params[keep], effects[keep]
+
+    result = hierarchical_bootstrap(effects, params, n_bootstrap, ci, seed)
+    result['dropped'] = dropped
+    table = pd.DataFrame({
+        'model': models,
+        'params_m': params,
+        'n_items': result['n_items'],
+        'delta': result['delta'],
+        'ci_low': result['ci_low'],
+        'ci_high': result['ci_high'],
+    })
+    return table, result
+
+
+def print_scaling_bootstrap(table: pd.DataFrame, result: Dict, cond_a: str, cond_b: str):
+    """Per-model Δ with CIs and the scaling slope with both CIs."""
+    level = f"{result['ci']:.0%}"
+    print()
+    print("=" * 80)
+    print(f"HIERARCHICAL BOOTSTRAP: Δ({cond_a} − {cond_b}), {result['n_bootstrap']} replicates")
+    print("=" * 80)
+    print()
+    print(table.round(4).to_string(index=False))
+    print()
+    print(f"Scaling slope (Δ per log10 params): {result['slope']:.4f}")
+    print(f"  {level} CI, items resampled:           "
+          f"[{result['slope_item_ci'][0]:.4f}, {result['slope_item_ci'][1]:.4f}]")
+    print(f"  {level} CI, items and models resampled: "
+          f"[{result['slope_two_level_ci'][0]:.4f}, {result['slope_two_level_ci'][1]:.4f}] "
+          f"({result['degenerate']} single-size replicates dropped)")
+    if result.get('dropped'):
+        print(f"Dropped (no finite values): {', '.join(result['dropped'])}")
+    print(f"Time: {result['seconds']:.2f}s")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Two-level (items x models) bootstrap CIs for per-model effects and scaling slopes'
+    )
+    parser.add_argument('results', nargs='+',
+                        help='Locked-audit JSONs or experiment-results JSONs; append :PARAMS '
+                             '(millions) for models not in MODEL_PARAMS')
+    parser.add_argument('--contrast', nargs=2, metavar=('COND_A', 'COND_B'),
+                        default=['SENTENCE', 'JABBERWOCKY'],
+                        help='Effect is COND_A - COND_B (default: SENTENCE JABBERWOCKY)')
+    parser.add_argument('--metric', type=str, default=None,
+                        help='Value to compare (default: target_mass for locked audits, '
+                             'mean_word_entropy for experiment results)')
+    parser.add_argument('--context-k', type=str, default='full',
+                        help='Context length of locked-audit rows (default: full)')
+    parser.add_argument('--n-bootstrap', type=int, default=10000,
+                        help='Bootstrap replicates (default: 10000)')
+    parser.add_argument('--ci', type=float, default=0.95,
+                        help='Confidence level (default: 0.95)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed (default: 42)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write the per-model table to this CSV (default: none)')
+    args = parser.parse_args()
+
+    cond_a, cond_b = (c.upper() for c in args.contrast)
+    table, result = run_scaling_bootstrap(args.results, cond_a, cond_b, args.metric, args.context_k,
+                                          args.n_bootstrap, args.ci, args.seed)
+    print_scaling_bootstrap(table, result, cond_a, cond_b)
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Saved: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
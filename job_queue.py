@@ -0,0 +1,777 @@
+#!/usr/bin/env python3
+"""
+SQLite-Backed Job Queue for Multi-Model Sweeps
+
+Replaces the bash drivers (run_cross_model_replication.sh,
+run_locked_pipeline.sh) and the polling scripts (monitor_*.sh,
+auto_analyze_when_ready.sh). Jobs live in a local SQLite database, so a sweep
+survives terminal restarts and its state can be queried at any time.
+
+Method:
+- A job is (script, model, stimuli, output, params) plus positional args,
+  a memory estimate and a list of jobs it depends on
+- The scheduler starts ready jobs (all dependencies done) while both the
+  concurrency limit and the memory budget allow
+- A job that crashes (non-zero exit or a signal such as SIGBUS) is retried
+  with linear backoff up to max_attempts; resumable audit scripts are
+  restarted with --resume
+- Analysis and figure jobs depend on their audit jobs, so they run as soon
+  as their inputs exist; if an input job fails for good they are skipped
+- Each job's stdout/stderr goes to job_logs/<id>_<name>.log
+
+Usage:
+    # Enqueue audit → analysis (→ figures) for the default five models
+    python job_queue.py sweep --pipeline comprehensive
+    python job_queue.py sweep --pipeline locked --model gpt2 --model gpt2-medium
+
+    # Enqueue a single job
+    python job_queue.py add run_locked_audit.py --model gpt2 \\
+        --stimuli stimuli_locked.json --output locked_audit_gpt2.json --param top-k=1000
+
+    # Run (stays in the foreground until the queue is drained)
+    python job_queue.py run --concurrency 2 --memory-mb 16000
+
+    # Queue depth, throughput and ETA
+    python job_queue.py status
+    python job_queue.py retry 7
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_DB = 'morphosyntax_jobs.db'
+DEFAULT_LOG_DIR = 'job_logs'
+
+# Job states
+PENDING, RUNNING, DONE, FAILED, SKIPPED = 'pending', 'running', 'done', 'failed', 'skipped'
+STATES = [PENDING, RUNNING, DONE, FAILED, SKIPPED]
+
+# Seconds added to the retry delay per failed attempt
+RETRY_BACKOFF = 30.0
+
+# Scripts that accept --resume (restarted from their partial sidecar on retry)
+RESUMABLE_SCRIPTS = {'run_locked_audit.py', 'run_experiment_local.py'}
+
+# Peak resident memory estimates in MB (fp32 weights + activations + Python)
+MODEL_MEMORY_MB = {
+    'distilgpt2': 1000,
+    'gpt2': 1500,
+    'gpt2-medium': 3000,
+    'gpt2-large': 6000,
+    'gpt2-xl': 12000,
+    'EleutherAI/pythia-160m': 1500,
+    'EleutherAI/pythia-410m': 3000,
+    'EleutherAI/pythia-1b': 6000,
+    'EleutherAI/pythia-1.4b': 8000,
+}
+UNKNOWN_MODEL_MEMORY_MB = 4000
+ANALYSIS_MEMORY_MB = 500
+
+# Models of run_cross_model_replication.sh
+DEFAULT_SWEEP_MODELS = [
+    'gpt2',
+    'gpt2-medium',
+    'gpt2-large',
+    'EleutherAI/pythia-160m',
+    'EleutherAI/pythia-410m',
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    name         TEXT NOT NULL,
+    script       TEXT NOT NULL,
+    model        TEXT,
+    stimuli      TEXT,
+    output       TEXT,
+    params       TEXT NOT NULL DEFAULT '{}',
+    args         TEXT NOT NULL DEFAULT '[]',
+    depends_on   TEXT NOT NULL DEFAULT '[]',
+    memory_mb    INTEGER NOT NULL DEFAULT 0,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    retry_after  REAL NOT NULL DEFAULT 0,
+    exit_code    INTEGER,
+    error        TEXT,
+    pid          INTEGER,
+    log_path     TEXT,
+    created      REAL NOT NULL,
+    started      REAL,
+    finished     REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS scheduler (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def model_slug(model: str) -> str:
+    """Filename-safe model name (same rule as the bash drivers: '/' → '_')."""
+    return model.replace('/', '_')
+
+
+def estimate_memory_mb(model: Optional[str]) -> int:
+    """Memory estimate for a job on model (analysis jobs without a model are small)."""
+    if not model:
+        return ANALYSIS_MEMORY_MB
+    return MODEL_MEMORY_MB.get(model, UNKNOWN_MODEL_MEMORY_MB)
+
+
+def describe_exit(exit_code: int) -> str:
+    """'exit 1' or 'killed by SIGBUS' for a subprocess return code."""
+    if exit_code < 0:
+        try:
+            return f"killed by {signal.Signals(-exit_code).name}"
+        except ValueError:
+            return f"killed by signal {-exit_code}"
+    return f"exit {exit_code}"
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """Whether a process with this pid exists."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class JobQueue:
+    """
+    Persistent job table in a SQLite database.
+
+    Jobs are plain dicts (one per row) with params, args and depends_on
+    decoded from JSON.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for field in ('params', 'args', 'depends_on'):
+            job[field] = json.loads(job[field])
+        return job
+
+    # ------------------------------------------------------------------
+    # Enqueue and query
+    # ------------------------------------------------------------------
+
+    def add(
+        self,
+        script: str,
+        model: Optional[str] = None,
+        stimuli: Optional[str] = None,
+        output: Optional[str] = None,
+        params: Optional[Dict] = None,
+        args: Sequence[str] = (),
+        depends_on: Sequence[int] = (),
+        memory_mb: Optional[int] = None,
+        max_attempts: int = 3,
+        name: Optional[str] = None,
+    ) -> int:
+        """
+        Enqueue a job.
+
+        Args:
+            script: Python script to run
+            model / stimuli / output: Passed as --model / --stimuli / --output
+            params: Extra flags, {'top-k': 1000, 'full-context': True}
+            args: Positional arguments (before the flags)
+            depends_on: Job ids that must finish successfully first
+            memory_mb: Memory reserved while running (default: estimate from model)
+            max_attempts: Runs before the job is marked failed
+            name: Display name (default: script stem and model slug)
+
+        Returns:
+            The new job id
+        """
+        for dep in depends_on:
+            if self.get(dep) is None:
+                raise ValueError(f"Unknown dependency job id: {dep}")
+
+        if name is None:
+            name = os.path.splitext(os.path.basename(script))[0]
+            if model:
+                name += f'_{model_slug(model)}'
+        if memory_mb is None:
+            memory_mb = estimate_memory_mb(model)
+
+        cursor = self.conn.execute(
+            'INSERT INTO jobs (name, script, model, stimuli, output, params, args, depends_on, '
+            'memory_mb, max_attempts, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, script, model, stimuli, output, json.dumps(params or {}), json.dumps(list(args)),
+             json.dumps(list(depends_on)), memory_mb, max_attempts, time.time()),
+        )
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def jobs(self, status: Optional[str] = None) -> List[Dict]:
+        """All jobs (optionally with one status), by id."""
+        if status is None:
+            rows = self.conn.execute('SELECT * FROM jobs ORDER BY id')
+        else:
+            rows = self.conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id', (status,))
+        return [self._decode(row) for row in rows]
+
+    def find_active(self, script: str, output: Optional[str], args: Sequence[str] = ()) -> Optional[int]:
+        """Id of a pending, running or done job with the same script, output and args."""
+        row = self.conn.execute(
+            'SELECT id FROM jobs WHERE script = ? AND output IS ? AND args = ? AND status IN (?, ?, ?) '
+            'ORDER BY id DESC LIMIT 1',
+            (script, output, json.dumps(list(args)), PENDING, RUNNING, DONE),
+        ).fetchone()
+        return row['id'] if row else None
+
+    def ready_jobs(self) -> List[Dict]:
+        """Pending jobs whose dependencies are done and whose retry delay has passed."""
+        status = {row['id']: row['status'] for row in self.conn.execute('SELECT id, status FROM jobs')}
+        now = time.time()
+        return [
+            job for job in self.jobs(PENDING)
+            if job['retry_after'] <= now and all(status.get(dep) == DONE for dep in job['depends_on'])
+        ]
+
+    # ------------------------------------------------------------------
+    # State transitions
+    # ------------------------------------------------------------------
+
+    def mark_running(self, job_id: int, pid: int, log_path: str):
+        self.conn.execute(
+            'UPDATE jobs SET status = ?, pid = ?, log_path = ?, started = ?, finished = NULL, '
+            'attempts = attempts + 1 WHERE id = ?',
+            (RUNNING, pid, log_path, time.time(), job_id),
+        )
+
+    def mark_finished(self, job_id: int, exit_code: int) -> str:
+        """
+        Record a finished run; failed runs go back to pending while attempts remain.
+
+        Returns:
+            The job's new status
+        """
+        job = self.get(job_id)
+        now = time.time()
+
+        if exit_code == 0:
+            status, error, retry_after = DONE, None, 0.0
+        elif job['attempts'] < job['max_attempts']:
+            status, error = PENDING, describe_exit(exit_code)
+            retry_after = now + RETRY_BACKOFF * job['attempts']
+        else:
+            status, error, retry_after = FAILED, describe_exit(exit_code), 0.0
+
+        self.conn.execute(
+            'UPDATE jobs SET status = ?, exit_code = ?, error = ?, retry_after = ?, finished = ?, '
+            'pid = NULL WHERE id = ?',
+            (status, exit_code, error, retry_after, now, job_id),
+        )
+        if status == FAILED:
+            self.skip_dependents(job_id)
+        return status
+
+    def release(self, job_id: int):
+        """Put an interrupted job back without counting the attempt."""
+        self.conn.execute(
+            'UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), pid = NULL, started = NULL '
+            'WHERE id = ?',
+            (PENDING, job_id),
+        )
+
+    def skip_dependents(self, job_id: int):
+        """Mark every pending job that (transitively) depends on job_id as skipped."""
+        for job in self.jobs(PENDING):
+            if job_id in job['depends_on']:
+                self.conn.execute(
+                    'UPDATE jobs SET status = ?, error = ? WHERE id = ?',
+                    (SKIPPED, f'dependency {job_id} failed', job['id']),
+                )
+                self.skip_dependents(job['id'])
+
+    def retry(self, job_id: int):
+        """Re-queue a failed or skipped job (and the jobs it skipped) with fresh attempts."""
+        job = self.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job id: {job_id}")
+        if job['status'] in (RUNNING, PENDING):
+            raise ValueError(f"Job {job_id} is already {job['status']}")
+
+        self.conn.execute(
+            'UPDATE jobs SET status = ?, attempts = 0, retry_after = 0, error = NULL, exit_code = NULL '
+            'WHERE id = ?',
+            (PENDING, job_id),
+        )
+        for dependent in self.jobs(SKIPPED):
+            if job_id in dependent['depends_on']:
+                self.retry(dependent['id'])
+
+    def recover_stale(self) -> List[int]:
+        """Re-queue 'running' jobs whose process is gone (the scheduler was killed)."""
+        stale = [job['id'] for job in self.jobs(RUNNING) if not pid_alive(job['pid'])]
+        for job_id in stale:
+            self.release(job_id)
+        return stale
+
+    # ------------------------------------------------------------------
+    # Scheduler bookkeeping
+    # ------------------------------------------------------------------
+
+    def set_scheduler_info(self, **info):
+        for key, value in info.items():
+            self.conn.execute('INSERT OR REPLACE INTO scheduler (key, value) VALUES (?, ?)',
+                              (key, json.dumps(value)))
+
+    def scheduler_info(self) -> Dict:
+        return {row['key']: json.loads(row['value'])
+                for row in self.conn.execute('SELECT key, value FROM scheduler')}
+
+    # ------------------------------------------------------------------
+    # Progress
+    # ------------------------------------------------------------------
+
+    def stats(self, concurrency: Optional[int] = None) -> Dict:
+        """
+        Queue depth, throughput and ETA.
+
+        Throughput is finished jobs per hour since the first job started. The
+        ETA is the remaining work (mean duration of finished jobs of the same
+        script, else of all finished jobs) divided by the concurrency of the
+        last scheduler run.
+        """
+        jobs = self.jobs()
+        now = time.time()
+        counts = {state: sum(job['status'] == state for job in jobs) for state in STATES}
+
+        finished = [job for job in jobs if job['status'] == DONE and job['started'] and job['finished']]
+        durations: Dict[str, List[float]] = {}
+        for job in finished:
+            durations.setdefault(job['script'], []).append(job['finished'] - job['started'])
+        all_durations = [d for ds in durations.values() for d in ds]
+        overall_mean = sum(all_durations) / len(all_durations) if all_durations else None
+
+        throughput = None
+        starts = [job['started'] for job in jobs if job['started']]
+        if finished and starts:
+            elapsed_hours = (max(job['finished'] for job in finished) - min(starts)) / 3600
+            if elapsed_hours > 0:
+                throughput = len(finished) / elapsed_hours
+
+        eta = None
+        if overall_mean is not None:
+            remaining = 0.0
+            for job in jobs:
+                if job['status'] not in (PENDING, RUNNING):
+                    continue
+                ds = durations.get(job['script'])
+                expected = sum(ds) / len(ds) if ds else overall_mean
+                if job['status'] == RUNNING and job['started']:
+                    expected = max(0.0, expected - (now - job['started']))
+                remaining += expected
+            if concurrency is None:
+                concurrency = self.scheduler_info().get('concurrency', 1)
+            eta = remaining / max(1, concurrency)
+
+        return {
+            'counts': counts,
+            'queue_depth': counts[PENDING] + counts[RUNNING],
+            'throughput_per_hour': throughput,
+            'mean_duration_s': overall_mean,
+            'eta_s': eta,
+        }
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+def build_command(job: Dict, resume: bool = False) -> List[str]:
+    """Command line for a job: python script [args] [--model ...] [--flag value ...]."""
+    cmd = [sys.executable, job['script']] + [str(arg) for arg in job['args']]
+    for flag, value in (('model', job['model']), ('stimuli', job['stimuli']), ('output', job['output'])):
+        if value:
+            cmd += [f'--{flag}', value]
+
+    for flag, value in job['params'].items():
+        if value is True:
+            cmd.append(f'--{flag}')
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            cmd += [f'--{flag}'] + [str(v) for v in value]
+        else:
+            cmd += [f'--{flag}', str(value)]
+
+    if resume and os.path.basename(job['script']) in RESUMABLE_SCRIPTS:
+        cmd.append('--resume')
+    return cmd
+
+
+def log(message: str):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def run_scheduler(
+    queue: JobQueue,
+    concurrency: int = 1,
+    memory_mb: int = 0,
+    log_dir: str = DEFAULT_LOG_DIR,
+    poll_interval: float = 2.0,
+) -> List[Dict]:
+    """
+    Run jobs until nothing is pending or running.
+
+    Args:
+        queue: Job queue
+        concurrency: Maximum simultaneous jobs
+        memory_mb: Memory budget over running jobs' estimates (0 = unlimited).
+            A job larger than the whole budget still runs, alone.
+        log_dir: Directory for per-job logs
+        poll_interval: Seconds between checks of running jobs
+
+    Returns:
+        Jobs left failed, skipped or stuck pending (empty if the queue is drained)
+    """
+    os.makedirs(log_dir, exist_ok=True)
+
+    for job_id in queue.recover_stale():
+        log(f"Re-queued job {job_id} (its previous scheduler died)")
+    queue.set_scheduler_info(concurrency=concurrency, memory_mb=memory_mb,
+                             pid=os.getpid(), started=time.time())
+
+    running: Dict[int, subprocess.Popen] = {}
+    reserved: Dict[int, int] = {}
+
+    try:
+        while True:
+            # Reap finished jobs
+            for job_id, process in list(running.items()):
+                exit_code = process.poll()
+                if exit_code is None:
+                    continue
+                del running[job_id]
+                del reserved[job_id]
+                status = queue.mark_finished(job_id, exit_code)
+                job = queue.get(job_id)
+                if status == DONE:
+                    log(f"✓ Job {job_id} {job['name']} done "
+                        f"({(job['finished'] - job['started']) / 60:.1f} min)")
+                elif status == PENDING:
+                    log(f"⚠ Job {job_id} {job['name']} {describe_exit(exit_code)}; "
+                        f"retry {job['attempts'] + 1}/{job['max_attempts']} "
+                        f"in {job['retry_after'] - time.time():.0f}s")
+                else:
+                    log(f"✗ Job {job_id} {job['name']} failed ({describe_exit(exit_code)}); "
+                        f"see {job['log_path']}")
+
+            # Start ready jobs within the concurrency and memory budget
+            ready = queue.ready_jobs()
+            for job in ready:
+                if len(running) >= concurrency:
+                    break
+                used = sum(reserved.values())
+                if memory_mb and running and used + job['memory_mb'] > memory_mb:
+                    continue
+
+                log_path = os.path.join(log_dir, f"{job['id']}_{job['name']}.log")
+                cmd = build_command(job, resume=job['attempts'] > 0)
+                with open(log_path, 'a') as log_file:
+                    log_file.write(f"\n=== attempt {job['attempts'] + 1} "
+                                   f"{datetime.now().isoformat()}: {' '.join(cmd)}\n")
+                    log_file.flush()
+                    process = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+
+                queue.mark_running(job['id'], process.pid, log_path)
+                running[job['id']] = process
+                reserved[job['id']] = job['memory_mb']
+                log(f"▶ Job {job['id']} {job['name']} started "
+                    f"(attempt {job['attempts'] + 1}, {job['memory_mb']} MB)")
+
+            if not running:
+                pending = queue.jobs(PENDING)
+                if not pending:
+                    break
+                backing_off = any(job['retry_after'] > time.time() for job in pending)
+                if not ready and not backing_off:
+                    log("Remaining jobs wait on dependencies that cannot finish")
+                    break
+
+            time.sleep(poll_interval)
+
+    except KeyboardInterrupt:
+        log(f"Interrupted; stopping {len(running)} running job(s)")
+        for job_id, process in running.items():
+            process.terminate()
+        for job_id, process in running.items():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            queue.release(job_id)
+        raise
+
+    print_status(queue)
+    return queue.jobs(FAILED) + queue.jobs(SKIPPED) + queue.jobs(PENDING)
+
+
+# ============================================================================
+# PIPELINES
+# ============================================================================
+
+def enqueue_sweep(
+    queue: JobQueue,
+    pipeline: str,
+    models: Sequence[str],
+    stimuli: Optional[str] = None,
+    top_k: int = 1000,
+    max_attempts: int = 3,
+    force: bool = False,
+    extra_params: Optional[Dict] = None,
+) -> List[int]:
+    """
+    Enqueue audit → analysis jobs for every model (plus one figures job for 'locked').
+
+    Models whose audit output already exists are not re-run (unless force),
+    but their analysis is still queued. Jobs already in the queue (pending,
+    running or done) are reused, so re-running a sweep command only adds
+    what is missing.
+
+    Returns:
+        Ids of the enqueued jobs
+    """
+    ids = []
+    audit_outputs = []
+    audit_ids = []
+
+    for model in models:
+        slug = model_slug(model)
+        if pipeline == 'comprehensive':
+            script, output = 'run_comprehensive_audit.py', f'comprehensive_audit_{slug}.json'
+            params = {'method': 'lexicon', 'top-k': top_k}
+            analysis = ('analyze_comprehensive_results.py', {})
+            stimuli_file = stimuli or 'stimuli_comprehensive.json'
+        elif pipeline == 'locked':
+            script, output = 'run_locked_audit.py', f'locked_audit_{slug}.json'
+            params = {'context-lengths': '1,2,4,8,-1', 'top-k': top_k}
+            analysis = ('analyze_locked_results.py', {'output-prefix': f'locked_audit_{slug}'})
+            stimuli_file = stimuli or 'stimuli_locked.json'
+        else:
+            raise ValueError(f"Unknown pipeline: {pipeline}")
+        params.update(extra_params or {})
+
+        depends_on = []
+        audit_id = queue.find_active(script, output)
+        if audit_id is None and (force or not os.path.exists(output)):
+            audit_id = queue.add(script, model=model, stimuli=stimuli_file, output=output,
+                                 params=params, max_attempts=max_attempts)
+            ids.append(audit_id)
+        elif audit_id is None:
+            print(f"  {output} exists; queuing analysis only (use --force to re-run)")
+        if audit_id is not None:
+            depends_on = [audit_id]
+            audit_ids.append(audit_id)
+
+        analysis_script, analysis_params = analysis
+        if queue.find_active(analysis_script, None, [output]) is None:
+            ids.append(queue.add(analysis_script, args=[output], params=analysis_params,
+                                 depends_on=depends_on, max_attempts=max_attempts,
+                                 name=f'{os.path.splitext(analysis_script)[0]}_{slug}'))
+        audit_outputs.append(output)
+
+    if pipeline == 'locked' and queue.find_active('generate_locked_figures.py', None, audit_outputs) is None:
+        ids.append(queue.add('generate_locked_figures.py', args=audit_outputs,
+                             params={'models': list(models), 'output-dir': 'figures'},
+                             depends_on=audit_ids, max_attempts=max_attempts,
+                             name='generate_locked_figures'))
+    return ids
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return 'n/a'
+    if seconds < 60:
+        return f'{seconds:.0f}s'
+    if seconds < 3600:
+        return f'{seconds / 60:.1f} min'
+    return f'{seconds / 3600:.1f} h'
+
+
+def print_status(queue: JobQueue, concurrency: Optional[int] = None, show_jobs: bool = True):
+    """Print the job table and queue summary."""
+    now = time.time()
+    if show_jobs:
+        print(f"{'ID':>4}  {'Status':<8} {'Try':>5}  {'Name':<44} {'Time':>9}  Note")
+        print("-" * 90)
+        for job in queue.jobs():
+            if job['started'] and job['status'] == RUNNING:
+                elapsed = now - job['started']
+            elif job['started'] and job['finished']:
+                elapsed = job['finished'] - job['started']
+            else:
+                elapsed = None
+            note = job['error'] or ''
+            if job['status'] == PENDING and job['retry_after'] > now:
+                note += f" (retry in {job['retry_after'] - now:.0f}s)"
+            tries = f"{job['attempts']}/{job['max_attempts']}"
+            print(f"{job['id']:>4}  {job['status']:<8} {tries:>5}  {job['name'][:44]:<44} "
+                  f"{format_duration(elapsed) if elapsed is not None else '':>9}  {note}")
+        print()
+
+    stats = queue.stats(concurrency)
+    counts = stats['counts']
+    print("Queue:")
+    print(f"  Depth:       {stats['queue_depth']} ({counts[PENDING]} pending, {counts[RUNNING]} running)")
+    print(f"  Finished:    {counts[DONE]} done, {counts[FAILED]} failed, {counts[SKIPPED]} skipped")
+    if stats['throughput_per_hour'] is not None:
+        print(f"  Throughput:  {stats['throughput_per_hour']:.1f} jobs/hour "
+              f"(mean {format_duration(stats['mean_duration_s'])} per job)")
+    if stats['eta_s'] is not None and stats['queue_depth']:
+        print(f"  ETA:         {format_duration(stats['eta_s'])}")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def parse_params(items: Optional[List[str]]) -> Dict:
+    """--param key=value (value parsed as JSON when possible; bare key = flag)."""
+    params = {}
+    for item in items or []:
+        key, sep, value = item.partition('=')
+        if not sep:
+            params[key] = True
+            continue
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='SQLite-backed job queue for multi-model audit sweeps'
+    )
+    parser.add_argument('--db', type=str, default=DEFAULT_DB,
+                        help=f'Queue database (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('add', help='Enqueue one job')
+    p.add_argument('script', type=str, help='Python script to run')
+    p.add_argument('args', nargs='*', help='Positional arguments for the script')
+    p.add_argument('--model', type=str, default=None)
+    p.add_argument('--stimuli', type=str, default=None)
+    p.add_argument('--output', type=str, default=None)
+    p.add_argument('--param', action='append', default=None,
+                   help='Extra flag as key=value or bare key (repeatable)')
+    p.add_argument('--after', type=int, action='append', default=[],
+                   help='Job id this job depends on (repeatable)')
+    p.add_argument('--memory-mb', type=int, default=None,
+                   help='Memory reserved while running (default: estimate from model)')
+    p.add_argument('--max-attempts', type=int, default=3,
+                   help='Runs before the job is marked failed (default: 3)')
+    p.add_argument('--name', type=str, default=None)
+
+    p = sub.add_parser('sweep', help='Enqueue audit → analysis jobs for several models')
+    p.add_argument('--pipeline', choices=['comprehensive', 'locked'], default='comprehensive',
+                   help='Which audit to run (default: comprehensive)')
+    p.add_argument('--model', action='append', default=None,
+                   help='Model (repeatable, default: the five replication models)')
+    p.add_argument('--stimuli', type=str, default=None,
+                   help='Stimuli file (default: the pipeline\'s standard file)')
+    p.add_argument('--top-k', type=int, default=1000)
+    p.add_argument('--param', action='append', default=None,
+                   help='Extra audit flag as key=value or bare key (repeatable)')
+    p.add_argument('--max-attempts', type=int, default=3)
+    p.add_argument('--force', action='store_true',
+                   help='Re-run audits whose output file already exists')
+
+    p = sub.add_parser('run', help='Run queued jobs until the queue is drained')
+    p.add_argument('--concurrency', type=int, default=1,
+                   help='Maximum simultaneous jobs (default: 1)')
+    p.add_argument('--memory-mb', type=int, default=0,
+                   help='Memory budget over running jobs\' estimates, 0 = unlimited (default: 0)')
+    p.add_argument('--log-dir', type=str, default=DEFAULT_LOG_DIR)
+    p.add_argument('--poll-interval', type=float, default=2.0)
+
+    p = sub.add_parser('status', help='Show jobs, queue depth, throughput and ETA')
+    p.add_argument('--summary', action='store_true', help='Only the queue summary')
+    p.add_argument('--concurrency', type=int, default=None,
+                   help='Concurrency for the ETA (default: that of the last run)')
+
+    p = sub.add_parser('retry', help='Re-queue failed or skipped jobs')
+    p.add_argument('job_ids', type=int, nargs='+')
+
+    args = parser.parse_args()
+    queue = JobQueue(args.db)
+    exit_code = 0
+
+    if args.command == 'add':
+        job_id = queue.add(args.script, model=args.model, stimuli=args.stimuli, output=args.output,
+                           params=parse_params(args.param), args=args.args, depends_on=args.after,
+                           memory_mb=args.memory_mb, max_attempts=args.max_attempts, name=args.name)
+        print(f"Enqueued job {job_id}: {' '.join(build_command(queue.get(job_id))[1:])}")
+
+    elif args.command == 'sweep':
+        ids = enqueue_sweep(queue, args.pipeline, args.model or DEFAULT_SWEEP_MODELS,
+                            stimuli=args.stimuli, top_k=args.top_k, max_attempts=args.max_attempts,
+                            force=args.force, extra_params=parse_params(args.param))
+        print(f"Enqueued {len(ids)} jobs ({ids[0]}–{ids[-1]})" if ids else "Nothing to enqueue")
+
+    elif args.command == 'run':
+        unfinished = run_scheduler(queue, concurrency=args.concurrency, memory_mb=args.memory_mb,
+                                   log_dir=args.log_dir, poll_interval=args.poll_interval)
+        if unfinished:
+            print(f"\n✗ {len(unfinished)} job(s) did not finish:")
+            for job in unfinished:
+                print(f"  {job['id']} {job['name']} ({job['status']}"
+                      f"{': ' + job['error'] if job['error'] else ''})")
+            exit_code = 1
+
+    elif args.command == 'status':
+        print_status(queue, concurrency=args.concurrency, show_jobs=not args.summary)
+
+    elif args.command == 'retry':
+        for job_id in args.job_ids:
+            queue.retry(job_id)
+            print(f"Re-queued job {job_id}")
+
+    queue.close()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
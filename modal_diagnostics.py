@@ -18,15 +18,21 @@ Usage:
 
 import json
 import random
+import argparse
 import numpy as np
 import pandas as pd
-import torch
-import matplotlib.pyplot as plt
-from scipy import stats
 from datetime import datetime
-from transformers import AutoModelForCausalLM, AutoTokenizer
 from tqdm import tqdm
 import os
+
+from batched_inference import next_token_logits
+from class_membership import ClassMembership
+from prefix_cache import PrefixKVCache
+from distribution_cache import make_dist_cache
+from scoring_server import connect_remote_model
+from precision import DTYPES, load_scoring_model, print_precision_report
+from stimulus_bundle import load_stimulus_bundle
+from vocab_annotations import load_vocab_annotations
 # Disable progress bars if running non-interactively
 DISABLE_TQDM = os.environ.get('DISABLE_TQDM', 'false').lower() == 'true'
 
@@ -115,13 +121,10 @@ def find_cue_position(condition_text, cue_word, expected_occurrence=1):
 
 
 def is_word_start_token(tokenizer, token_id):
-    """Check if token is word-start (space-prefixed)."""
-    token_str = tokenizer.decode([token_id])
-    if token_str in ['<|endoftext|>', '<unk>', '<pad>', '']:
-        return False, None
-    if token_str.startswith(' ') or token_str.startswith('\n'):
-        word = token_str.strip().lower().strip('.,!?;:"\'-')
-        return True, word
+    """Check if token is word-start (space-prefixed), via the cached vocab annotations."""
+    annotations = load_vocab_annotations(tokenizer)
+    if annotations.word_start(token_id):
+        return True, annotations.word(token_id)
     return False, None
 
 def contains_negation(token_str):
@@ -163,36 +166,46 @@ def get_context_at_cue(text, cue_position):
     words = text.split()
     return ' '.join(words[:cue_position + 1])
 
-def compute_mass_decomposition(probs, tokenizer, top_k=1000):
-    """Compute probability mass in each bucket."""
-    top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
+MASS_BUCKETS = ['VERB', 'BEHAVE', 'NEG', 'ADV', 'OTHER']
 
-    mass = {
-        'VERB': 0.0,
-        'BEHAVE': 0.0,
-        'NEG': 0.0,
-        'ADV': 0.0,
-        'OTHER': 0.0,
-    }
+# Bucket membership matrices, compiled once per tokenizer
+_BUCKET_MEMBERSHIP = {}
 
-    for prob, token_id in zip(top_k_probs, top_k_ids):
-        is_start, word = is_word_start_token(tokenizer, token_id.item())
-        if not is_start:
-            continue
+def get_bucket_membership(tokenizer):
+    """Vocabulary × bucket membership matrix (word-start tokens via classify_token)."""
+    key = id(tokenizer)
+    if key not in _BUCKET_MEMBERSHIP:
+        _BUCKET_MEMBERSHIP[key] = ClassMembership.from_classifier(tokenizer, MASS_BUCKETS, classify_token)
+    return _BUCKET_MEMBERSHIP[key]
 
-        token_str = tokenizer.decode([token_id.item()])
-        bucket = classify_token(word, token_str)
-        mass[bucket] += prob.item()
+def compute_mass_decomposition(probs, tokenizer, top_k=1000):
+    """Compute probability mass in each bucket (top_k=0 or None: full vocabulary)."""
+    return get_bucket_membership(tokenizer).class_mass_dict(probs, top_k=top_k)
 
-    return mass
+def get_next_token_probs(model, tokenizer, context, device, prefix_cache=None, dist_cache=None,
+                         token_ids=None):
+    """
+    Next-token distribution after context (CPU tensor), optionally via the prefix KV / distribution caches.
+
+    token_ids (e.g. from a stimulus bundle) skips tokenizing the context.
+    """
+    import torch
+
+    if token_ids is None:
+        token_ids = tokenizer(context)['input_ids']
+    logits = next_token_logits(model, token_ids, prefix_cache=prefix_cache, dist_cache=dist_cache)
+    return torch.softmax(logits, dim=-1).cpu()
 
 def get_top_predictions(probs, tokenizer, top_k=30):
     """Get top-k predictions with classification."""
+    import torch
+
     top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
+    annotations = load_vocab_annotations(tokenizer)
 
     predictions = []
     for prob, token_id in zip(top_k_probs, top_k_ids):
-        token_str = tokenizer.decode([token_id.item()])
+        token_str = annotations.token_str(token_id.item())
         is_start, word = is_word_start_token(tokenizer, token_id.item())
 
         if is_start:
@@ -216,8 +229,21 @@ def get_top_predictions(probs, tokenizer, top_k=30):
 # MAIN ANALYSIS
 # ============================================================================
 
-def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json', output_dir='.'):
-    """Run complete modal diagnostics."""
+def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json', output_dir='.',
+                          kv_cache_mb=0, dist_cache_mb=0, dist_cache_topk=0, server=None,
+                          dtype='fp32'):
+    """
+    Run complete modal diagnostics.
+
+    kv_cache_mb > 0 enables prefix KV-cache reuse; dist_cache_mb > 0 enables
+    the on-disk next-token distribution cache. server (a scoring_server URL)
+    scores through the warm-model daemon instead of loading the model. dtype
+    ('fp32', 'bf16', 'int8-dynamic') sets the inference precision; metrics
+    are always computed in fp32.
+    """
+    import torch
+    import matplotlib.pyplot as plt
+    from scipy.stats import ttest_rel
 
     print("=" * 70)
     print("MODAL CUE FAMILY DIAGNOSTICS")
@@ -228,13 +254,23 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
     print()
 
     # Load model
+    from transformers import AutoTokenizer
+
     print("Loading model...")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.eval()
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model = model.to(device)
-    print(f"Device: {device}")
+    if server:
+        if kv_cache_mb > 0 or dist_cache_mb > 0 or dtype != 'fp32':
+            raise ValueError("--server cannot be combined with --kv-cache-mb, --dist-cache-mb or --dtype")
+        model, device = connect_remote_model(server, model_name), 'cpu'
+    else:
+        device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+        model = load_scoring_model(model_name, dtype, device)
+        print(f"Device: {device}")
+        print(f"Precision: {dtype}")
+    prefix_cache = PrefixKVCache(max_bytes=kv_cache_mb * 1024 ** 2) if kv_cache_mb > 0 else None
+    if prefix_cache is not None:
+        print(f"KV-cache budget: {kv_cache_mb} MB")
+    dist_cache = make_dist_cache(model, model_name, dist_cache_mb, dist_cache_topk)
     print()
 
     # Load stimuli
@@ -245,8 +281,22 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
     # Filter to modals only
     modal_stimuli = [s for s in all_stimuli if s['cue_family'] == 'modals']
     print(f"Modal stimuli: {len(modal_stimuli)}")
+
+    # Cue positions and context token ids, compiled once per stimulus file and tokenizer
+    bundle = load_stimulus_bundle(stimuli_file, tokenizer, all_stimuli)
+    stim_index = {id(stim): i for i, stim in enumerate(all_stimuli)}
+    if not bundle.exact:
+        print("Stimulus bundle is inexact for this tokenizer; contexts are tokenized directly")
     print()
 
+    def locate_cue(stim, cond, cue_word):
+        """Dynamic cue location (find_cue_position rule), precompiled in the bundle."""
+        return bundle.find_cue(stim_index[id(stim)], cond, cue_word)
+
+    def cue_context_token_ids(stim, cond, cue_pos):
+        """Token ids of the context up to and including the cue (None: tokenize it)."""
+        return bundle.context_token_ids(stim_index[id(stim)], cond, 0, cue_pos) if bundle.exact else None
+
     # =========================================================================
     # STEP 0: Cue alignment check with DYNAMIC cue location
     # =========================================================================
@@ -289,7 +339,7 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
         # Dynamically locate cue in each condition
         for cond in conditions:
             text = stim[cond]
-            cue_pos, status, message = find_cue_position(text, cue_word)
+            cue_pos, status, message = locate_cue(stim, cond, cue_word)
 
             cue_location_stats[cond][status] += 1
             if cue_pos is not None:
@@ -378,7 +428,7 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
             text = stim[cond]
 
             # Dynamically locate cue
-            cue_pos, status, message = find_cue_position(text, cue_word)
+            cue_pos, status, message = locate_cue(stim, cond, cue_word)
 
             diagnostics_md.append(f"### {cond.upper()}")
 
@@ -395,11 +445,8 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
             diagnostics_md.append("")
 
             # Get predictions
-            inputs = tokenizer(context, return_tensors='pt').to(device)
-            with torch.no_grad():
-                outputs = model(**inputs)
-            logits = outputs.logits[0, -1, :]
-            probs = torch.softmax(logits, dim=-1).cpu()
+            probs = get_next_token_probs(model, tokenizer, context, device, prefix_cache, dist_cache,
+                                         token_ids=cue_context_token_ids(stim, cond, cue_pos))
 
             top_preds = get_top_predictions(probs, tokenizer, top_k=30)
 
@@ -436,7 +483,7 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
             text = stim[cond]
 
             # Dynamically locate cue
-            cue_pos, status, message = find_cue_position(text, cue_word)
+            cue_pos, status, message = locate_cue(stim, cond, cue_word)
 
             if cue_pos is None:
                 skipped_counts[cond] += 1
@@ -445,11 +492,8 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
             context = get_context_at_cue(text, cue_pos)
 
             # Get predictions
-            inputs = tokenizer(context, return_tensors='pt').to(device)
-            with torch.no_grad():
-                outputs = model(**inputs)
-            logits = outputs.logits[0, -1, :]
-            probs = torch.softmax(logits, dim=-1).cpu()
+            probs = get_next_token_probs(model, tokenizer, context, device, prefix_cache, dist_cache,
+                                         token_ids=cue_context_token_ids(stim, cond, cue_pos))
 
             # Compute mass decomposition
             mass = compute_mass_decomposition(probs, tokenizer, top_k=1000)
@@ -505,6 +549,17 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
 
     print()
 
+    # All model calls are done at this point
+    if prefix_cache is not None:
+        prefix_cache.print_report()
+        print()
+    if dist_cache is not None:
+        dist_cache.print_report()
+        print()
+    if not server:
+        print_precision_report(model)
+        print()
+
     # =========================================================================
     # STEP 3: Alternate target definitions summary
     # =========================================================================
@@ -549,7 +604,7 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
 
             x, y = df_a.loc[common].values, df_b.loc[common].values
             diff = np.mean(x) - np.mean(y)
-            t_stat, p_val = stats.ttest_rel(x, y)
+            t_stat, p_val = ttest_rel(x, y)
             d = np.mean(x - y) / np.std(x - y, ddof=1) if np.std(x - y, ddof=1) > 0 else 0
 
             contrasts_results.append({
@@ -686,12 +741,27 @@ def run_modal_diagnostics(model_name='gpt2', stimuli_file='stimuli_locked.json',
     print()
 
 
-if __name__ == '__main__':
-    import argparse
+def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--model', type=str, default='gpt2')
     parser.add_argument('--stimuli', type=str, default='stimuli_locked.json')
     parser.add_argument('--output-dir', type=str, default='.')
+    parser.add_argument('--kv-cache-mb', type=int, default=0,
+                        help='Prefix KV-cache budget in MB (default: 0 = off)')
+    parser.add_argument('--dist-cache-mb', type=int, default=0,
+                        help='On-disk distribution cache budget in MB (default: 0 = off)')
+    parser.add_argument('--dist-cache-topk', type=int, default=0,
+                        help='Top-k tokens stored per cached distribution (default: 0 = full vector)')
+    parser.add_argument('--server', type=str, default=None,
+                        help='Score through a running scoring_server at this URL (default: load locally)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                        help='Inference precision; softmax and class mass stay fp32 (default: fp32)')
     args = parser.parse_args()
 
-    run_modal_diagnostics(args.model, args.stimuli, args.output_dir)
+    run_modal_diagnostics(args.model, args.stimuli, args.output_dir, kv_cache_mb=args.kv_cache_mb,
+                          dist_cache_mb=args.dist_cache_mb, dist_cache_topk=args.dist_cache_topk,
+                          server=args.server, dtype=args.dtype)
+
+
+if __name__ == '__main__':
+    main()
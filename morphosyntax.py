@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Morphosyntax Audit Command-Line Interface
+
+One entry point for the pipeline scripts. Each subcommand runs an existing
+script's main() with the remaining arguments, so every script keeps its own
+options and --help.
+
+Startup:
+- This module imports only the standard library; the script behind a
+  command is imported once the command is known
+- The scripts and the modules they import load torch, transformers/spaCy,
+  scipy.stats and matplotlib inside the functions that use them, so --help
+  and analysis-only commands never pay for them
+- `startup` times `<command> --help` in a fresh interpreter for every
+  command and reports it against a budget
+
+Commands (--design picks the variant; the first one listed is the default):
+    generate  --design locked|comprehensive         Stimulus generation
+    audit     --design locked|comprehensive         Class-mass audit
+    ablate                                          Context-length ablation
+    analyze   --design locked|comprehensive|ablation
+    figures                                         Locked-design figures
+    diagnose  --design modal|pos                    Modal / POS diagnostics
+    jobs | serve | cache | store | vocab | bundle   Queue, scoring server, caches
+    table                                           Columnar copy of locked audit results
+    precision | pack                                Precision / packing benchmarks
+    autotune                                        Per-host, per-model scoring settings
+    permute                                         Permutation-test runtime scaling
+    scaling                                         Item x model bootstrap of scaling slopes
+    power                                           Simulated power by sentences per family
+    startup                                         Cold-start timings
+
+Usage:
+    python morphosyntax.py audit --model gpt2 --workers 2
+    python morphosyntax.py analyze locked_audit_gpt2.json
+    python morphosyntax.py analyze --design ablation context_ablation_gpt2.csv
+    python morphosyntax.py diagnose --design pos --model gpt2
+    python morphosyntax.py startup --budget 1.0
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# command -> {design: (module, description)}; the first design is the default
+COMMANDS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    'generate': {
+        'locked': ('generate_locked_stimuli', 'Generate locked-design stimuli'),
+        'comprehensive': ('generate_comprehensive_stimuli', 'Generate comprehensive stimuli'),
+    },
+    'audit': {
+        'locked': ('run_locked_audit', 'Locked-design audit with context ablation'),
+        'comprehensive': ('run_comprehensive_audit', 'Comprehensive 6-condition audit'),
+    },
+    'ablate': {
+        'comprehensive': ('run_context_ablation', 'Context-length ablation'),
+    },
+    'analyze': {
+        'locked': ('analyze_locked_results', 'Statistics for a locked audit'),
+        'comprehensive': ('analyze_comprehensive_results', 'Statistics for a comprehensive audit'),
+        'ablation': ('analyze_context_ablation', 'Tables and plots for an ablation CSV'),
+    },
+    'figures': {
+        'locked': ('generate_locked_figures', 'Publication figures for locked audits'),
+    },
+    'diagnose': {
+        'modal': ('modal_diagnostics', 'Modal cue family diagnostics'),
+        'pos': ('pos_audit', 'POS category audit (needs spaCy)'),
+    },
+    'jobs': {'queue': ('job_queue', 'Job queue for multi-model sweeps')},
+    'serve': {'server': ('scoring_server', 'Warm-model scoring server')},
+    'cache': {'distributions': ('distribution_cache', 'On-disk distribution cache')},
+    'store': {'distributions': ('distribution_store', 'Per-context distribution store')},
+    'vocab': {'annotations': ('vocab_annotations', 'Vocabulary annotation cache')},
+    'bundle': {'stimuli': ('stimulus_bundle', 'Compile tokenized stimulus bundles')},
+    'table': {'results': ('results_table', 'Build and describe columnar tables of locked audit results')},
+    'precision': {'benchmark': ('precision', 'Reduced-precision throughput, memory and fp32 deviation')},
+    'pack': {'benchmark': ('sequence_packing', 'Sequence packing vs padded batching throughput')},
+    'autotune': {'tuner': ('autotune', 'Tune batch size, threads, packing and dtype per host and model')},
+    'permute': {'benchmark': ('permutation_tests', 'Exact and Monte-Carlo sign-flip test runtime scaling')},
+    'scaling': {'bootstrap': ('hierarchical_bootstrap', 'Two-level bootstrap CIs for per-model effects and scaling slopes')},
+    'power': {'simulation': ('power_analysis', 'Simulated power of the planned contrasts by sentences per family')},
+}
+
+
+# ============================================================================
+# DISPATCH
+# ============================================================================
+
+def resolve(command: str, args: Sequence[str]) -> Tuple[str, List[str]]:
+    """
+    Map a command and its arguments to the script module to run.
+
+    A `--design X` (or `--design=X`) anywhere in args selects the variant and
+    is removed; everything else is passed through to the script.
+
+    Returns:
+        (module_name, remaining_args)
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown command: {command} (choose from {', '.join(COMMANDS)})")
+    designs = COMMANDS[command]
+
+    design = None
+    rest = []
+    args = list(args)
+    i = 0
+    while i < len(args):
+        if args[i] == '--design' and i + 1 < len(args):
+            design = args[i + 1]
+            i += 2
+            continue
+        if args[i].startswith('--design='):
+            design = args[i].split('=', 1)[1]
+        else:
+            rest.append(args[i])
+        i += 1
+
+    if design is None:
+        design = next(iter(designs))
+    if design not in designs:
+        raise ValueError(f"Unknown design for {command}: {design} (choose from {', '.join(designs)})")
+    return designs[design][0], rest
+
+
+def run_command(command: str, args: Sequence[str]):
+    """Import the script behind a command and run its main() with args."""
+    module_name, rest = resolve(command, args)
+    module = importlib.import_module(module_name)
+    sys.argv = [f'morphosyntax {command}', *rest]
+    return module.main()
+
+
+# ============================================================================
+# STARTUP TIMING
+# ============================================================================
+
+def _time_subprocess(cmd: List[str], repeats: int) -> Tuple[float, int]:
+    """Best-of-n wall time of a fresh interpreter running cmd."""
+    best = float('inf')
+    returncode = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        best = min(best, time.perf_counter() - start)
+        returncode = returncode or result.returncode
+    return best, returncode
+
+
+def measure_startup(commands: Optional[Sequence[str]] = None, repeats: int = 3) -> List[Dict]:
+    """
+    Cold-start time of each command: a fresh interpreter running
+    `morphosyntax <command> --design <design> --help` (this module, the
+    script behind the command and its argument parser).
+
+    Args:
+        commands: Commands to time (default: all)
+        repeats: Runs per command; the fastest is reported
+
+    Returns:
+        One dict per (command, design), plus a bare-interpreter baseline
+    """
+    rows = []
+    seconds, _ = _time_subprocess([sys.executable, '-c', 'pass'], repeats)
+    rows.append({'command': 'python', 'design': '', 'module': '', 'seconds': seconds, 'ok': True})
+
+    for command in commands or COMMANDS:
+        for design, (module_name, _) in COMMANDS[command].items():
+            cmd = [sys.executable, os.path.abspath(__file__), command, '--design', design, '--help']
+            seconds, returncode = _time_subprocess(cmd, repeats)
+            rows.append({
+                'command': command,
+                'design': design,
+                'module': module_name,
+                'seconds': seconds,
+                'ok': returncode == 0,
+            })
+    return rows
+
+
+def print_startup_report(rows: List[Dict], budget: float):
+    """Print cold-start times, each checked against the budget."""
+    print("=" * 70)
+    print("COLD-START TIMES (fresh interpreter running <command> --help)")
+    print("=" * 70)
+    print(f"{'Command':<10} {'Design':<15} {'Module':<32} {'Seconds':>8}")
+    print("-" * 70)
+    for row in rows:
+        flag = ''
+        if not row['ok']:
+            flag = '  failed'
+        elif row['command'] != 'python':
+            flag = '  ✓' if row['seconds'] < budget else f'  ✗ over {budget:.1f}s budget'
+        print(f"{row['command']:<10} {row['design']:<15} {row['module']:<32} {row['seconds']:>8.2f}{flag}")
+    print()
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def print_usage():
+    print("usage: morphosyntax <command> [--design DESIGN] [options]")
+    print()
+    print("Commands:")
+    for command, designs in COMMANDS.items():
+        for i, (design, (module_name, description)) in enumerate(designs.items()):
+            name = command if i == 0 else ''
+            label = design if len(designs) > 1 else ''
+            print(f"  {name:<10} {label:<15} {description} ({module_name}.py)")
+    print(f"  {'startup':<10} {'':<15} Cold-start timings of every command")
+    print()
+    print("Run 'morphosyntax <command> [--design DESIGN] --help' for a command's options.")
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return
+
+    command, args = argv[0], argv[1:]
+    if command == 'startup':
+        parser = argparse.ArgumentParser(prog='morphosyntax startup',
+                                         description='Time cold starts of every command')
+        parser.add_argument('commands', nargs='*', metavar='command',
+                            help='Commands to time (default: all)')
+        parser.add_argument('--repeats', type=int, default=3,
+                            help='Runs per command, fastest reported (default: 3)')
+        parser.add_argument('--budget', type=float, default=1.0,
+                            help='Cold-start budget in seconds for every command (default: 1.0)')
+        startup_args = parser.parse_args(args)
+        unknown = [c for c in startup_args.commands if c not in COMMANDS]
+        if unknown:
+            parser.error(f"unknown command(s): {', '.join(unknown)}")
+        print_startup_report(measure_startup(startup_args.commands, startup_args.repeats),
+                             startup_args.budget)
+        return
+
+    try:
+        resolve(command, args)
+    except ValueError as e:
+        print(f"morphosyntax: {e}", file=sys.stderr)
+        sys.exit(2)
+    return run_command(command, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,10 +10,15 @@ Refinements:
 import json
 import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer
 from collections import defaultdict
 import spacy
 
+from batched_inference import next_token_logits
+from distribution_cache import make_dist_cache
+from precision import DTYPES, load_scoring_model, print_precision_report
+from vocab_annotations import load_vocab_annotations
+
 # Load spaCy for "to" disambiguation only
 print("Loading spaCy for 'to' disambiguation...")
 try:
@@ -186,7 +191,8 @@ def classify_candidate(word):
 # CORE ANALYSIS
 # ============================================================================
 
-def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000, debug=False):
+def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000, debug=False,
+                         dist_cache=None):
     """
     Analyze predictions after a diagnostic cue.
 
@@ -195,6 +201,9 @@ def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000
     - Filter positions with high punctuation mass (>30%)
     - For "to", verify it's infinitival (PART) not prepositional (ADP)
 
+    If dist_cache (a DistributionCache) is given, distributions scored in
+    earlier runs are read from disk instead of re-running the model.
+
     Returns None if:
     - Cue not found
     - For "to": not infinitival or sentence-initial
@@ -219,13 +228,12 @@ def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000
 
     # Get context (prefix ending after cue)
     context = ' '.join(words[:cue_position+1])
-    inputs = tokenizer(context, return_tensors='pt')
+    token_ids = tokenizer(context)['input_ids']
 
     # Get next-token predictions
     with torch.no_grad():
-        outputs = model(**inputs)
-        next_token_logits = outputs.logits[0, -1, :]
-        probs = torch.softmax(next_token_logits, dim=-1)
+        logits = next_token_logits(model, token_ids, dist_cache=dist_cache)
+        probs = torch.softmax(logits, dim=-1)
 
         # REFINEMENT 2: Increased top_k for tighter mass accounting
         top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
@@ -241,9 +249,10 @@ def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000
     }
 
     word_start_candidates = []
+    annotations = load_vocab_annotations(tokenizer)
 
     for prob, token_id in zip(top_k_probs, top_k_ids):
-        token_str = tokenizer.decode([token_id])
+        token_str = annotations.token_str(token_id.item())
 
         if is_word_start_token(token_str):
             word = decode_to_word(token_str)
@@ -275,7 +284,7 @@ def analyze_cue_position(model, tokenizer, text, cue_word, cue_type, top_k=10000
         'full_text': text,
         'cue_word': cue_word,
         'context_prefix': context,  # Exact string fed to model
-        'context_tokens': len(inputs['input_ids'][0]),  # Number of BPE tokens
+        'context_tokens': len(token_ids),  # Number of BPE tokens
     }
 
     if debug:
@@ -329,7 +338,7 @@ def run_sanity_checks():
 # MAIN ANALYSIS
 # ============================================================================
 
-def main():
+def main(dist_cache_mb=0, dist_cache_topk=0, dtype='fp32'):
     print("=" * 80)
     print("MORPHOSYNTACTIC CONSTRAINT AUDIT (REFINED)")
     print("=" * 80)
@@ -343,10 +352,10 @@ def main():
     print()
 
     # Load model
-    print("Loading GPT-2...")
+    print(f"Loading GPT-2 ({dtype})...")
     tokenizer = AutoTokenizer.from_pretrained('gpt2')
-    model = AutoModelForCausalLM.from_pretrained('gpt2')
-    model.eval()
+    model = load_scoring_model('gpt2', dtype)
+    dist_cache = make_dist_cache(model, 'gpt2', dist_cache_mb, dist_cache_topk)
     print("✓ Model loaded\n")
 
     # Run sanity checks
@@ -382,7 +391,7 @@ def main():
 
                     result = analyze_cue_position(
                         model, tokenizer, text, cue_word, cue_type,
-                        top_k=10000, debug=debug
+                        top_k=10000, debug=debug, dist_cache=dist_cache
                     )
 
                     if result is not None:
@@ -462,5 +471,19 @@ def main():
     print(f"✓ Total records: {len(all_results)}")
     print("=" * 80)
 
+    if dist_cache is not None:
+        dist_cache.print_report()
+    print_precision_report(model)
+
 if __name__ == '__main__':
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description='Refined morphosyntactic constraint audit (GPT-2)')
+    parser.add_argument('--dist-cache-mb', type=int, default=0,
+                        help='On-disk distribution cache budget in MB (default: 0 = off)')
+    parser.add_argument('--dist-cache-topk', type=int, default=0,
+                        help='Top-k tokens stored per cached distribution (default: 0 = full vector)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                        help='Inference precision; softmax and class mass stay fp32 (default: fp32)')
+    args = parser.parse_args()
+
+    main(dist_cache_mb=args.dist_cache_mb, dist_cache_topk=args.dist_cache_topk, dtype=args.dtype)
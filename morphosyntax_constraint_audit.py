@@ -14,6 +14,8 @@ import numpy as np
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from collections import defaultdict
 
+from vocab_annotations import load_vocab_annotations
+
 # ============================================================================
 # LEXICON DEFINITIONS
 # ============================================================================
@@ -222,9 +224,10 @@ def analyze_cue_position(model, tokenizer, text, cue_word, top_k=5000, debug=Fal
     }
 
     word_start_candidates = []
+    annotations = load_vocab_annotations(tokenizer)
 
     for prob, token_id in zip(top_k_probs, top_k_ids):
-        token_str = tokenizer.decode([token_id])
+        token_str = annotations.token_str(token_id.item())
 
         # Check if word-start
         if is_word_start_token(token_str):
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Concurrent OpenAI Logprob Client
+
+run_experiment.py and diagnostic_analysis.py used to send one synchronous
+chat.completions call at a time with a fixed sleep in between, so a 120-item
+run took many times longer than the API's rate limits require. This client
+runs the requests concurrently on asyncio, within the limits.
+
+Method:
+- Up to `concurrency` requests are in flight at once
+- Two token buckets pace them: requests per minute and (estimated) tokens
+  per minute
+- 429, 5xx, timeout and connection errors are retried with exponential
+  backoff and jitter (a Retry-After header wins when the server sends one)
+- Responses are cached on disk, keyed by (model, prompt, top_logprobs,
+  max_tokens), so re-runs and re-analysis never pay for the same call twice
+- base_url (or $OPENAI_BASE_URL) can point at fake_openai_server.py, so
+  everything runs without network access or a real API key
+
+Cache location: $MORPHOSYNTAX_CACHE/openai (default ~/.cache/morphosyntax/openai)
+
+Usage:
+    from openai_logprobs import LogprobClient
+
+    client = LogprobClient(model='gpt-3.5-turbo', concurrency=16, rpm=500)
+    responses = client.run(texts, top_logprobs=20)   # one logprobs.content list per text
+    client.print_report()
+
+    # Against the fake server
+    python fake_openai_server.py --port 8123 --fail-rate 0.2 &
+    python openai_logprobs.py --base-url http://127.0.0.1:8123/v1 --n 120
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from typing import Dict, List, Optional, Sequence
+
+from vocab_annotations import get_cache_root
+
+# Rough prompt-token estimate for the tokens-per-minute bucket
+CHARS_PER_TOKEN = 4
+
+FORMAT_VERSION = 1
+
+
+# ============================================================================
+# RATE LIMITING
+# ============================================================================
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` units per second, bursts up to `capacity`.
+
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, limit: float) -> 'TokenBucket':
+        """Bucket for a per-minute limit, allowing one second's worth of burst."""
+        return cls(limit / 60.0, max(1.0, limit / 60.0))
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until `amount` units are available and take them."""
+        if not self.rate:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+def get_cache_dir() -> str:
+    """Root directory for cached API responses."""
+    return os.path.join(get_cache_root(), 'openai')
+
+
+class ResponseCache:
+    """On-disk JSON cache of chat-completion logprobs, one file per request key."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or get_cache_dir()
+
+    @staticmethod
+    def key(model: str, prompt: str, top_logprobs: int, max_tokens: int) -> str:
+        payload = json.dumps([FORMAT_VERSION, model, prompt, top_logprobs, max_tokens])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)['content']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, content: List[Dict]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'content': content}, f)
+        os.replace(tmp_path, path)
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx, timeouts and connection failures are worth retrying."""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After header of an API error, if any."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LogprobClient:
+    """
+    Concurrent, rate-limited, retrying, caching chat-completions logprob client.
+
+    Results are the `choices[0].logprobs.content` lists as plain dicts
+    ({'token', 'logprob', 'top_logprobs': [{'token', 'logprob'}, ...]}), or
+    None for a request that failed for good.
+
+    Attributes:
+        stats: Counters for requests, cache hits, retries and failures
+    """
+
+    def __init__(
+        self,
+        model: str = 'gpt-3.5-turbo',
+        concurrency: int = 8,
+        rpm: float = 500,
+        tpm: float = 0,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        timeout: float = 60.0,
+        cache: bool = True,
+        cache_dir: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ):
+        """
+        Args:
+            model: Chat model name
+            concurrency: Requests in flight at once
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Estimated prompt tokens per minute (0 = unlimited)
+            max_retries: Retries per request after the first attempt
+            base_delay / max_delay: Exponential backoff bounds in seconds
+            timeout: Per-request timeout in seconds
+            cache: Use the on-disk response cache
+            cache_dir: Override for the cache root
+            base_url: OpenAI-compatible endpoint (e.g. the fake server)
+            api_key: Defaults to $OPENAI_API_KEY ('fake' for a local base_url)
+        """
+        self.model = model
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir) if cache else None
+        self.base_url = base_url
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY') or ('fake' if base_url else None)
+        self.stats = {
+            'requests': 0,
+            'api_calls': 0,
+            'cache_hits': 0,
+            'retries': 0,
+            'failures': 0,
+            'seconds': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Async API
+    # ------------------------------------------------------------------
+
+    async def _fetch(self, api, buckets, semaphore, text: str, top_logprobs: int, max_tokens: int):
+        self.stats['requests'] += 1
+        key = ResponseCache.key(self.model, text, top_logprobs, max_tokens)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                return cached
+
+        request_bucket, token_bucket = buckets
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await request_bucket.acquire()
+                await token_bucket.acquire(len(text) / CHARS_PER_TOKEN + max_tokens)
+                try:
+                    self.stats['api_calls'] += 1
+                    response = await api.chat.completions.create(
+                        model=self.model,
+                        messages=[{'role': 'user', 'content': text}],
+                        max_tokens=max_tokens,
+                        logprobs=True,
+                        top_logprobs=top_logprobs,
+                    )
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries:
+                        self.stats['failures'] += 1
+                        print(f"Error processing text '{text[:50]}...': {e}")
+                        return None
+                    self.stats['retries'] += 1
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    await asyncio.sleep(delay)
+                    continue
+
+                logprobs = response.choices[0].logprobs
+                if not logprobs or not logprobs.content:
+                    print(f"Warning: No logprobs returned for text: {text[:50]}...")
+                    return None
+                content = [item.model_dump(include={'token', 'logprob', 'top_logprobs'})
+                           for item in logprobs.content]
+                if self.cache is not None:
+                    self.cache.put(key, content)
+                return content
+
+    async def amap(self, texts: Sequence[str], top_logprobs: int = 20, max_tokens: int = 1) -> List[Optional[List[Dict]]]:
+        """Fetch logprobs for every text concurrently; results in input order."""
+        from openai import AsyncOpenAI
+
+        start = time.time()
+        api = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                          max_retries=0, timeout=self.timeout)
+        buckets = (TokenBucket.per_minute(self.rpm), TokenBucket.per_minute(self.tpm))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            results = await asyncio.gather(*[
+                self._fetch(api, buckets, semaphore, text, top_logprobs, max_tokens) for text in texts
+            ])
+        finally:
+            await api.close()
+        self.stats['seconds'] += time.time() - start
+        return list(results)
+
+    # ------------------------------------------------------------------
+    # Sync API
+    # ------------------------------------------------------------------
+
+    def run(self, texts: Sequence[str], top_logprobs: int = 20, max_tokens: int = 1) -> List[Optional[List[Dict]]]:
+        """Blocking wrapper around amap for scripts."""
+        return asyncio.run(self.amap(texts, top_logprobs=top_logprobs, max_tokens=max_tokens))
+
+    def get(self, text: str, top_logprobs: int = 20, max_tokens: int = 1) -> Optional[List[Dict]]:
+        """Logprobs for a single text."""
+        return self.run([text], top_logprobs=top_logprobs, max_tokens=max_tokens)[0]
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict:
+        stats = dict(self.stats)
+        stats['cache_hit_rate'] = stats['cache_hits'] / max(stats['requests'], 1)
+        stats['requests_per_s'] = stats['requests'] / stats['seconds'] if stats['seconds'] else None
+        return stats
+
+    def print_report(self):
+        """Print request, cache and retry counts."""
+        stats = self.report()
+        print("OpenAI client:")
+        print(f"  Requests:   {stats['requests']} ({stats['api_calls']} API calls, "
+              f"{stats['cache_hits']} cache hits)")
+        print(f"  Retries:    {stats['retries']} ({stats['failures']} failed for good)")
+        if stats['requests_per_s']:
+            print(f"  Throughput: {stats['requests_per_s']:.1f} requests/s over {stats['seconds']:.1f}s")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fetch logprobs for synthetic prompts (e.g. against fake_openai_server.py)'
+    )
+    parser.add_argument('--base-url', type=str, default=None,
+                        help='OpenAI-compatible endpoint, e.g. http://127.0.0.1:8123/v1 (default: OpenAI)')
+    parser.add_argument('--model', type=str, default='gpt-3.5-turbo')
+    parser.add_argument('--n', type=int, default=120, help='Number of prompts (default: 120)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rpm', type=float, default=3000)
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the response cache')
+    args = parser.parse_args()
+
+    client = LogprobClient(model=args.model, concurrency=args.concurrency, rpm=args.rpm,
+                           cache=not args.no_cache, base_url=args.base_url, base_delay=0.1)
+    texts = [f"The blicket number {i} was florping the daxen" for i in range(args.n)]
+    results = client.run(texts)
+    print(f"{sum(r is not None for r in results)}/{len(results)} prompts returned logprobs")
+    client.print_report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Forked Process-Pool Scoring with Copy-on-Write Model Weights
+
+One PyTorch process leaves most cores of a large CPU node idle for the small
+batches these audits run. This module forks N workers after the model is
+loaded. Inference never writes to the weights, so every worker reads the
+parent's weight pages copy-on-write and an extra worker costs only its own
+activations, not another copy of the model.
+
+Method:
+- The parent loads the model, tokenizer and analyzers once
+- The work list is split into deterministic round-robin shards
+  (worker w gets items w, w + N, w + 2N, ...)
+- Each forked worker sets its own intra-op thread count, scores its shard
+  and streams results to its own sidecar file
+- The parent merges the sidecars into one result file in job order
+
+Fork is required (shared pages are inherited, nothing is pickled), so this
+only works on Linux/macOS CPU runs; CUDA cannot be re-initialized in a
+forked child.
+
+Usage:
+    from parallel_scoring import run_forked_workers, shard
+
+    def work(worker_idx):
+        for i in shard(pending, n_workers, worker_idx):
+            ...
+        return {'n': ...}
+
+    stats = run_forked_workers(n_workers, work, threads_per_worker=8)
+"""
+
+import os
+import time
+import signal
+import traceback
+import multiprocessing as mp
+from queue import Empty
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+# ============================================================================
+# SHARDING
+# ============================================================================
+
+def shard(items: Sequence, n_workers: int, worker_idx: int) -> List:
+    """Deterministic round-robin shard of items for one worker."""
+    return list(items[worker_idx::n_workers])
+
+
+def default_threads_per_worker(n_workers: int) -> int:
+    """Split the machine's cores evenly across workers (at least 1 each)."""
+    return max(1, (os.cpu_count() or 1) // max(1, n_workers))
+
+
+# ============================================================================
+# MEMORY ACCOUNTING
+# ============================================================================
+
+def private_memory_mb() -> Optional[float]:
+    """
+    Memory private to this process (pages not shared with any other), in MB.
+
+    Read from /proc/self/smaps_rollup; None where that is unavailable. For a
+    forked worker this excludes the copy-on-write model weights.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+
+    kb = sum(int(fields[name].split()[0]) for name in ('Private_Clean', 'Private_Dirty') if name in fields)
+    return kb / 1024
+
+
+def model_size_mb(model) -> float:
+    """
+    Weight + buffer memory of a model in MB.
+
+    Walks the state dict so the packed weights of int8 dynamically quantized
+    layers (which are not parameters) are counted; tied weights count once.
+    """
+    import torch
+
+    seen = set()
+    total = 0
+    for value in model.state_dict(keep_vars=True).values():
+        for tensor in (value if isinstance(value, (tuple, list)) else (value,)):
+            if not torch.is_tensor(tensor):
+                continue
+            if not tensor.is_quantized:
+                if tensor.data_ptr() in seen:
+                    continue
+                seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+    return total / 1024 ** 2
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+def _worker_main(worker_idx: int, target: Callable[[int], Dict], threads: int, queue):
+    """Entry point of a forked worker: set threads, run target, report stats."""
+    import torch
+
+    try:
+        torch.set_num_threads(threads)
+        start = time.time()
+        stats = target(worker_idx) or {}
+        stats.update({
+            'worker': worker_idx,
+            'threads': threads,
+            'seconds': time.time() - start,
+            'private_mb': private_memory_mb(),
+        })
+        queue.put(stats)
+    except Exception:
+        queue.put({'worker': worker_idx, 'error': traceback.format_exc()})
+        raise
+
+
+def run_forked_workers(
+    n_workers: int,
+    target: Callable[[int], Dict],
+    threads_per_worker: int = 0,
+    poll_interval: float = 5.0,
+) -> List[Dict]:
+    """
+    Fork n_workers processes that each run target(worker_idx).
+
+    Everything the target closes over (model, tokenizer, job list) is
+    inherited through fork, not pickled.
+
+    Args:
+        n_workers: Number of worker processes
+        target: Function of the worker index; returns a stats dict
+        threads_per_worker: torch intra-op threads per worker (0 = split cores)
+        poll_interval: Seconds between checks for workers that died without
+            reporting
+
+    Returns:
+        Per-worker stats dicts (plus threads, seconds and private_mb), by worker
+
+    Raises:
+        RuntimeError: If any worker fails or dies (e.g. killed by a signal)
+    """
+    threads = threads_per_worker or default_threads_per_worker(n_workers)
+    ctx = mp.get_context('fork')
+    queue = ctx.Queue()
+
+    processes = [
+        ctx.Process(target=_worker_main, args=(w, target, threads, queue), daemon=False)
+        for w in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Drain the queue before joining so a worker never blocks on a full pipe.
+    # A worker killed by a signal (SIGBUS, OOM killer) never reports, so poll
+    # and give up on workers that are dead without having reported; they get
+    # one more poll first, for stats still in the pipe when they exited.
+    stats = {}
+    lost = []
+    while len(stats) < n_workers:
+        try:
+            report = queue.get(timeout=poll_interval)
+            stats[report['worker']] = report
+            continue
+        except Empty:
+            pass
+        dead = [w for w, p in enumerate(processes) if w not in stats and not p.is_alive()]
+        if dead and dead == lost:
+            break
+        lost = dead
+
+    for w, process in enumerate(processes):
+        if w not in stats and process.is_alive():
+            process.terminate()
+        process.join()
+
+    errors = [s['error'] for s in stats.values() if 'error' in s]
+    errors += [f"worker {w} died without reporting (exit code {processes[w].exitcode}"
+               f"{describe_signal(processes[w].exitcode)})" for w in range(n_workers) if w not in stats]
+    if errors or any(p.exitcode != 0 for p in processes):
+        raise RuntimeError(f"{len(errors) or 'some'} worker(s) failed\n" + '\n'.join(errors))
+
+    return [stats[w] for w in range(n_workers)]
+
+
+def describe_signal(exitcode: Optional[int]) -> str:
+    """', killed by SIGNAME' for a negative exit code, else ''."""
+    if exitcode is None or exitcode >= 0:
+        return ''
+    try:
+        return f", killed by {signal.Signals(-exitcode).name}"
+    except ValueError:
+        return f", killed by signal {-exitcode}"
+
+
+def print_parallel_report(report: Dict):
+    """Print throughput (unique contexts/s) and memory of a parallel run against the 1-process baseline."""
+    print("Parallel execution:")
+    print(f"  Workers:            {report['workers']} × {report['threads_per_worker']} threads")
+    if report.get('baseline_contexts_per_s'):
+        print(f"  Baseline (1 proc):  {report['baseline_contexts_per_s']:.1f} unique contexts/s "
+              f"({report['baseline_contexts']} sampled after a warm-up)")
+    print(f"  Parallel:           {report['parallel_contexts_per_s']:.1f} unique contexts/s "
+          f"({report['parallel_contexts']} unique contexts)")
+    if report.get('speedup'):
+        print(f"  Speedup:            {report['speedup']:.2f}×")
+    private = [mb for mb in report['worker_private_mb'] if mb is not None]
+    if private:
+        print(f"  Private memory:     {max(private):.0f} MB max per worker "
+              f"(model weights: {report['model_mb']:.0f} MB, shared)")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Paired Sign-Flip Permutation Tests
+
+Nonparametric confirmation of the paired t-tests in analyze_locked_results.
+Under H0 (no difference between conditions) each paired difference is
+symmetric around zero, so flipping its sign leaves the distribution of the
+mean difference unchanged. The two-sided p-value is the share of sign-flip
+patterns whose |sum of flipped differences| reaches the observed |sum|.
+
+Method:
+- Sign-flip patterns are bit-packed: bit j of a row (np.unpackbits,
+  little-endian) flips pair j, so a pattern costs n/8 bytes
+- A chunk of patterns is unpacked into a 0/1 matrix B and the flipped sums
+  are sum(d) - 2 * (B @ d): one matrix-vector product per chunk
+- Exact mode (n <= exact_max_n, at most EXACT_MAX_N_LIMIT = 30): patterns 0 .. 2^(n-1) - 1 are the packed
+  bytes of the pattern index; the other half are their complements, which
+  give the same |sum|, so p = count / 2^(n-1)
+- Monte-Carlo mode: n_permutations random packed patterns (random bytes),
+  p = (count + 1) / (n_permutations + 1) so p is never 0
+- Contrasts run in a forked process pool; each contrast seeds its own
+  RandomState([seed, index]), so p-values do not depend on the worker count
+
+Usage:
+    from permutation_tests import permutation_pvalues
+
+    p_values, stats = permutation_pvalues(diff_columns, n_permutations=10000, workers=4)
+
+    # Runtime scaling with n (exact vs Monte Carlo) and with workers
+    python permutation_tests.py --n-pairs 10 16 20 30 --workers 1 2 4
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_PERMUTATIONS = 10000
+EXACT_MAX_N = 20
+# 2^(n-1) patterns: n = 30 is already ~5e8 of them, and pattern indices are unpacked from 64 bits
+EXACT_MAX_N_LIMIT = 30
+CHUNK_SIZE = 65536
+
+
+# ============================================================================
+# SIGN-FLIP PATTERNS
+# ============================================================================
+
+def random_sign_flips(n: int, n_flips: int, rng) -> np.ndarray:
+    """n_flips random bit-packed sign-flip patterns of n pairs: uint8 [n_flips, ceil(n/8)]."""
+    n_bytes = (n + 7) // 8
+    return np.frombuffer(rng.bytes(n_flips * n_bytes), dtype=np.uint8).reshape(n_flips, n_bytes)
+
+
+def exact_sign_flips(n: int, start: int, stop: int) -> np.ndarray:
+    """Bit-packed patterns start .. stop - 1 (the pattern index's bits): uint8 [stop - start, ceil(n/8)]."""
+    n_bytes = (n + 7) // 8
+    codes = np.arange(start, stop, dtype='<u8')
+    return codes.view(np.uint8).reshape(-1, 8)[:, :n_bytes]
+
+
+def flipped_sums(diff: np.ndarray, packed: np.ndarray) -> np.ndarray:
+    """Sum of the differences under each packed sign-flip pattern."""
+    bits = np.unpackbits(packed, axis=1, count=len(diff), bitorder='little')
+    return diff.sum() - 2 * (bits.astype(np.float64) @ diff)
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def check_exact_max_n(exact_max_n: int):
+    """Raise ValueError unless 0 <= exact_max_n <= EXACT_MAX_N_LIMIT."""
+    if not 0 <= exact_max_n <= EXACT_MAX_N_LIMIT:
+        raise ValueError(f"exact_max_n must be between 0 and {EXACT_MAX_N_LIMIT} "
+                         f"(got {exact_max_n}); larger n use Monte-Carlo sign flips")
+
+
+def sign_flip_test(
+    diff: np.ndarray,
+    n_permutations: int = DEFAULT_PERMUTATIONS,
+    exact_max_n: int = EXACT_MAX_N,
+    rng=None,
+    chunk_size: int = CHUNK_SIZE
+) -> Dict:
+    """
+    Two-sided paired sign-flip test of mean(diff) == 0.
+
+    Args:
+        diff: Paired differences x - y
+        n_permutations: Random patterns for Monte-Carlo mode
+        exact_max_n: Enumerate all 2^n patterns when n is at most this
+            (at most EXACT_MAX_N_LIMIT); larger n use Monte Carlo
+        rng: np.random.RandomState for Monte-Carlo mode
+        chunk_size: Patterns unpacked per matrix-vector product
+
+    Returns:
+        Dict with p_value, mode ('exact' or 'monte-carlo'), n, n_flips, seconds
+
+    Raises:
+        ValueError: If exact_max_n is above EXACT_MAX_N_LIMIT
+    """
+    check_exact_max_n(exact_max_n)
+    start_time = time.time()
+    diff = np.asarray(diff, dtype=float)
+    n = len(diff)
+    if n == 0:
+        return {'p_value': np.nan, 'mode': None, 'n': 0, 'n_flips': 0, 'seconds': 0.0}
+
+    observed = abs(diff.sum())
+    # Patterns whose sum equals the observed one up to rounding count as extreme
+    threshold = observed - 1e-9 * np.abs(diff).sum()
+
+    count = 0
+    if n <= exact_max_n:
+        mode = 'exact'
+        n_flips = 2 ** (n - 1)
+        for start in range(0, n_flips, chunk_size):
+            packed = exact_sign_flips(n, start, min(start + chunk_size, n_flips))
+            count += int((np.abs(flipped_sums(diff, packed)) >= threshold).sum())
+        p_value = count / n_flips
+    else:
+        mode = 'monte-carlo'
+        n_flips = n_permutations
+        rng = rng if rng is not None else np.random.RandomState(0)
+        for start in range(0, n_flips, chunk_size):
+            packed = random_sign_flips(n, min(chunk_size, n_flips - start), rng)
+            count += int((np.abs(flipped_sums(diff, packed)) >= threshold).sum())
+        p_value = (count + 1) / (n_flips + 1)
+
+    return {'p_value': p_value, 'mode': mode, 'n': n, 'n_flips': n_flips,
+            'seconds': time.time() - start_time}
+
+
+def _test_column(args: Tuple) -> Dict:
+    """Pool task: sign_flip_test of one contrast with its own seeded generator."""
+    index, diff, n_permutations, exact_max_n, seed = args
+    return sign_flip_test(diff, n_permutations, exact_max_n, rng=np.random.RandomState([seed, index]))
+
+
+def permutation_pvalues(
+    diff_columns: Sequence[np.ndarray],
+    n_permutations: int = DEFAULT_PERMUTATIONS,
+    exact_max_n: int = EXACT_MAX_N,
+    seed: int = 42,
+    workers: int = 1
+) -> Tuple[np.ndarray, Dict]:
+    """
+    Sign-flip p-values for many contrasts, optionally across a process pool.
+
+    Args:
+        diff_columns: Paired differences, one array per contrast
+        n_permutations: Random patterns per Monte-Carlo contrast
+        exact_max_n: Largest n tested exactly (at most EXACT_MAX_N_LIMIT)
+        seed: Base seed; contrast i uses RandomState([seed, i])
+        workers: Worker processes (1 = in this process)
+
+    Returns:
+        (p_values, stats) where stats has contrasts, exact, monte_carlo,
+        n_flips, workers and seconds
+
+    Raises:
+        ValueError: If exact_max_n is above EXACT_MAX_N_LIMIT
+    """
+    check_exact_max_n(exact_max_n)
+    start_time = time.time()
+    tasks = [(i, np.asarray(d, dtype=float), n_permutations, exact_max_n, seed)
+             for i, d in enumerate(diff_columns)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('fork')) as pool:
+            results = list(pool.map(_test_column, tasks,
+                                    chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        results = [_test_column(task) for task in tasks]
+
+    stats = {
+        'contrasts': len(results),
+        'exact': sum(r['mode'] == 'exact' for r in results),
+        'monte_carlo': sum(r['mode'] == 'monte-carlo' for r in results),
+        'n_flips': sum(r['n_flips'] for r in results),
+        'workers': workers,
+        'seconds': time.time() - start_time,
+    }
+    return np.array([r['p_value'] for r in results]), stats
+
+
+def print_permutation_stats(stats: Dict):
+    """One-line summary of a permutation_pvalues run."""
+    print(f"Permutation tests: {stats['contrasts']} contrasts ({stats['exact']} exact, "
+          f"{stats['monte_carlo']} Monte Carlo), {stats['n_flips']:,} sign flips "
+          f"in {stats['seconds']:.2f}s on {stats['workers']} worker(s)")
+
+
+# ============================================================================
+# SCALING BENCHMARK
+# ============================================================================
+
+def run_scaling_benchmark(
+    n_pairs: Sequence[int],
+    workers: Sequence[int],
+    n_contrasts: int = 50,
+    n_permutations: int = DEFAULT_PERMUTATIONS,
+    exact_max_n: int = EXACT_MAX_N,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    Time permutation_pvalues on synthetic contrasts for each n and worker count.
+
+    Returns:
+        One row per (n, workers): mode, n_flips, seconds, flips_per_s and
+        speedup over the first worker count
+    """
+    rng = np.random.RandomState(seed)
+    rows = []
+    for n in n_pairs:
+        columns = [rng.randn(n) + 0.3 for _ in range(n_contrasts)]
+        base = None
+        for w in workers:
+            _, stats = permutation_pvalues(columns, n_permutations, exact_max_n, workers=w)
+            base = base or stats['seconds']
+            rows.append({
+                'n': n,
+                'mode': 'exact' if n <= exact_max_n else 'monte-carlo',
+                'workers': w,
+                'n_flips': stats['n_flips'],
+                'seconds': stats['seconds'],
+                'flips_per_s': stats['n_flips'] / stats['seconds'] if stats['seconds'] else None,
+                'speedup': base / stats['seconds'] if stats['seconds'] else None,
+            })
+    return rows
+
+
+def print_scaling(rows: List[Dict], n_contrasts: int):
+    """Table of runtime by n and worker count."""
+    print()
+    print("=" * 80)
+    print(f"PERMUTATION TEST SCALING ({n_contrasts} contrasts, {os.cpu_count()} CPUs)")
+    print("=" * 80)
+    print(f"{'n':>4} {'mode':<12} {'workers':>8} {'sign flips':>14} {'seconds':>9} "
+          f"{'flips/s':>12} {'speedup':>8}")
+    print("-" * 80)
+    for r in rows:
+        print(f"{r['n']:>4} {r['mode']:<12} {r['workers']:>8} {r['n_flips']:>14,} "
+              f"{r['seconds']:>9.2f} {r['flips_per_s']:>12.3g} {r['speedup']:>7.2f}×")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runtime scaling of exact and Monte-Carlo sign-flip permutation tests'
+    )
+    parser.add_argument('--n-pairs', type=int, nargs='+', default=[10, 16, 20, 30],
+                        help='Pairs per contrast to time (default: 10 16 20 30)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Worker process counts to time (default: 1 2 4)')
+    parser.add_argument('--contrasts', type=int, default=50,
+                        help='Synthetic contrasts per run (default: 50)')
+    parser.add_argument('--permutations', type=int, default=DEFAULT_PERMUTATIONS,
+                        help=f'Random sign flips per Monte-Carlo contrast (default: {DEFAULT_PERMUTATIONS})')
+    parser.add_argument('--exact-max-n', type=int, default=EXACT_MAX_N,
+                        help=f'Largest n enumerated exactly, at most {EXACT_MAX_N_LIMIT} '
+                             f'(default: {EXACT_MAX_N})')
+    args = parser.parse_args()
+    try:
+        check_exact_max_n(args.exact_max_n)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rows = run_scaling_benchmark(args.n_pairs, args.workers, args.contrasts,
+                                 args.permutations, args.exact_max_n)
+    print_scaling(rows, args.contrasts)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,13 +14,17 @@ This pattern should hold for Sentence and Jabberwocky, but weaken for Scrambled.
 
 import json
 import numpy as np
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import spacy
 from collections import defaultdict
 from typing import Dict, List, Tuple
 import argparse
 
+from batched_inference import next_token_logits
+from prefix_cache import PrefixKVCache
+from distribution_cache import make_dist_cache
+from scoring_server import connect_remote_model
+from precision import DTYPES, load_scoring_model, print_precision_report
+from vocab_annotations import load_vocab_annotations
+
 # spaCy will be loaded in main function to avoid macOS issues
 nlp = None
 
@@ -39,31 +43,39 @@ EXPECTED_CATEGORIES = {
     'prepositions': {'NOUN', 'DET', 'PROPN', 'PRON'}
 }
 
-def get_top_k_predictions(model, tokenizer, text: str, position: int, k=100):
+def get_top_k_predictions(model, tokenizer, text: str, position: int, k=100,
+                          prefix_cache=None, dist_cache=None):
     """
     Get top-k next-token predictions at a specific word position.
 
+    If prefix_cache (a PrefixKVCache) is given, only the token suffix not
+    shared with earlier contexts is run through the model. If dist_cache (a
+    DistributionCache) is given, distributions scored in earlier runs are
+    read from disk instead.
+
     Returns list of (token_string, probability, token_id) tuples.
     """
+    import torch
+
     # Tokenize up to position
     words = text.split()
     context = ' '.join(words[:position+1])
 
     # Get model predictions
-    inputs = tokenizer(context, return_tensors='pt')
-
-    with torch.no_grad():
-        outputs = model(**inputs)
-        next_token_logits = outputs.logits[0, -1, :]
+    logits = next_token_logits(model, tokenizer(context)['input_ids'],
+                               prefix_cache=prefix_cache, dist_cache=dist_cache)
 
     # Get top-k
-    probs = torch.softmax(next_token_logits, dim=-1)
+    probs = torch.softmax(logits, dim=-1)
     top_k_probs, top_k_ids = torch.topk(probs, k)
 
-    # Decode tokens
+    # Decode tokens (cached vocab annotations; special tokens decode to '')
+    annotations = load_vocab_annotations(tokenizer)
+    special_ids = set(tokenizer.all_special_ids)
     candidates = []
     for prob, token_id in zip(top_k_probs, top_k_ids):
-        token_str = tokenizer.decode([token_id], skip_special_tokens=True)
+        token_id_int = token_id.item()
+        token_str = '' if token_id_int in special_ids else annotations.token_str(token_id_int)
 
         # Only include substantive tokens (not empty strings)
         if token_str.strip():
@@ -112,7 +124,8 @@ def find_cue_positions(text: str, cue_words: List[str]) -> List[int]:
 
     return positions
 
-def analyze_condition(stimuli: List[Dict], condition: str, model, tokenizer, k=100):
+def analyze_condition(stimuli: List[Dict], condition: str, model, tokenizer, k=100,
+                      prefix_cache=None, dist_cache=None):
     """
     Analyze all diagnostic cue positions for one condition.
     """
@@ -127,7 +140,9 @@ def analyze_condition(stimuli: List[Dict], condition: str, model, tokenizer, k=1
 
             for pos in positions:
                 # Get top-k predictions at this position
-                candidates = get_top_k_predictions(model, tokenizer, text, pos, k)
+                candidates = get_top_k_predictions(model, tokenizer, text, pos, k,
+                                                   prefix_cache=prefix_cache,
+                                                   dist_cache=dist_cache)
 
                 # POS tag
                 tagged = pos_tag_candidates(candidates)
@@ -253,9 +268,16 @@ def print_summary_report(summary: Dict):
 
     print("="*80)
 
-def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
+def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100,
+                  kv_cache_mb=0, dist_cache_mb=0, dist_cache_topk=0, server=None, dtype='fp32'):
     """
     Main function to run POS audit.
+
+    kv_cache_mb > 0 enables prefix KV-cache reuse across cue positions;
+    dist_cache_mb > 0 enables the on-disk next-token distribution cache;
+    server (a scoring_server URL) scores through the warm-model daemon;
+    dtype ('fp32', 'bf16', 'int8-dynamic') sets the inference precision,
+    with probabilities always computed in fp32.
     """
     global nlp
 
@@ -264,6 +286,9 @@ def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
     print(f"Top-k: {k}")
     print()
 
+    import spacy
+    from transformers import AutoTokenizer
+
     # Load spaCy model
     print("Loading spaCy model...")
     nlp = spacy.load("en_core_web_sm")
@@ -272,9 +297,14 @@ def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
     # Load model
     print("Loading model...")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.eval()
-    print("Model loaded.")
+    if server:
+        if kv_cache_mb > 0 or dist_cache_mb > 0 or dtype != 'fp32':
+            raise ValueError("--server cannot be combined with --kv-cache-mb, --dist-cache-mb or --dtype")
+        model = connect_remote_model(server, model_name)
+    else:
+        model = load_scoring_model(model_name, dtype)
+        print(f"Model loaded ({dtype}).")
+    dist_cache = make_dist_cache(model, model_name, dist_cache_mb, dist_cache_topk)
 
     # Load stimuli
     with open(stimuli_file) as f:
@@ -286,11 +316,14 @@ def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
     # Analyze each condition
     all_results = {}
     conditions = ['sentence', 'jabberwocky_matched', 'scrambled_jabberwocky']
+    prefix_cache = PrefixKVCache(max_bytes=kv_cache_mb * 1024 ** 2) if kv_cache_mb > 0 else None
 
     for condition in conditions:
         print(f"Analyzing {condition}...")
         all_results[condition] = analyze_condition(stimuli, condition,
-                                                   model, tokenizer, k)
+                                                   model, tokenizer, k,
+                                                   prefix_cache=prefix_cache,
+                                                   dist_cache=dist_cache)
 
     # Summarize
     summary = summarize_results(all_results)
@@ -303,6 +336,7 @@ def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
         'model_name': model_name,
         'stimuli_file': stimuli_file,
         'k': k,
+        'dtype': dtype,
         'diagnostic_cues': DIAGNOSTIC_CUES,
         'expected_categories': {k: list(v) for k, v in EXPECTED_CATEGORIES.items()},
         'detailed_results': all_results,
@@ -314,7 +348,19 @@ def run_pos_audit(stimuli_file: str, model_name: str, output_file: str, k=100):
 
     print(f"\nResults saved to: {output_file}")
 
-if __name__ == "__main__":
+    if prefix_cache is not None:
+        print()
+        prefix_cache.print_report()
+
+    if dist_cache is not None:
+        print()
+        dist_cache.print_report()
+
+    if not server:
+        print()
+        print_precision_report(model)
+
+def main():
     parser = argparse.ArgumentParser(description='POS category audit')
     parser.add_argument('--stimuli', default='stimuli_with_scrambled.json',
                        help='Stimuli file')
@@ -324,7 +370,23 @@ if __name__ == "__main__":
                        help='Output file')
     parser.add_argument('--k', type=int, default=100,
                        help='Top-k candidates to analyze')
+    parser.add_argument('--kv-cache-mb', type=int, default=0,
+                       help='Prefix KV-cache budget in MB (default: 0 = off)')
+    parser.add_argument('--dist-cache-mb', type=int, default=0,
+                       help='On-disk distribution cache budget in MB (default: 0 = off)')
+    parser.add_argument('--dist-cache-topk', type=int, default=0,
+                       help='Top-k tokens stored per cached distribution (default: 0 = full vector)')
+    parser.add_argument('--server', default=None,
+                       help='Score through a running scoring_server at this URL (default: load locally)')
+    parser.add_argument('--dtype', choices=DTYPES, default='fp32',
+                       help='Inference precision; probabilities stay fp32 (default: fp32)')
 
     args = parser.parse_args()
 
-    run_pos_audit(args.stimuli, args.model, args.output, args.k)
+    run_pos_audit(args.stimuli, args.model, args.output, args.k,
+                  kv_cache_mb=args.kv_cache_mb, dist_cache_mb=args.dist_cache_mb,
+                  dist_cache_topk=args.dist_cache_topk, server=args.server, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
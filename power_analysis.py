@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Simulation-Based Power Analysis for the Locked Design
+
+generate_locked_stimuli.N_SENTENCES_PER_FAMILY was set to 30 by hand. This
+module estimates, from an existing locked audit, how many sentences per
+family the planned contrasts need, so the next stimulus generation can be
+sized to the compute budget.
+
+Method:
+- Effect structure: for every cue family, the paired differences of the
+  planned contrasts (analyze_locked_results.CONTRASTS) on each set give a
+  matrix D_f [items, contrasts]; its mean vector and covariance are the
+  family's effects and their correlation through shared items
+- Simulation: for each candidate N, thousands of synthetic experiments are
+  drawn at once as an array [experiments, N, families x contrasts], either
+  multivariate normal with the estimated mean and covariance (parametric)
+  or by resampling observed item rows (resample); families are independent
+- Each synthetic experiment is analysed like the real one: paired t-test
+  per contrast (t CDF from scipy.special, as in analyze_locked_results) and
+  Benjamini-Hochberg across all contrasts of the experiment, row-wise
+- Power = share of experiments where the contrast is significant after FDR
+  with the observed sign; for contrasts with no observed effect it is the
+  false-positive rate
+- Experiments are processed in chunks that keep the array under max_bytes
+
+Usage:
+    python power_analysis.py locked_audit_gpt2.json
+    python power_analysis.py locked_audit_gpt2.json --n-values 20 30 50 100 200 \\
+        --sims 5000 --contexts-per-s 120
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence, Tuple
+
+from bootstrap_stats import DEFAULT_MAX_BYTES, benjamini_hochberg
+from analyze_locked_results import CONTRASTS, load_results
+
+METHODS = ('parametric', 'resample')
+DEFAULT_N_VALUES = [10, 20, 30, 50, 75, 100, 150, 200]
+
+
+# ============================================================================
+# EFFECT STRUCTURE
+# ============================================================================
+
+def family_effects(df: pd.DataFrame, context_k: str = 'full') -> Dict[str, np.ndarray]:
+    """
+    Per-item contrast differences for every cue family.
+
+    Items are the family's sets (set_ids are only unique within a family);
+    sets missing any condition of a contrast are dropped, and so are
+    families left without sets.
+
+    Returns:
+        {family: D [items, len(CONTRASTS)]}
+    """
+    df_k = df[df['context_k'] == context_k]
+    effects = {}
+    for family in df_k['cue_family'].unique():
+        wide = (df_k[df_k['cue_family'] == family]
+                .groupby(['set_id', 'condition'])['target_mass'].mean().unstack('condition'))
+        diffs = np.column_stack([
+            wide[a] - wide[b] if a in wide and b in wide else np.full(len(wide), np.nan)
+            for a, b in CONTRASTS
+        ])
+        diffs = diffs[~np.isnan(diffs).any(axis=1)]
+        if len(diffs):
+            effects[family] = diffs
+    return effects
+
+
+def effect_summary(effects: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """Observed mean difference, SD and Cohen's d of every (family, contrast)."""
+    rows = []
+    for family, diffs in effects.items():
+        for j, (a, b) in enumerate(CONTRASTS):
+            col = diffs[:, j]
+            sd = col.std(ddof=1) if len(col) > 1 else np.nan
+            rows.append({
+                'cue_family': family,
+                'contrast': f"{a} - {b}",
+                'n_items': len(col),
+                'mean_diff': col.mean() if len(col) else np.nan,
+                'sd': sd,
+                'cohens_d': col.mean() / sd if sd and sd > 0 else 0.0,
+            })
+    return pd.DataFrame(rows)
+
+
+def covariance_factor(diffs: np.ndarray) -> np.ndarray:
+    """
+    L with L @ L.T equal to the covariance of the columns of diffs.
+
+    Built from the eigendecomposition (negative eigenvalues clipped), since
+    with fewer items than contrasts the covariance is singular and has no
+    Cholesky factor.
+    """
+    if len(diffs) < 2:
+        return np.zeros((diffs.shape[1], diffs.shape[1]))
+    eigvals, eigvecs = np.linalg.eigh(np.atleast_2d(np.cov(diffs, rowvar=False)))
+    return eigvecs * np.sqrt(np.clip(eigvals, 0, None))
+
+
+# ============================================================================
+# SIMULATION
+# ============================================================================
+
+def simulate_power(
+    effects: Dict[str, np.ndarray],
+    n_values: Sequence[int],
+    n_sims: int = 2000,
+    alpha: float = 0.05,
+    method: str = 'parametric',
+    seed: int = 42,
+    max_bytes: int = DEFAULT_MAX_BYTES
+) -> np.ndarray:
+    """
+    Power of every (family, contrast) after FDR correction at each N.
+
+    Args:
+        effects: {family: D [items, contrasts]} from family_effects
+        n_values: Candidate sentences per family
+        n_sims: Synthetic experiments per N
+        alpha: FDR level
+        method: 'parametric' (multivariate normal) or 'resample' (item rows)
+        seed: RandomState seed
+        max_bytes: Memory bound on each chunk of experiments
+
+    Returns:
+        Array [len(n_values), families x contrasts] of power, columns in
+        family order then CONTRASTS order
+    """
+    from scipy.special import stdtr
+
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method} (choose from {', '.join(METHODS)})")
+
+    rng = np.random.RandomState(seed)
+    families = list(effects.values())
+    n_contrasts = len(CONTRASTS)
+    n_columns = len(families) * n_contrasts
+    means = np.concatenate([d.mean(axis=0) for d in families])
+    factors = [covariance_factor(d) for d in families]
+    expected_sign = np.sign(means)
+
+    power = np.zeros((len(n_values), n_columns))
+    for i, n in enumerate(n_values):
+        chunk = max(1, int(max_bytes // (8 * n * n_columns * 2)))
+        hits = np.zeros(n_columns)
+        for start in range(0, n_sims, chunk):
+            sims = min(chunk, n_sims - start)
+            if method == 'parametric':
+                blocks = [rng.standard_normal((sims, n, n_contrasts)) @ factor.T + d.mean(axis=0)
+                          for d, factor in zip(families, factors)]
+            else:
+                blocks = [d[rng.randint(0, len(d), size=(sims, n))] for d in families]
+            x = np.concatenate(blocks, axis=-1)
+
+            # Paired t-test of every contrast in every experiment
+            mean = x.mean(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t_stat = mean / (x.std(axis=1, ddof=1) / np.sqrt(n))
+                p_values = 2 * stdtr(n - 1, -np.abs(t_stat))
+            _, significant = benjamini_hochberg(p_values, alpha)
+
+            hits += (significant & ((expected_sign == 0) | (np.sign(mean) == expected_sign))).sum(axis=0)
+        power[i] = hits / n_sims
+    return power
+
+
+def required_n(power: np.ndarray, n_values: Sequence[int], target: float) -> List:
+    """Smallest candidate N reaching target power per column (None if none does)."""
+    result = []
+    for col in power.T:
+        reached = np.nonzero(col >= target)[0]
+        result.append(n_values[reached[0]] if len(reached) else None)
+    return result
+
+
+def contexts_per_stimulus(df: pd.DataFrame, metadata: Dict) -> Tuple[float, str]:
+    """
+    Scored contexts per (cue_family, set_id) stimulus, and which count was used.
+
+    The audit's dedup report gives the unique contexts that actually ran
+    through the model; it is used when it covers every result row. Resumed
+    runs (the report covers only the resumed part) and audits from before
+    the report fall back to result rows, which overstates the cost by the
+    dedup ratio.
+    """
+    n_stimuli = len(df[['cue_family', 'set_id']].drop_duplicates())
+    if not n_stimuli:
+        return 0.0, 'result rows'
+    dedup = metadata.get('dedup') or {}
+    if dedup.get('unique_contexts') and dedup.get('contexts') == len(df):
+        return dedup['unique_contexts'] / n_stimuli, 'unique contexts after dedup'
+    return len(df) / n_stimuli, 'result rows, not deduplicated'
+
+
+def run_power_analysis(results_file: str, n_values: Sequence[int] = DEFAULT_N_VALUES,
+                       n_sims: int = 2000, alpha: float = 0.05, method: str = 'parametric',
+                       target_power: float = 0.8, min_d: float = 0.2, context_k: str = 'full',
+                       seed: int = 42) -> Dict:
+    """
+    Estimate effects from one locked audit and simulate power at each N.
+
+    Returns:
+        Dict with metadata, effects (DataFrame with power_N and required_n
+        columns), n_values, recommended N (smallest N where every contrast
+        with observed |d| >= min_d reaches target_power), contexts per
+        stimulus (and contexts_source, which count it is) and seconds
+    """
+    start_time = time.time()
+    metadata, df = load_results(results_file)
+    effects = family_effects(df, context_k)
+    table = effect_summary(effects)
+
+    power = simulate_power(effects, n_values, n_sims, alpha, method, seed)
+    for i, n in enumerate(n_values):
+        table[f'power_{n}'] = power[i]
+    table['required_n'] = pd.array(required_n(power, n_values, target_power), dtype='Int64')
+
+    per_stimulus, contexts_source = contexts_per_stimulus(df, metadata)
+    planned = (table['cohens_d'].abs() >= min_d).to_numpy()
+    all_reached = [n for i, n in enumerate(n_values)
+                   if planned.any() and (power[i, planned] >= target_power).all()]
+
+    return {
+        'metadata': metadata,
+        'effects': table,
+        'n_values': list(n_values),
+        'n_sims': n_sims,
+        'alpha': alpha,
+        'method': method,
+        'target_power': target_power,
+        'min_d': min_d,
+        'n_planned': int(planned.sum()),
+        'recommended_n': all_reached[0] if all_reached else None,
+        'n_families': len(effects),
+        'contexts_per_stimulus': per_stimulus,
+        'contexts_source': contexts_source,
+        'seconds': time.time() - start_time,
+    }
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def print_power_analysis(result: Dict, contexts_per_s: float = 0.0):
+    """Observed effects, power by N, required N and the audit cost of each N."""
+    table = result['effects']
+    n_values = result['n_values']
+    print()
+    print("=" * 100)
+    print(f"POWER ANALYSIS: {result['metadata']['model']} ({result['method']}, "
+          f"{result['n_sims']} experiments per N, FDR {result['alpha']})")
+    print("=" * 100)
+    print()
+    cols = ['cue_family', 'contrast', 'n_items', 'mean_diff', 'cohens_d'] + \
+           [f'power_{n}' for n in n_values] + ['required_n']
+    print(table[cols].round(4).to_string(index=False))
+    print()
+
+    print(f"Audit cost per N ({result['n_families']} families, "
+          f"{result['contexts_per_stimulus']:.1f} contexts per stimulus, "
+          f"{result['contexts_source']}):")
+    for n in n_values:
+        contexts = n * result['n_families'] * result['contexts_per_stimulus']
+        line = f"  N={n:<5} {n * result['n_families']:>7} stimuli {contexts:>10,.0f} contexts"
+        if contexts_per_s:
+            line += f"  ~{contexts / contexts_per_s / 3600:.2f} h"
+        print(line)
+    print()
+
+    target = f"power ≥ {result['target_power']:.0%}"
+    if result['recommended_n'] is not None:
+        print(f"Recommended N_SENTENCES_PER_FAMILY: {result['recommended_n']} "
+              f"({target} for all {result['n_planned']} contrasts with |d| ≥ {result['min_d']})")
+    else:
+        print(f"No candidate N reaches {target} for all {result['n_planned']} contrasts "
+              f"with |d| ≥ {result['min_d']}; see required_n per contrast")
+    print(f"Time: {result['seconds']:.1f}s")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulated power of the planned contrasts after FDR correction, by sentences per family'
+    )
+    parser.add_argument('results_files', nargs='+', help='Locked audit result JSONs (one analysis each)')
+    parser.add_argument('--n-values', type=int, nargs='+', default=DEFAULT_N_VALUES,
+                        help=f"Candidate sentences per family (default: {' '.join(map(str, DEFAULT_N_VALUES))})")
+    parser.add_argument('--sims', type=int, default=2000,
+                        help='Synthetic experiments per N (default: 2000)')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='FDR level (default: 0.05)')
+    parser.add_argument('--method', type=str, choices=METHODS, default='parametric',
+                        help='Multivariate normal from the estimated effects, or resampled items '
+                             '(default: parametric)')
+    parser.add_argument('--target-power', type=float, default=0.8,
+                        help='Power to reach (default: 0.8)')
+    parser.add_argument('--min-d', type=float, default=0.2,
+                        help='Contrasts with observed |d| below this are not required to reach '
+                             'the target (default: 0.2)')
+    parser.add_argument('--context-k', type=str, default='full',
+                        help='Context length the contrasts are tested at (default: full)')
+    parser.add_argument('--contexts-per-s', type=float, default=0.0,
+                        help='Scoring throughput, to convert audit size into hours (default: off)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed (default: 42)')
+    args = parser.parse_args()
+
+    for results_file in args.results_files:
+        result = run_power_analysis(results_file, args.n_values, args.sims, args.alpha, args.method,
+                                    args.target_power, args.min_d, args.context_k, args.seed)
+        print_power_analysis(result, args.contexts_per_s)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Reduced-Precision CPU Inference
+
+GPT2_MEDIUM_BUG_REPORT.md documents NaN logits in float32 and wrong logits
+in float16 on CPU, and the robust runner used to turn a NaN entropy into a
+silent 0.0. This module loads scoring models in a reduced-precision mode
+while keeping every metric in fp32 and every non-finite row visible.
+
+Modes (--dtype):
+- fp32:          float32 weights and activations (the reference)
+- bf16:          bfloat16 weights and activations; half the memory and the
+                 same exponent range as fp32, so none of fp16's overflow
+- int8-dynamic:  Linear layers quantized to int8 with dynamically quantized
+                 activations (torch.ao.quantization.quantize_dynamic); GPT-2's
+                 Conv1D projections are converted to Linear first so they are
+                 quantized too. CPU only.
+
+Metrics:
+- Logits are cast to float32 before the softmax in every mode, so entropy
+  and class mass are always computed in fp32
+- batched_inference.guard_logits checks each row for inf/NaN and re-runs a
+  bad row alone, unpadded, through the fp32 reference model (loaded lazily
+  on first use) instead of zeroing it
+- Rows that are still non-finite in fp32 stay NaN and are counted
+
+Usage:
+    from precision import load_scoring_model, print_precision_report
+
+    model = load_scoring_model('gpt2', dtype='bf16')
+    ...
+    print_precision_report(model)
+
+    # Throughput, weight memory and deviation from fp32 for each mode
+    python precision.py --model gpt2 --stimuli stimuli_locked.json --n-contexts 300
+"""
+
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+DTYPES = ('fp32', 'bf16', 'int8-dynamic')
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+def conv1d_to_linear(model):
+    """Replace GPT-2 style Conv1D layers (weight [in, out]) by equivalent nn.Linear layers."""
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, name, linear)
+    return model
+
+
+def quantize_int8_dynamic(model):
+    """
+    int8 dynamic quantization of every Linear layer in the transformer body (CPU).
+
+    The LM head stays fp32: it produces the logits directly, and in GPT-2 it
+    shares its weight with the input embeddings, so a quantized copy would
+    add memory rather than save it.
+    """
+    import torch
+
+    conv1d_to_linear(model.base_model)
+    with warnings.catch_warnings():
+        # torch flags its eager-mode quantized tensor constructors as deprecated
+        warnings.simplefilter('ignore')
+        torch.ao.quantization.quantize_dynamic(model.base_model, {torch.nn.Linear},
+                                               dtype=torch.qint8, inplace=True)
+    return model
+
+
+def _fp32_loader(model_name: str, device: str):
+    """Lazy loader for the fp32 reference model (loaded once, on first call)."""
+    reference = []
+
+    def load():
+        if not reference:
+            from transformers import AutoModelForCausalLM
+
+            print(f"Loading fp32 reference of {model_name} for non-finite rows...")
+            reference.append(AutoModelForCausalLM.from_pretrained(model_name).to(device).eval())
+        return reference[0]
+
+    return load
+
+
+def load_scoring_model(model_name: str, dtype: str = 'fp32', device: str = 'cpu'):
+    """
+    Load a causal LM for scoring in one of the DTYPES modes.
+
+    The model carries `scoring_dtype`, `precision_stats` (rows checked,
+    recomputed and unresolved by guard_logits) and, for reduced-precision
+    modes, `fp32_reference` (a loader for the fp32 model).
+
+    Args:
+        model_name: HuggingFace model name or path
+        dtype: 'fp32', 'bf16' or 'int8-dynamic'
+        device: Device to load onto ('int8-dynamic' needs 'cpu')
+
+    Returns:
+        Model in eval mode on device
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype: {dtype} (choose from {', '.join(DTYPES)})")
+    if dtype == 'int8-dynamic' and device != 'cpu':
+        raise ValueError("--dtype int8-dynamic is only supported on CPU")
+
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    if dtype == 'bf16':
+        model = model.to(torch.bfloat16)
+    elif dtype == 'int8-dynamic':
+        model = quantize_int8_dynamic(model)
+    model = model.to(device)
+
+    model.scoring_dtype = dtype
+    model.precision_stats = {'rows': 0, 'nonfinite': 0, 'recomputed': 0, 'unresolved': 0}
+    model.fp32_reference = None if dtype == 'fp32' else _fp32_loader(model_name, device)
+    return model
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def precision_report(model) -> Dict:
+    """dtype and non-finite row counts of a model from load_scoring_model."""
+    stats = dict(getattr(model, 'precision_stats', None) or {})
+    stats['dtype'] = getattr(model, 'scoring_dtype', 'fp32')
+    return stats
+
+
+def print_precision_report(model):
+    """Print the dtype and how many rows needed the fp32 fallback."""
+    stats = precision_report(model)
+    print(f"Precision: {stats['dtype']} (softmax, entropy and class mass in fp32)")
+    if 'rows' in stats:
+        print(f"  Rows checked:     {stats['rows']}")
+        print(f"  Non-finite rows:  {stats['nonfinite']} "
+              f"({stats['recomputed']} recomputed in fp32, {stats['unresolved']} still non-finite)")
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+BENCHMARK_CONDITIONS = ('sentence', 'jabberwocky', 'full_scrambled',
+                        'content_scrambled', 'function_scrambled', 'cue_deleted')
+
+
+def benchmark_contexts(stimuli: List[Dict], n_contexts: int) -> List[Tuple[str, str]]:
+    """(full cue context, cue family) for every condition of the locked stimuli."""
+    contexts = []
+    for stim in stimuli:
+        for condition in BENCHMARK_CONDITIONS:
+            words = stim[condition].split()
+            contexts.append((' '.join(words[:stim['cue_position'] + 1]), stim['cue_family']))
+    return contexts[:n_contexts]
+
+
+def score_mode(model_name: str, dtype: str, contexts: List[Tuple[str, str]], batch_size: int) -> Dict:
+    """Load one mode, score the contexts, and return timings and per-context metrics."""
+    import torch
+    from transformers import AutoTokenizer
+    from batched_inference import iter_next_token_probs
+    from parallel_scoring import model_size_mb
+    from run_locked_audit import WordLevelAnalyzer, TARGET_CLASSES
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    analyzer = WordLevelAnalyzer(tokenizer)
+
+    start = time.time()
+    model = load_scoring_model(model_name, dtype)
+    load_seconds = time.time() - start
+
+    n = len(contexts)
+    probs_all = [None] * n
+    entropy = np.zeros(n)
+    target_mass = np.zeros(n)
+
+    start = time.time()
+    for idx, probs, _ in iter_next_token_probs(model, tokenizer, [c for c, _ in contexts],
+                                               batch_size=batch_size):
+        probs_all[idx] = probs
+        entropy[idx] = float(-(probs * torch.log2(probs + 1e-10)).sum())
+        word_sets = TARGET_CLASSES[contexts[idx][1]]['word_sets']
+        target_mass[idx] = sum(analyzer.compute_class_mass(probs, word_sets).values())
+    seconds = time.time() - start
+
+    return {
+        'dtype': dtype,
+        'load_seconds': load_seconds,
+        'seconds': seconds,
+        'contexts_per_s': n / seconds if seconds else None,
+        'weights_mb': model_size_mb(model),
+        'probs': torch.stack(probs_all),
+        'entropy': entropy,
+        'target_mass': target_mass,
+        'precision': precision_report(model),
+    }
+
+
+def run_benchmark(model_name: str, stimuli_file: str, dtypes: Sequence[str] = DTYPES,
+                  n_contexts: int = 300, batch_size: int = 16) -> List[Dict]:
+    """
+    Score the same contexts in every mode and compare against fp32.
+
+    Returns:
+        One row per mode: throughput, weight memory, max deviations from
+        fp32 (probability, entropy in bits, target class mass), top-1
+        agreement and non-finite row counts
+    """
+    with open(stimuli_file) as f:
+        contexts = benchmark_contexts(json.load(f), n_contexts)
+
+    results = []
+    reference = None
+    for dtype in ['fp32'] + [d for d in dtypes if d != 'fp32']:
+        print(f"Scoring {len(contexts)} contexts with {dtype}...")
+        result = score_mode(model_name, dtype, contexts, batch_size)
+        if reference is None:
+            reference = dict(result)
+        probs, ref_probs = result.pop('probs'), reference['probs']
+        result.update({
+            'max_prob_dev': float((probs - ref_probs).abs().max()),
+            'max_entropy_dev': float(np.abs(result.pop('entropy') - reference['entropy']).max()),
+            'max_target_mass_dev': float(np.abs(result.pop('target_mass') - reference['target_mass']).max()),
+            'top1_agreement': float((probs.argmax(dim=-1) == ref_probs.argmax(dim=-1)).float().mean()),
+        })
+        results.append(result)
+    return results
+
+
+def print_benchmark(results: List[Dict]):
+    """Table of throughput, memory and deviation from fp32 per mode."""
+    print()
+    print("=" * 100)
+    print("REDUCED-PRECISION BENCHMARK (deviations vs fp32)")
+    print("=" * 100)
+    print(f"{'dtype':<14} {'ctx/s':>8} {'weights MB':>11} {'max |Δp|':>10} {'max |ΔH| bits':>14} "
+          f"{'max |Δmass|':>12} {'top-1 agree':>12} {'non-finite':>11}")
+    print("-" * 100)
+    for r in results:
+        p = r['precision']
+        print(f"{r['dtype']:<14} {r['contexts_per_s']:>8.1f} {r['weights_mb']:>11.1f} "
+              f"{r['max_prob_dev']:>10.2e} {r['max_entropy_dev']:>14.2e} {r['max_target_mass_dev']:>12.2e} "
+              f"{r['top1_agreement']:>12.1%} {p['nonfinite']:>5} ({p['unresolved']})")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Throughput, memory and fp32 deviation of reduced-precision scoring modes'
+    )
+    parser.add_argument('--model', type=str, default='gpt2',
+                        help='HuggingFace model name (default: gpt2)')
+    parser.add_argument('--stimuli', type=str, default='stimuli_locked.json',
+                        help='Locked stimuli JSON (default: stimuli_locked.json)')
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=list(DTYPES),
+                        help='Modes to compare; fp32 always runs as the reference (default: all)')
+    parser.add_argument('--n-contexts', type=int, default=300,
+                        help='Cue contexts to score per mode (default: 300)')
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help='Contexts per forward pass (default: 16)')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.model, args.stimuli, args.dtypes,
+                            n_contexts=args.n_contexts, batch_size=args.batch_size)
+    print_benchmark(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Prefix-Trie KV-Cache Reuse for Next-Token Scoring
+
+Locked stimuli all start with "the ...", and the SENTENCE / JABBERWOCKY /
+CUE_DELETED / CONTENT_SCRAMBLED variants of a set often share long token
+prefixes. Instead of recomputing every context from scratch, this module keeps
+the attention key/value tensors (past_key_values) of scored contexts in a
+token-level prefix trie, so a new context only runs its unshared suffix.
+
+Method:
+- Every scored token sequence is stored as one cache entry (per-layer K/V
+  tensors plus the last-position logits)
+- Each trie node points at one entry whose sequence passes through it, so the
+  deepest matching node gives the longest reusable prefix; the entry's K/V are
+  sliced to that depth and fed back as past_key_values
+- An exact repeat returns the stored logits without running the model
+- Entries are evicted least-recently-used once the memory budget is exceeded
+
+Saved FLOPs are estimated with the standard 2 × n_params per token rule.
+
+Usage:
+    from prefix_cache import PrefixKVCache
+
+    cache = PrefixKVCache(max_bytes=512 * 1024 ** 2)
+    logits = cache.next_token_logits(model, tokenizer(context)['input_ids'])
+    cache.print_report()
+"""
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from batched_inference import guard_logits, position_logits
+
+if TYPE_CHECKING:
+    import torch
+    from transformers import DynamicCache
+
+
+# ============================================================================
+# PAST_KEY_VALUES CONVERSION
+# ============================================================================
+
+def cache_to_tensors(past_key_values) -> List[Tuple['torch.Tensor', 'torch.Tensor']]:
+    """
+    Extract per-layer (key, value) tensors from a model's past_key_values.
+
+    Handles the layer-based Cache objects of recent transformers versions,
+    the key_cache/value_cache DynamicCache of 4.x, and legacy tuples.
+    """
+    if hasattr(past_key_values, 'layers'):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, 'key_cache'):
+        return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+    return [(k, v) for k, v in past_key_values]
+
+
+def tensors_to_cache(layers: List[Tuple['torch.Tensor', 'torch.Tensor']], length: int) -> 'DynamicCache':
+    """Build a fresh DynamicCache holding the first `length` positions of each layer."""
+    from transformers import DynamicCache
+
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(layers):
+        cache.update(k[:, :, :length, :], v[:, :, :length, :], layer_idx)
+    return cache
+
+
+# ============================================================================
+# PREFIX TRIE
+# ============================================================================
+
+class _TrieNode:
+    """Trie node keyed by token id; `entry` is a stored sequence through this node."""
+
+    __slots__ = ('children', 'entry')
+
+    def __init__(self):
+        self.children: Dict[int, '_TrieNode'] = {}
+        self.entry: Optional[Tuple[int, ...]] = None
+
+
+class PrefixKVCache:
+    """
+    LRU-bounded prefix cache of past_key_values for single-sequence scoring.
+
+    Attributes:
+        max_bytes: Memory budget for stored K/V and logits tensors
+        stats: Counters for lookups, hits, computed and reused tokens
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.root = _TrieNode()
+        self._entries: 'OrderedDict[Tuple[int, ...], Dict]' = OrderedDict()
+        self._bytes = 0
+        self._n_params = None
+        self.stats = {
+            'lookups': 0,
+            'exact_hits': 0,
+            'prefix_hits': 0,
+            'tokens_total': 0,
+            'tokens_computed': 0,
+            'tokens_reused': 0,
+            'evictions': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Trie bookkeeping
+    # ------------------------------------------------------------------
+
+    def _longest_prefix(self, token_ids: Tuple[int, ...]) -> Tuple[int, Optional[Tuple[int, ...]]]:
+        """Return (depth, entry key) of the deepest trie node matching token_ids."""
+        node = self.root
+        depth = 0
+        entry = None
+
+        for token_id in token_ids:
+            child = node.children.get(token_id)
+            if child is None or child.entry is None:
+                break
+            node = child
+            depth += 1
+            entry = node.entry
+
+        return depth, entry
+
+    def _insert(self, token_ids: Tuple[int, ...], layers, logits: 'torch.Tensor'):
+        """Store a scored sequence and point every node on its path at it."""
+        if token_ids in self._entries:
+            self._entries.move_to_end(token_ids)
+            return
+
+        size = logits.numel() * logits.element_size()
+        size += sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+
+        if size > self.max_bytes:
+            return
+
+        self._entries[token_ids] = {'layers': layers, 'logits': logits, 'bytes': size}
+        self._bytes += size
+
+        node = self.root
+        for token_id in token_ids:
+            node = node.children.setdefault(token_id, _TrieNode())
+            node.entry = token_ids
+
+        while self._bytes > self.max_bytes:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        """Drop the least-recently-used entry and repair the trie path it owned."""
+        token_ids, entry = self._entries.popitem(last=False)
+        self._bytes -= entry['bytes']
+        self.stats['evictions'] += 1
+
+        path = [self.root]
+        for token_id in token_ids:
+            path.append(path[-1].children[token_id])
+
+        # Walk bottom-up: hand each orphaned node to a surviving child's entry,
+        # or prune it if nothing below it survives
+        for depth in range(len(token_ids), 0, -1):
+            node = path[depth]
+            if node.entry != token_ids:
+                continue
+
+            node.entry = None
+            for child in node.children.values():
+                if child.entry is not None:
+                    node.entry = child.entry
+                    break
+
+            if node.entry is None and not node.children:
+                del path[depth - 1].children[token_ids[depth - 1]]
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def next_token_logits(self, model, token_ids: List[int]) -> 'torch.Tensor':
+        """
+        Last-position logits for one token sequence, reusing cached prefixes.
+
+        Args:
+            model: HuggingFace causal LM (in eval mode)
+            token_ids: Token ids of the context (no padding)
+
+        Returns:
+            Logits tensor of shape [vocab_size]
+        """
+        import torch
+
+        if self._n_params is None:
+            self._n_params = sum(p.numel() for p in model.parameters())
+
+        token_ids = tuple(token_ids)
+        self.stats['lookups'] += 1
+        self.stats['tokens_total'] += len(token_ids)
+
+        # Exact repeat: no forward pass at all
+        if token_ids in self._entries:
+            self._entries.move_to_end(token_ids)
+            self.stats['exact_hits'] += 1
+            self.stats['tokens_reused'] += len(token_ids)
+            return self._entries[token_ids]['logits']
+
+        depth, entry_key = self._longest_prefix(token_ids)
+        # Keep at least one token to run so the model produces logits
+        reuse = min(depth, len(token_ids) - 1)
+
+        device = next(model.parameters()).device
+        past = None
+        if reuse > 0:
+            self._entries.move_to_end(entry_key)
+            past = tensors_to_cache(self._entries[entry_key]['layers'], reuse)
+            self.stats['prefix_hits'] += 1
+
+        suffix = torch.tensor([token_ids[reuse:]], dtype=torch.long, device=device)
+
+        logits, outputs = position_logits(model, suffix, past_key_values=past, use_cache=True)
+
+        self.stats['tokens_computed'] += len(token_ids) - reuse
+        self.stats['tokens_reused'] += reuse
+
+        # A non-finite row is recomputed in fp32; its K/V are not worth keeping
+        finite = bool(torch.isfinite(logits).all())
+        logits = guard_logits(model, logits, [list(token_ids)])[0]
+        if finite:
+            layers = [(k.detach(), v.detach()) for k, v in cache_to_tensors(outputs.past_key_values)]
+            self._insert(token_ids, layers, logits)
+
+        return logits
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict:
+        """Summary statistics (hit rate, token reuse, estimated saved FLOPs)."""
+        stats = dict(self.stats)
+        lookups = max(stats['lookups'], 1)
+        tokens_total = max(stats['tokens_total'], 1)
+        n_params = self._n_params or 0
+
+        stats['hit_rate'] = (stats['exact_hits'] + stats['prefix_hits']) / lookups
+        stats['token_reuse_rate'] = stats['tokens_reused'] / tokens_total
+        stats['flops_saved'] = 2 * n_params * stats['tokens_reused']
+        stats['flops_total'] = 2 * n_params * stats['tokens_total']
+        stats['cache_entries'] = len(self._entries)
+        stats['cache_mb'] = self._bytes / 1024 ** 2
+        return stats
+
+    def print_report(self):
+        """Print the cache summary at the end of a run."""
+        stats = self.report()
+        print("KV-cache prefix reuse:")
+        print(f"  Lookups:          {stats['lookups']}")
+        print(f"  Hit rate:         {stats['hit_rate']:.1%} "
+              f"(exact {stats['exact_hits']}, prefix {stats['prefix_hits']})")
+        print(f"  Tokens reused:    {stats['tokens_reused']}/{stats['tokens_total']} "
+              f"({stats['token_reuse_rate']:.1%})")
+        print(f"  FLOPs saved:      {stats['flops_saved']:.3e} of {stats['flops_total']:.3e}")
+        print(f"  Entries / memory: {stats['cache_entries']} / {stats['cache_mb']:.1f} MB "
+              f"({stats['evictions']} evicted)")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Streaming, Crash-Resumable Result Writer
+
+Long audit runs used to keep every result in memory until the end (or
+rewrite the whole results list every few sets), so a crash near the finish
+lost hours and total I/O grew quadratically with run length.
+
+Method:
+- Every result is appended to a JSONL sidecar file as soon as it exists
+- The file is flushed after each record and fsync'ed every `fsync_every`
+  records or `fsync_interval` seconds, whichever comes first
+- In resume mode the sidecar is read back, a torn last line from a crash is
+  cut off, and the keys of completed records are handed to the caller so
+  it can skip them
+- At the end, consolidate() writes the usual JSON output ({metadata,
+  results} or a bare list) from the sidecar, so downstream analysis scripts
+  are unchanged, and deletes the sidecar once the output is fsync'ed
+
+Usage:
+    from result_writer import JsonlResultWriter, consolidate
+
+    writer = JsonlResultWriter(output_file + '.partial.jsonl',
+                               key_fields=('cue_family', 'set_id', 'condition', 'context_k'),
+                               resume=True)
+    done = writer.completed_keys
+    ...
+    writer.write(result)
+    writer.close()
+    consolidate(writer.path, output_file, metadata=metadata)
+"""
+
+import os
+import json
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def read_records(path: str) -> Iterator[Dict]:
+    """Yield records from a JSONL file, skipping a torn (unparseable) last line."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def truncate_partial_line(path: str):
+    """Cut a JSONL file back to its last complete line (after a crash mid-write)."""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+class JsonlResultWriter:
+    """
+    Append-only JSONL result sink with periodic fsync.
+
+    Attributes:
+        path: JSONL file path
+        key_fields: Record fields that identify a unit of work
+        completed_keys: Keys of records already in the file (resume mode)
+        n_written: Records appended in this session
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key_fields: Sequence[str],
+        resume: bool = False,
+        fsync_every: int = 100,
+        fsync_interval: float = 30.0,
+    ):
+        self.path = path
+        self.key_fields = tuple(key_fields)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.completed_keys: Set[Tuple] = set()
+        self.n_written = 0
+
+        if resume and os.path.exists(path):
+            truncate_partial_line(path)
+            self.completed_keys = {self.key(record) for record in read_records(path)}
+            mode = 'a'
+        else:
+            mode = 'w'
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, mode)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def key(self, record: Dict) -> Tuple:
+        """Work-unit key of a record."""
+        return tuple(record[field] for field in self.key_fields)
+
+    def write(self, record: Dict):
+        """Append one record (one line) and fsync periodically."""
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self.completed_keys.add(self.key(record))
+        self.n_written += 1
+        self._unsynced += 1
+
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def absorb(self, path: str) -> int:
+        """
+        Append the new records of another sidecar (e.g. a worker shard) and delete it.
+
+        Returns:
+            Number of records taken over
+        """
+        n = 0
+        for record in read_records(path):
+            if self.key(record) not in self.completed_keys:
+                self.write(record)
+                n += 1
+        self.sync()
+        os.remove(path)
+        return n
+
+    def sync(self):
+        """Force written records to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """Final fsync and close."""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================================================
+# CONSOLIDATION
+# ============================================================================
+
+def consolidate(
+    jsonl_path: str,
+    output_file: str,
+    metadata: Optional[Dict] = None,
+    sort_key: Optional[Callable[[Dict], object]] = None,
+    remove_sidecar: bool = True,
+) -> List[Dict]:
+    """
+    Write the final JSON output from a JSONL sidecar.
+
+    Args:
+        jsonl_path: Sidecar written by JsonlResultWriter
+        output_file: Final JSON path
+        metadata: If given, write {'metadata': ..., 'results': [...]};
+            otherwise write the bare results list
+        sort_key: Optional ordering of records (e.g. original job order)
+        remove_sidecar: Delete the sidecar once the output is durably on disk
+
+    Returns:
+        The consolidated records
+    """
+    records = list(read_records(jsonl_path))
+    if sort_key is not None:
+        records.sort(key=sort_key)
+
+    payload = records if metadata is None else {'metadata': metadata, 'results': records}
+
+    # Write to a temp file and rename so the output is never half-written
+    tmp_path = output_file + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_file)
+
+    if remove_sidecar:
+        # The rename must be on disk before the only other copy goes
+        sync_directory(output_file)
+        os.remove(jsonl_path)
+
+    return records
+
+
+def sync_directory(path: str):
+    """fsync the directory containing path, making a rename into it durable (no-op on Windows)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Columnar Results Table
+
+Audit summaries used to rescan the full results list for every (family,
+condition, k) cell, and every analysis re-parsed the audit JSON and rebuilt
+a DataFrame from per-row dicts with nested class_mass dicts. This module
+keeps result rows as one NumPy array per column, with group indexes built
+in one pass, and stores the columns as plain .npy files next to the JSON.
+
+Columns:
+- Strings (and columns mixing strings with numbers, e.g. k = 1, 2, 'full')
+  are dictionary-encoded: int32 codes into a list of categories, -1 = missing
+- Integers stay int64; floats, or integers with missing values, are float64
+  with NaN for missing
+- Nested dicts (class_mass) are flattened to one float column per key,
+  named 'class_mass.VERB' etc.
+
+Group indexes:
+- group_index(keys) combines the key columns' codes into one group id per
+  row and sorts the rows by it once (stable, so rows keep their original
+  order within a group); group_count and group_mean are single bincount
+  passes over the group ids
+- Indexes are cached per key tuple
+
+On disk (<results>.columns/ next to <results>.json):
+- one <column>.npy per column, memory-mapped on load
+- metadata.json: column kinds, categories, the run metadata, and the size
+  and mtime of the JSON it was built from; a table whose JSON has changed
+  since is stale and the JSON is parsed instead
+- Written only by run_locked_audit.py and the `table` command, so
+  analyses never create files next to the results they read
+
+Usage:
+    from results_table import ResultsTable, read_locked_results
+
+    metadata, table = read_locked_results('locked_audit_gpt2.json')
+    means = table.group_mean('target_mass', ('cue_family', 'condition', 'context_k'))
+    df = table.to_dataframe()
+
+    python results_table.py locked_audit_gpt2.json     # build/refresh and describe the table
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+TABLE_SUFFIX = '.columns'
+TABLE_VERSION = 1
+
+Keys = Union[str, Sequence[str]]
+
+
+# ============================================================================
+# GROUP INDEX
+# ============================================================================
+
+class GroupIndex:
+    """
+    Rows of a table grouped by one or more key columns.
+
+    Attributes:
+        keys: Decoded key value (tuple for several columns) of each group, in
+            order of first appearance
+        group_ids: int64 [rows], group of each row
+        order: Row indices sorted by group, original order within a group
+        offsets: int64 [groups + 1], each group's slice of order
+    """
+
+    def __init__(self, keys: List, group_ids: np.ndarray):
+        self.keys = keys
+        self.group_ids = group_ids
+        self.order = np.argsort(group_ids, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(group_ids, minlength=len(keys)))])
+        self._position = {key: i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._position
+
+    def rows(self, key) -> np.ndarray:
+        """Row indices of one group (empty if the key does not occur)."""
+        i = self._position.get(key)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
+
+    def counts(self) -> np.ndarray:
+        """Rows per group."""
+        return np.diff(self.offsets)
+
+
+# ============================================================================
+# TABLE
+# ============================================================================
+
+class ResultsTable:
+    """
+    Result rows as columns: numeric arrays and dictionary-encoded strings.
+
+    Attributes:
+        columns: {name: array}; int32 codes for categorical columns
+        categories: {name: [category, ...]} for categorical columns
+        metadata: Run metadata of the audit
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], categories: Dict[str, List[str]],
+                 metadata: Optional[Dict] = None):
+        self.columns = dict(columns)
+        self.categories = {name: list(values) for name, values in categories.items()}
+        self.metadata = metadata or {}
+        self._groups: Dict[Tuple[str, ...], GroupIndex] = {}
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_records(cls, records: List[Dict], metadata: Optional[Dict] = None,
+                     categorical: Sequence[str] = ()) -> 'ResultsTable':
+        """
+        Encode a list of result dicts (fields in order of first appearance).
+
+        Fields named in categorical are dictionary-encoded as strings even
+        when every value is a number.
+        """
+        fields: Dict[str, None] = {}
+        for record in records:
+            fields.update(dict.fromkeys(record))
+
+        columns: Dict[str, np.ndarray] = {}
+        categories: Dict[str, List[str]] = {}
+        for field in fields:
+            values = [record.get(field) for record in records]
+            present = [v for v in values if v is not None]
+            if field in categorical:
+                columns[field], categories[field] = encode(values)
+            elif present and all(isinstance(v, dict) for v in present):
+                subfields: Dict[str, None] = {}
+                for v in present:
+                    subfields.update(dict.fromkeys(v))
+                for sub in subfields:
+                    columns[f'{field}.{sub}'] = np.array(
+                        [np.nan if v is None or v.get(sub) is None else v[sub] for v in values], dtype=float)
+            elif present and all(isinstance(v, (int, float)) for v in present):
+                if len(present) == len(values) and all(isinstance(v, int) for v in present):
+                    columns[field] = np.array(values, dtype=np.int64)
+                else:
+                    columns[field] = np.array([np.nan if v is None else v for v in values], dtype=float)
+            else:
+                columns[field], categories[field] = encode(values)
+        return cls(columns, categories, metadata)
+
+    # ------------------------------------------------------------------
+    # Access
+    # ------------------------------------------------------------------
+
+    def values(self, name: str) -> np.ndarray:
+        """Decoded column (object array of strings, None for missing, if categorical)."""
+        column = self.columns[name]
+        if name not in self.categories:
+            return np.asarray(column)
+        lookup = np.array(self.categories[name] + [None], dtype=object)
+        return lookup[column]
+
+    def codes(self, name: str) -> Tuple[np.ndarray, List]:
+        """(int codes [rows], decoded value per code) of a key column; numeric columns are factorized."""
+        if name in self.categories:
+            codes = np.asarray(self.columns[name], dtype=np.int64)
+            # Missing (-1) gets its own code after the categories
+            return np.where(codes < 0, len(self.categories[name]), codes), self.categories[name] + [None]
+        uniques, inverse = np.unique(np.asarray(self.columns[name]), return_inverse=True)
+        return inverse.astype(np.int64), uniques.tolist()
+
+    def group_index(self, keys: Keys) -> GroupIndex:
+        """Group index over the key column(s), built once and cached."""
+        key_names = (keys,) if isinstance(keys, str) else tuple(keys)
+        if key_names in self._groups:
+            return self._groups[key_names]
+
+        combined = np.zeros(len(self), dtype=np.int64)
+        decoders = []
+        for name in key_names:
+            codes, decoded = self.codes(name)
+            combined = combined * len(decoded) + codes
+            decoders.append((len(decoded), decoded))
+
+        # Renumber the combined codes by first appearance
+        uniques, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+        appearance = np.argsort(first, kind='stable')
+        renumber = np.empty(len(uniques), dtype=np.int64)
+        renumber[appearance] = np.arange(len(uniques))
+
+        group_keys = []
+        for code in uniques[appearance]:
+            parts = []
+            for size, decoded in reversed(decoders):
+                code, part = divmod(int(code), size)
+                parts.append(decoded[part])
+            parts.reverse()
+            group_keys.append(parts[0] if isinstance(keys, str) else tuple(parts))
+
+        index = GroupIndex(group_keys, renumber[inverse.reshape(-1)])
+        self._groups[key_names] = index
+        return index
+
+    def group_count(self, keys: Keys) -> Dict:
+        """{key: rows} for every group, in one pass."""
+        index = self.group_index(keys)
+        return dict(zip(index.keys, index.counts().tolist()))
+
+    def group_mean(self, column: str, keys: Keys) -> Dict:
+        """{key: mean of column} for every group in one pass (NaN values skipped)."""
+        index = self.group_index(keys)
+        values = np.asarray(self.columns[column], dtype=float)
+        valid = ~np.isnan(values)
+        sums = np.bincount(index.group_ids[valid], weights=values[valid], minlength=len(index))
+        counts = np.bincount(index.group_ids[valid], minlength=len(index))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        return dict(zip(index.keys, means.tolist()))
+
+    def to_dataframe(self):
+        """pandas DataFrame of the decoded columns."""
+        import pandas as pd
+
+        return pd.DataFrame({name: self.values(name) for name in self.columns})
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def save(self, directory: str, source: Optional[str] = None):
+        """
+        Write the table atomically (temp dir + rename), replacing an older copy.
+
+        Args:
+            directory: Target directory
+            source: JSON the table mirrors; its size and mtime are recorded
+                for the staleness check
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+
+        for i, (name, column) in enumerate(self.columns.items()):
+            np.save(os.path.join(tmp_dir, f'{i}.npy'), np.asarray(column))
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+            json.dump({
+                'version': TABLE_VERSION,
+                'columns': list(self.columns),
+                'categories': self.categories,
+                'source': source_stamp(source) if source else None,
+                'metadata': self.metadata,
+            }, f, indent=2)
+
+        old_dir = None
+        if os.path.exists(directory):
+            old_dir = tempfile.mkdtemp(dir=parent, prefix='.old_')
+            os.rename(directory, os.path.join(old_dir, 'table'))
+        os.rename(tmp_dir, directory)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: str) -> 'ResultsTable':
+        """Memory-map a saved table."""
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            meta = json.load(f)
+        columns = {
+            name: np.load(os.path.join(directory, f'{i}.npy'), mmap_mode='r')
+            for i, name in enumerate(meta['columns'])
+        }
+        return cls(columns, meta['categories'], meta['metadata'])
+
+
+def encode(values: Sequence) -> Tuple[np.ndarray, List[str]]:
+    """Dictionary-encode values as strings: (int32 codes, categories); None -> -1."""
+    categories: Dict[str, int] = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        codes[i] = -1 if v is None else categories.setdefault(str(v), len(categories))
+    return codes, list(categories)
+
+
+# ============================================================================
+# FILES
+# ============================================================================
+
+def table_path(results_file: str) -> str:
+    """Directory of the columnar copy of a results JSON."""
+    return os.path.splitext(results_file)[0] + TABLE_SUFFIX
+
+
+def source_stamp(path: str) -> Dict:
+    """Size and mtime of a file, to detect a table built from an older version."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_fresh_table(results_file: str) -> Optional[ResultsTable]:
+    """The saved table of results_file, or None if missing, stale or from another version."""
+    directory = table_path(results_file)
+    try:
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != TABLE_VERSION or meta.get('source') != source_stamp(results_file):
+            return None
+        return ResultsTable.load(directory)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_locked_results(results_file: str, save: bool = False) -> Tuple[Dict, ResultsTable]:
+    """
+    (metadata, table) of a locked audit, from its columnar copy when fresh.
+
+    Otherwise the JSON is parsed. Only with save=True (the `table` command)
+    is the table then written next to the JSON; analyses never leave files
+    beside their input.
+    """
+    table = load_fresh_table(results_file)
+    if table is not None:
+        return table.metadata, table
+
+    with open(results_file) as f:
+        data = json.load(f)
+    table = ResultsTable.from_records(data['results'], data['metadata'])
+    if save:
+        table.save(table_path(results_file), source=results_file)
+    return table.metadata, table
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build (or refresh) and describe the columnar table of locked audit results'
+    )
+    parser.add_argument('results_files', nargs='+', help='Locked audit result JSONs')
+    args = parser.parse_args()
+
+    for results_file in args.results_files:
+        fresh = load_fresh_table(results_file) is not None
+        start = time.time()
+        metadata, table = read_locked_results(results_file, save=True)
+        seconds = time.time() - start
+
+        print(f"{results_file} -> {table_path(results_file)} "
+              f"({'loaded' if fresh else 'built'} in {seconds * 1000:.1f} ms)")
+        print(f"  Model: {metadata.get('model')}  Rows: {len(table)}")
+        for name in table.column_names:
+            kind = (f"category ({len(table.categories[name])})" if name in table.categories
+                    else str(table.columns[name].dtype))
+            print(f"    {name:<28} {kind}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
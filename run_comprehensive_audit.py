@@ -12,12 +12,13 @@ Output: Structured results for statistical analysis with FDR correction and boot
 
 import json
 import argparse
-import torch
 from tqdm import tqdm
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from cue_families import CUE_FAMILIES
 from word_level_analysis import WordLevelAnalyzer
+from distribution_cache import make_dist_cache
+from distribution_store import make_store_writer
+from precision import DTYPES, load_scoring_model, precision_report, print_precision_report
 
 
 # ============================================================================
@@ -53,6 +54,11 @@ def run_comprehensive_audit(
     output_file: str,
     method: str = 'lexicon',
     top_k: int = 1000,
+    full_context: bool = False,
+    dist_cache_mb: int = 0,
+    dist_cache_topk: int = 0,
+    dump_distributions: str = None,
+    dtype: str = 'fp32',
 ):
     """
     Run comprehensive morphosyntax audit.
@@ -63,7 +69,18 @@ def run_comprehensive_audit(
         output_file: Path to save results JSON
         method: Classification method ('lexicon', 'pos', 'classifier')
         top_k: Number of top tokens to consider
+        full_context: Score all cue positions of a text from a single forward
+            pass instead of one pass per cue prefix
+        dist_cache_mb: Disk budget (MB) for the persistent next-token
+            distribution cache (0 = off)
+        dist_cache_topk: Tokens stored per cached distribution (0 = full vector)
+        dump_distributions: Directory for a float16 distribution store of
+            every cue context (see distribution_store; None = off)
+        dtype: Inference precision, 'fp32', 'bf16' or 'int8-dynamic' (see
+            precision; metrics are always computed in fp32)
     """
+    import torch
+
     print("=" * 80)
     print("COMPREHENSIVE MORPHOSYNTAX CONSTRAINT AUDIT")
     print("=" * 80)
@@ -71,21 +88,25 @@ def run_comprehensive_audit(
     print(f"Model: {model_name}")
     print(f"Stimuli: {stimuli_file}")
     print(f"Method: {method}")
+    print(f"Full-context mode: {full_context}")
+    print(f"Precision: {dtype}")
     print(f"Output: {output_file}")
     print()
 
     # Load model and tokenizer
+    from transformers import AutoTokenizer
+
     print("Loading model...")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.eval()
 
-    if torch.cuda.is_available():
-        model = model.cuda()
+    if torch.cuda.is_available() and dtype != 'int8-dynamic':
+        model = load_scoring_model(model_name, dtype, 'cuda')
         print("✓ Using GPU")
     else:
+        model = load_scoring_model(model_name, dtype)
         print("✓ Using CPU")
 
+    dist_cache = make_dist_cache(model, model_name, dist_cache_mb, dist_cache_topk)
     print()
 
     # Load stimuli
@@ -98,7 +119,7 @@ def run_comprehensive_audit(
 
     # Create analyzer
     print("Initializing word-level analyzer...")
-    analyzer = WordLevelAnalyzer(tokenizer, CUE_FAMILIES)
+    analyzer = WordLevelAnalyzer(tokenizer, CUE_FAMILIES, dist_cache=dist_cache)
     print("✓ Analyzer ready")
     print()
 
@@ -109,6 +130,8 @@ def run_comprehensive_audit(
     print()
 
     results = []
+    store = make_store_writer(dump_distributions, model_name, source='run_comprehensive_audit',
+                              stimuli_file=stimuli_file)
     total_combinations = len(stimuli) * len(CONDITION_MAP) * len(CUE_FAMILY_NAMES)
 
     with tqdm(total=total_combinations, desc="Progress") as pbar:
@@ -119,12 +142,23 @@ def run_comprehensive_audit(
             for cond_key, cond_name in CONDITION_MAP.items():
                 text = stim_set[cond_key]
 
+                # Full-context mode: one forward pass covers every family
+                if full_context:
+                    all_cue_results = analyzer.analyze_all_cue_predictions(
+                        text, CUE_FAMILY_NAMES, model, top_k=top_k,
+                        return_probs=store is not None
+                    )
+
                 # For each cue family
                 for family_name in CUE_FAMILY_NAMES:
                     # Analyze predictions after cues
-                    cue_results = analyzer.analyze_cue_predictions(
-                        text, family_name, model, top_k=top_k
-                    )
+                    if full_context:
+                        cue_results = all_cue_results[family_name]
+                    else:
+                        cue_results = analyzer.analyze_cue_predictions(
+                            text, family_name, model, top_k=top_k,
+                            return_probs=store is not None
+                        )
 
                     # Store results for each cue instance
                     for cue_res in cue_results:
@@ -141,8 +175,23 @@ def run_comprehensive_audit(
                         }
                         results.append(result_entry)
 
+                        if store is not None:
+                            store.add(cue_res['probs'], {
+                                'result_index': len(results) - 1,
+                                'set_id': set_id,
+                                'condition': cond_name,
+                                'cue_family': family_name,
+                                'cue_word': cue_res['cue_word'],
+                                'cue_position': cue_res['word_index'],
+                                'context_k': 'full',
+                                'context': cue_res['context'],
+                            })
+
                     pbar.update(1)
 
+    if store is not None:
+        store.close()
+
     print()
     print("=" * 80)
     print("AUDIT COMPLETE")
@@ -171,6 +220,13 @@ def run_comprehensive_audit(
 
     print()
 
+    if dist_cache is not None:
+        dist_cache.print_report()
+        print()
+
+    print_precision_report(model)
+    print()
+
     # Save results
     print(f"Saving results to: {output_file}")
     with open(output_file, 'w') as f:
@@ -180,6 +236,11 @@ def run_comprehensive_audit(
                 'stimuli_file': stimuli_file,
                 'method': method,
                 'top_k': top_k,
+                'full_context': full_context,
+                'dist_cache': dist_cache.report() if dist_cache is not None else None,
+                'distribution_store': dump_distributions,
+                'dtype': dtype,
+                'precision': precision_report(model),
                 'num_stimulus_sets': len(stimuli),
                 'num_conditions': len(CONDITION_MAP),
                 'num_cue_families': len(CUE_FAMILY_NAMES),
@@ -240,7 +301,42 @@ def main():
         '--top-k',
         type=int,
         default=1000,
-        help='Number of top tokens to consider (default: 1000)'
+        help='Number of top tokens to consider, 0 = full vocabulary (default: 1000)'
+    )
+
+    parser.add_argument(
+        '--full-context',
+        action='store_true',
+        help='Score every cue position from one forward pass per text'
+    )
+
+    parser.add_argument(
+        '--dist-cache-mb',
+        type=int,
+        default=0,
+        help='Cache next-token distributions on disk within this budget in MB (default: 0 = off)'
+    )
+
+    parser.add_argument(
+        '--dist-cache-topk',
+        type=int,
+        default=0,
+        help='Store only the top-k log-probs plus residual mass per cached distribution (default: 0 = full vector)'
+    )
+
+    parser.add_argument(
+        '--dump-distributions',
+        type=str,
+        default=None,
+        help='Directory to dump every next-token distribution to, for distribution_store reanalysis (default: off)'
+    )
+
+    parser.add_argument(
+        '--dtype',
+        type=str,
+        choices=DTYPES,
+        default='fp32',
+        help='Inference precision; softmax, entropy and class mass stay fp32 (default: fp32)'
     )
 
     args = parser.parse_args()
@@ -257,6 +353,11 @@ def main():
         output_file=args.output,
         method=args.method,
         top_k=args.top_k,
+        full_context=args.full_context,
+        dist_cache_mb=args.dist_cache_mb,
+        dist_cache_topk=args.dist_cache_topk,
+        dump_distributions=args.dump_distributions,
+        dtype=args.dtype,
     )
 
 
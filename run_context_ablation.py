@@ -13,17 +13,24 @@ Method:
 Scope (focused):
 - 2 cue families: infinitival_to, determiners
 - 2-3 conditions: JABBERWOCKY, FUNCTION_SCRAMBLED, FULL_SCRAMBLED
+
+Usage:
+    python run_context_ablation.py --model gpt2
+    python run_context_ablation.py --model gpt2 --batch-size 4 --pack-tokens 64
 """
 
 import json
 import argparse
-import torch
 import numpy as np
 from tqdm import tqdm
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from cue_families import CUE_FAMILIES
 from word_level_analysis import WordLevelAnalyzer
+from batched_inference import iter_next_token_probs
+from distribution_cache import make_dist_cache
+from autotune import print_settings, resolve_settings
+from precision import DTYPES, load_scoring_model, print_precision_report
+from results_table import ResultsTable
 
 
 # ============================================================================
@@ -86,19 +93,21 @@ def compute_entropy(probs, analyzer):
     Returns:
         Entropy in bits
     """
+    import torch
+
     # Get top-k word-start tokens
     top_k = 1000
     top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
 
-    # Filter to word-start only
-    word_start_probs = []
-
-    for prob, token_id in zip(top_k_probs, top_k_ids):
-        if analyzer.is_word_start_token(token_id.item()):
-            word_start_probs.append(prob.item())
+    # Filter to word-start only (vectorized lookup in the vocab annotations)
+    top_k_ids = top_k_ids.cpu().numpy()
+    is_word_start = analyzer.annotations.is_word_start
+    in_vocab = top_k_ids < len(is_word_start)
+    word_start_mask = np.zeros(len(top_k_ids), dtype=bool)
+    word_start_mask[in_vocab] = is_word_start[top_k_ids[in_vocab]]
 
     # Normalize
-    word_start_probs = np.array(word_start_probs)
+    word_start_probs = top_k_probs.cpu().double().numpy()[word_start_mask]
     if len(word_start_probs) == 0:
         return np.nan
 
@@ -119,6 +128,12 @@ def run_context_ablation(
     stimuli_file: str,
     output_file: str,
     top_k: int = 1000,
+    dist_cache_mb: int = 0,
+    dist_cache_topk: int = 0,
+    dtype: str = 'fp32',
+    batch_size: int = 1,
+    pack_tokens: int = 0,
+    threads: int = 0,
 ):
     """
     Run context-length ablation analysis.
@@ -128,7 +143,18 @@ def run_context_ablation(
         stimuli_file: Path to stimuli JSON
         output_file: Path to save results CSV
         top_k: Number of top tokens to consider
+        dist_cache_mb: Disk budget (MB) for the persistent next-token
+            distribution cache (0 = off)
+        dist_cache_topk: Tokens stored per cached distribution (0 = full vector)
+        dtype: Inference precision, 'fp32', 'bf16' or 'int8-dynamic' (see
+            precision; metrics are always computed in fp32)
+        batch_size: Contexts (or packed rows) per forward pass
+        pack_tokens: Concatenate contexts into packed rows of up to this many
+            tokens with block-diagonal causal masks (0 = off; see sequence_packing)
+        threads: torch intra-op threads (0 = torch default)
     """
+    import torch
+
     print("=" * 80)
     print("CONTEXT-LENGTH ABLATION ANALYSIS")
     print("=" * 80)
@@ -138,20 +164,31 @@ def run_context_ablation(
     print(f"Cue families: {TARGET_CUE_FAMILIES}")
     print(f"Conditions: {TARGET_CONDITIONS}")
     print(f"Context lengths (k): {CONTEXT_K_VALUES}")
+    print(f"Precision: {dtype}")
+    print(f"Batch size: {batch_size}")
+    print(f"Packing: {f'{pack_tokens} tokens per row' if pack_tokens > 0 else 'off'}")
+    print(f"Threads: {threads or 'torch default'}")
     print(f"Output: {output_file}")
     print()
 
+    if threads > 0:
+        torch.set_num_threads(threads)
+
     # Load model
+    from transformers import AutoTokenizer
+
     print("Loading model...")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.eval()
 
-    if torch.cuda.is_available():
-        model = model.cuda()
+    if torch.cuda.is_available() and dtype != 'int8-dynamic':
+        device = 'cuda'
+        model = load_scoring_model(model_name, dtype, device)
         print("✓ Using GPU")
     else:
+        device = 'cpu'
+        model = load_scoring_model(model_name, dtype)
         print("✓ Using CPU")
+    dist_cache = make_dist_cache(model, model_name, dist_cache_mb, dist_cache_topk)
     print()
 
     # Load stimuli
@@ -172,11 +209,11 @@ def run_context_ablation(
     print("=" * 80)
     print()
 
-    results = []
-
-    # Count total iterations
-    total_iterations = 0
+    # Collect every (cue, k) context up front, so they can be scored in batches
+    jobs = []
     for stim_set in stimuli:
+        set_id = stim_set['set_id']
+
         for cond_key, cond_name in CONDITION_MAP.items():
             if cond_name not in TARGET_CONDITIONS:
                 continue
@@ -184,73 +221,57 @@ def run_context_ablation(
             text = stim_set[cond_key]
 
             for family_name in TARGET_CUE_FAMILIES:
-                # Find cues
+                # Find cue positions
                 cue_positions = analyzer.find_cue_positions(text, family_name)
-                total_iterations += len(cue_positions) * len(CONTEXT_K_VALUES)
-
-    with tqdm(total=total_iterations, desc="Progress") as pbar:
-        for stim_set in stimuli:
-            set_id = stim_set['set_id']
-
-            for cond_key, cond_name in CONDITION_MAP.items():
-                if cond_name not in TARGET_CONDITIONS:
-                    continue
 
-                text = stim_set[cond_key]
-
-                for family_name in TARGET_CUE_FAMILIES:
-                    # Find cue positions
-                    cue_positions = analyzer.find_cue_positions(text, family_name)
-
-                    for word_idx, cue_word, full_context in cue_positions:
-                        # Test each context length k
-                        for k in CONTEXT_K_VALUES:
-                            # Truncate to last k words
-                            context_k = get_k_word_suffix(full_context, k)
-
-                            # Tokenize
-                            inputs = tokenizer(context_k, return_tensors='pt')
-                            if torch.cuda.is_available():
-                                inputs = {key: val.cuda() for key, val in inputs.items()}
-
-                            # Get predictions
-                            with torch.no_grad():
-                                outputs = model(**inputs)
-
-                            logits = outputs.logits[0, -1, :]
-                            probs = torch.softmax(logits, dim=-1)
-
-                            # Compute class mass
-                            class_mass = analyzer.compute_class_mass(probs, family_name, top_k=top_k)
-
-                            # Get primary class mass (e.g., VERB for infinitival_to)
-                            family_spec = CUE_FAMILIES[family_name]
-                            primary_class = family_spec['primary_class']
-                            target_mass = class_mass.get(primary_class, 0.0)
-
-                            # Compute total mass on all expected classes (open-class mass)
-                            open_class_mass = sum(class_mass.values())
-
-                            # Compute entropy
-                            entropy = compute_entropy(probs, analyzer)
-
-                            # Store result
-                            results.append({
-                                'model': model_name,
-                                'cue_family': family_name,
-                                'condition': cond_name,
-                                'sentence_id': set_id,
-                                'cue_index': word_idx,
-                                'cue_word': cue_word,
-                                'k': k if k is not None else 'full',
-                                'context_truncated': context_k,
-                                'target_mass': target_mass,
-                                'open_class_mass': open_class_mass,
-                                'entropy': entropy,
-                                'num_tokens': len(inputs['input_ids'][0]),
-                            })
-
-                            pbar.update(1)
+                for word_idx, cue_word, full_context in cue_positions:
+                    # Test each context length k
+                    for k in CONTEXT_K_VALUES:
+                        # Truncate to last k words
+                        context_k = get_k_word_suffix(full_context, k)
+                        jobs.append((set_id, cond_name, family_name, word_idx, cue_word, k, context_k))
+
+    results = [None] * len(jobs)
+
+    with tqdm(total=len(jobs), desc="Progress") as pbar:
+        # Predictions (LM head at the last position only), streamed bucket by bucket
+        for idx, probs, num_tokens in iter_next_token_probs(
+            model, tokenizer, [job[-1] for job in jobs], batch_size=batch_size,
+            device=device, dist_cache=dist_cache, pack_tokens=pack_tokens,
+        ):
+            set_id, cond_name, family_name, word_idx, cue_word, k, context_k = jobs[idx]
+
+            # Compute class mass
+            class_mass = analyzer.compute_class_mass(probs, family_name, top_k=top_k)
+
+            # Get primary class mass (e.g., VERB for infinitival_to)
+            family_spec = CUE_FAMILIES[family_name]
+            primary_class = family_spec['primary_class']
+            target_mass = class_mass.get(primary_class, 0.0)
+
+            # Compute total mass on all expected classes (open-class mass)
+            open_class_mass = sum(class_mass.values())
+
+            # Compute entropy
+            entropy = compute_entropy(probs, analyzer)
+
+            # Store result
+            results[idx] = {
+                'model': model_name,
+                'cue_family': family_name,
+                'condition': cond_name,
+                'sentence_id': set_id,
+                'cue_index': word_idx,
+                'cue_word': cue_word,
+                'k': k if k is not None else 'full',
+                'context_truncated': context_k,
+                'target_mass': target_mass,
+                'open_class_mass': open_class_mass,
+                'entropy': entropy,
+                'num_tokens': num_tokens,
+            }
+
+            pbar.update(1)
 
     print()
     print("=" * 80)
@@ -262,16 +283,22 @@ def run_context_ablation(
     print(f"Total measurements: {len(results)}")
     print()
 
-    # Breakdown
+    # Breakdown: one counting pass per key over the columnar table (k as
+    # strings, '1' ... 'full', as in the CSV)
+    table = ResultsTable.from_records(results, categorical=('k',))
+    condition_counts = table.group_count('condition') if results else {}
+    family_counts = table.group_count('cue_family') if results else {}
+    k_counts = table.group_count('k') if results else {}
+
     print("Measurements per condition:")
     for cond in TARGET_CONDITIONS:
-        n = sum(1 for r in results if r['condition'] == cond)
+        n = condition_counts.get(cond, 0)
         print(f"  {cond:20s}: {n:4d}")
     print()
 
     print("Measurements per cue family:")
     for family in TARGET_CUE_FAMILIES:
-        n = sum(1 for r in results if r['cue_family'] == family)
+        n = family_counts.get(family, 0)
         family_spec = CUE_FAMILIES[family]
         print(f"  {family_spec['name']:30s}: {n:4d}")
     print()
@@ -279,7 +306,7 @@ def run_context_ablation(
     print("Measurements per k:")
     for k in CONTEXT_K_VALUES:
         k_label = k if k is not None else 'full'
-        n = sum(1 for r in results if r['k'] == k_label)
+        n = k_counts.get(str(k_label), 0)
         print(f"  k={str(k_label):>4s}: {n:4d}")
     print()
 
@@ -293,36 +320,44 @@ def run_context_ablation(
     print("✓ Results saved")
     print()
 
+    if dist_cache is not None:
+        dist_cache.print_report()
+        print()
+
+    print_precision_report(model)
+    print()
+
     # Quick summary statistics
     print("=" * 80)
     print("QUICK SUMMARY (mean target_mass by k)")
     print("=" * 80)
     print()
 
+    # Rows of every (family, condition, k) cell from one group index
+    cells = table.group_index(('cue_family', 'condition', 'k')) if results else None
+    family_conditions = table.group_count(('cue_family', 'condition')) if results else {}
+    target_mass = table.columns['target_mass'] if results else None
+
     for family in TARGET_CUE_FAMILIES:
         family_spec = CUE_FAMILIES[family]
         print(f"{family_spec['name']}:")
         print()
 
-        df_family = df[df['cue_family'] == family]
-
         for cond in TARGET_CONDITIONS:
-            df_cond = df_family[df_family['condition'] == cond]
-
-            if len(df_cond) == 0:
+            if (family, cond) not in family_conditions:
                 continue
 
             print(f"  {cond}:")
 
             for k in CONTEXT_K_VALUES:
                 k_label = k if k is not None else 'full'
-                df_k = df_cond[df_cond['k'] == k_label]
+                masses = target_mass[cells.rows((family, cond, str(k_label)))]
 
-                if len(df_k) == 0:
+                if len(masses) == 0:
                     continue
 
-                mean = df_k['target_mass'].mean()
-                std = df_k['target_mass'].std()
+                mean = masses.mean()
+                std = masses.std(ddof=1) if len(masses) > 1 else np.nan
                 print(f"    k={str(k_label):>4s}: {mean:.4f} ± {std:.4f}")
 
             print()
@@ -369,7 +404,57 @@ def main():
         '--top-k',
         type=int,
         default=1000,
-        help='Number of top tokens to consider (default: 1000)'
+        help='Number of top tokens to consider, 0 = full vocabulary (default: 1000)'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='Contexts per forward pass, grouped into length buckets (default: autotuned, else 1)'
+    )
+
+    parser.add_argument(
+        '--pack-tokens',
+        type=int,
+        default=None,
+        help='Pack contexts into rows of up to this many tokens with block-diagonal masks; '
+             '--batch-size then counts packed rows (default: autotuned, else 0 = off)'
+    )
+
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=None,
+        help='torch intra-op threads (default: autotuned, else 0 = torch default)'
+    )
+
+    parser.add_argument(
+        '--no-autotune',
+        action='store_true',
+        help='Ignore the settings saved by autotune.py for this host and model'
+    )
+
+    parser.add_argument(
+        '--dist-cache-mb',
+        type=int,
+        default=0,
+        help='Cache next-token distributions on disk within this budget in MB (default: 0 = off)'
+    )
+
+    parser.add_argument(
+        '--dist-cache-topk',
+        type=int,
+        default=0,
+        help='Store only the top-k log-probs plus residual mass per cached distribution (default: 0 = full vector)'
+    )
+
+    parser.add_argument(
+        '--dtype',
+        type=str,
+        choices=DTYPES,
+        default=None,
+        help='Inference precision; softmax, entropy and class mass stay fp32 (default: autotuned, else fp32)'
     )
 
     args = parser.parse_args()
@@ -379,12 +464,25 @@ def main():
         model_slug = args.model.replace('/', '_')
         args.output = f'context_ablation_{model_slug}.csv'
 
+    # Unset batch size / threads / packing / dtype come from autotune.py's config
+    settings = resolve_settings(
+        args.model, batch_size=args.batch_size, threads=args.threads, pack_tokens=args.pack_tokens,
+        dtype=args.dtype, autotune=not args.no_autotune,
+    )
+    print_settings(args.model, settings)
+
     # Run ablation
     run_context_ablation(
         model_name=args.model,
         stimuli_file=args.stimuli,
         output_file=args.output,
         top_k=args.top_k,
+        dist_cache_mb=args.dist_cache_mb,
+        dist_cache_topk=args.dist_cache_topk,
+        dtype=settings['dtype'],
+        batch_size=settings['batch_size'],
+        pack_tokens=settings['pack_tokens'],
+        threads=settings['threads'],
     )
 
 
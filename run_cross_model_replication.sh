@@ -9,6 +9,10 @@
 # - Pythia-160m (160M)
 # - Pythia-410m (410M)
 #
+# Jobs are run through the SQLite job queue (job_queue.py), so an interrupted
+# sweep picks up where it stopped when this script is run again.
+# Set CONCURRENCY / MEMORY_MB to run several models at once.
+#
 
 set -e  # Exit on error
 
@@ -42,54 +46,28 @@ fi
 echo "✓ Found stimuli_comprehensive.json"
 echo ""
 
-# Run each model
+# Enqueue audit → analysis for each model (models with existing output only get analysis)
+MODEL_ARGS=()
 for MODEL in "${MODELS[@]}"; do
-    # Create safe filename
-    MODEL_SLUG=$(echo "$MODEL" | tr '/' '_')
-    OUTPUT_FILE="comprehensive_audit_${MODEL_SLUG}.json"
-
-    echo "================================================================================"
-    echo "MODEL: $MODEL"
-    echo "================================================================================"
-    echo "Output: $OUTPUT_FILE"
-    echo "Started: $(date '+%Y-%m-%d %H:%M:%S')"
-    echo ""
-
-    # Check if already complete
-    if [ -f "$OUTPUT_FILE" ]; then
-        echo "⚠ Output file already exists. Skipping."
-        echo "   (Delete $OUTPUT_FILE to re-run)"
-        echo ""
-        continue
-    fi
-
-    # Run audit
-    python3 run_comprehensive_audit.py \
-        --model "$MODEL" \
-        --stimuli stimuli_comprehensive.json \
-        --output "$OUTPUT_FILE" \
-        --method lexicon \
-        --top-k 1000
-
-    EXIT_CODE=$?
+    MODEL_ARGS+=(--model "$MODEL")
+done
+python3 job_queue.py sweep --pipeline comprehensive "${MODEL_ARGS[@]}" --top-k 1000
 
-    if [ $EXIT_CODE -eq 0 ]; then
-        echo ""
-        echo "✓ $MODEL complete!"
-        echo "  Results saved to: $OUTPUT_FILE"
-        echo "  Completed: $(date '+%Y-%m-%d %H:%M:%S')"
-        echo ""
-    else
-        echo ""
-        echo "✗ $MODEL failed with exit code $EXIT_CODE"
-        echo ""
-        exit $EXIT_CODE
-    fi
+# Run the queue: crashed audits (e.g. SIGBUS) are retried, analysis runs as each audit finishes
+# Check progress from another terminal with: python3 job_queue.py status
+EXIT_CODE=0
+python3 job_queue.py run --concurrency "${CONCURRENCY:-1}" --memory-mb "${MEMORY_MB:-0}" || EXIT_CODE=$?
 
-    # Brief pause between models
-    sleep 5
-done
+if [ $EXIT_CODE -ne 0 ]; then
+    echo ""
+    echo "✗ Some jobs failed or were skipped (exit code $EXIT_CODE)"
+    echo "  Inspect with: python3 job_queue.py status"
+    echo "  Re-queue with: python3 job_queue.py retry <job ids>, then run this script again"
+    echo ""
+    exit $EXIT_CODE
+fi
 
+echo ""
 echo "================================================================================"
 echo "ALL MODELS COMPLETE!"
 echo "================================================================================"
@@ -104,23 +82,4 @@ for MODEL in "${MODELS[@]}"; do
         echo "  ✗ $OUTPUT_FILE (MISSING)"
     fi
 done
-
-echo ""
-echo "================================================================================"
-echo "NEXT STEP: ANALYZE RESULTS"
-echo "================================================================================"
-echo ""
-echo "Run statistical analysis for each model:"
-echo ""
-
-for MODEL in "${MODELS[@]}"; do
-    MODEL_SLUG=$(echo "$MODEL" | tr '/' '_')
-    OUTPUT_FILE="comprehensive_audit_${MODEL_SLUG}.json"
-    if [ -f "$OUTPUT_FILE" ]; then
-        echo "  python3 analyze_comprehensive_results.py $OUTPUT_FILE"
-    fi
-done
-
-echo ""
-echo "This will generate comparison tables and plots for each model."
 echo ""
@@ -3,13 +3,12 @@ Main experiment script for morphosyntax constraint testing.
 Uses OpenAI API to collect logprobs and calculate entropy.
 """
 
-import openai
 import numpy as np
 import json
 import os
-from scipy.stats import entropy as scipy_entropy
-import time
-from pathlib import Path
+import argparse
+
+from openai_logprobs import LogprobClient
 
 # Try to load from .env file if it exists
 try:
@@ -18,9 +17,6 @@ try:
 except ImportError:
     pass  # python-dotenv not installed, will use environment variable
 
-# Configure OpenAI API
-openai.api_key = os.environ.get("OPENAI_API_KEY")
-
 def calculate_entropy(logprobs_list):
     """
     Calculate Shannon entropy from a list of logprobs.
@@ -38,89 +34,98 @@ def calculate_entropy(logprobs_list):
     entropy = -sum(p * np.log2(p) if p > 0 else 0 for p in probs)
     return entropy
 
-def get_sequence_logprobs(text, model="gpt-3.5-turbo"):
+def summarize_logprobs(content_logprobs):
     """
-    Get logprobs for each token in the text using OpenAI chat completions.
+    Entropy and top-1 summaries from a chat completion's logprobs.content.
+
+    Args:
+        content_logprobs: List of {'token', 'logprob', 'top_logprobs'} dicts
+            (as returned by openai_logprobs.LogprobClient)
 
     Returns:
         dict with token_entropies, top1_probs, tokens, etc.
     """
-    try:
-        # Use chat completions with logprobs
-        # We send the text as a user message and set max_tokens=1 to just get input logprobs
-        response = openai.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": text}],
-            max_tokens=1,  # We only care about the prompt tokens
-            logprobs=True,
-            top_logprobs=20  # Get top 20 token probabilities
-        )
-
-        # Extract logprobs from the response
-        # In the current API, logprobs are in response.choices[0].logprobs.content
-        if not response.choices[0].logprobs or not response.choices[0].logprobs.content:
-            print(f"Warning: No logprobs returned for text: {text[:50]}...")
-            return None
-
-        content_logprobs = response.choices[0].logprobs.content
-
-        token_entropies = []
-        top1_probs = []
-        top1_tokens = []
-        tokens = []
-
-        # Process each token position
-        for token_data in content_logprobs:
-            # Get the token
-            token = token_data.token
-            tokens.append(token)
-
-            # Get top logprobs for this position
-            top_logprobs = token_data.top_logprobs
-
-            if top_logprobs:
-                # Extract logprob values
-                logprob_values = [item.logprob for item in top_logprobs]
-
-                # Calculate entropy
-                token_entropy = calculate_entropy(logprob_values)
-                token_entropies.append(token_entropy)
-
-                # Get top-1 probability
-                top1_prob = np.exp(logprob_values[0])
-                top1_probs.append(top1_prob)
-                top1_tokens.append(top_logprobs[0].token)
-
-        return {
-            'tokens': tokens,
-            'token_entropies': token_entropies,
-            'mean_entropy': np.mean(token_entropies) if token_entropies else 0,
-            'top1_probs': top1_probs,
-            'mean_top1': np.mean(top1_probs) if top1_probs else 0,
-            'num_tokens': len(tokens)
-        }
+    token_entropies = []
+    top1_probs = []
+    top1_tokens = []
+    tokens = []
+
+    # Process each token position
+    for token_data in content_logprobs:
+        # Get the token
+        token = token_data['token']
+        tokens.append(token)
+
+        # Get top logprobs for this position
+        top_logprobs = token_data['top_logprobs']
+
+        if top_logprobs:
+            # Extract logprob values
+            logprob_values = [item['logprob'] for item in top_logprobs]
+
+            # Calculate entropy
+            token_entropy = calculate_entropy(logprob_values)
+            token_entropies.append(token_entropy)
+
+            # Get top-1 probability
+            top1_prob = np.exp(logprob_values[0])
+            top1_probs.append(top1_prob)
+            top1_tokens.append(top_logprobs[0]['token'])
+
+    return {
+        'tokens': tokens,
+        'token_entropies': token_entropies,
+        'mean_entropy': np.mean(token_entropies) if token_entropies else 0,
+        'top1_probs': top1_probs,
+        'mean_top1': np.mean(top1_probs) if top1_probs else 0,
+        'num_tokens': len(tokens)
+    }
+
+def get_sequence_logprobs(text, model="gpt-3.5-turbo", client=None):
+    """
+    Get logprobs for each token in the text using OpenAI chat completions.
 
-    except Exception as e:
-        print(f"Error processing text '{text[:50]}...': {e}")
+    We send the text as a user message and set max_tokens=1 to just get
+    input logprobs (top 20 token probabilities per position).
+
+    Returns:
+        dict with token_entropies, top1_probs, tokens, etc. (None on failure)
+    """
+    client = client or LogprobClient(model=model)
+    content_logprobs = client.get(text, top_logprobs=20, max_tokens=1)
+    if content_logprobs is None:
         return None
+    return summarize_logprobs(content_logprobs)
 
-def run_experiment(stimuli_file="stimuli.json", output_file="experiment_results.json", model="gpt-3.5-turbo"):
+def run_experiment(stimuli_file="stimuli.json", output_file="experiment_results.json", model="gpt-3.5-turbo",
+                   concurrency=8, rpm=500, base_url=None):
     """
     Run the full experiment on all stimuli.
+
+    All (set, condition) requests are sent concurrently through
+    openai_logprobs.LogprobClient (rate-limited, retried and cached on disk,
+    so an interrupted run costs nothing to repeat).
     """
     # Load stimuli
     with open(stimuli_file, 'r') as f:
         stimuli = json.load(f)
 
     print(f"Loaded {len(stimuli)} stimulus sets")
-    print(f"Using model: {model}\n")
+    print(f"Using model: {model}")
+    print(f"Concurrency: {concurrency} requests, {rpm} requests/min\n")
+
+    conditions = ['sentence', 'jabberwocky', 'stripped', 'nonwords']
+    texts = [stim_set[condition] for stim_set in stimuli for condition in conditions]
+
+    client = LogprobClient(model=model, concurrency=concurrency, rpm=rpm, base_url=base_url)
+    responses = iter(client.run(texts, top_logprobs=20, max_tokens=1))
 
     # Results storage
     results = []
 
     # Process each stimulus set
-    for idx, stim_set in enumerate(stimuli):
-        print(f"Processing stimulus set {stim_set['set_id']}/30...")
+    for stim_set in stimuli:
+        print(f"Processing stimulus set {stim_set['set_id']}/{len(stimuli)}...")
 
         set_results = {
             'set_id': stim_set['set_id'],
@@ -128,15 +133,14 @@ def run_experiment(stimuli_file="stimuli.json", output_file="experiment_results.
         }
 
         # Process each condition
-        for condition in ['sentence', 'jabberwocky', 'stripped', 'nonwords']:
+        for condition in conditions:
             text = stim_set[condition]
+            content_logprobs = next(responses)
 
             print(f"  Condition: {condition:15s} - '{text[:50]}...'")
 
-            # Get logprobs
-            logprob_data = get_sequence_logprobs(text, model=model)
-
-            if logprob_data:
+            if content_logprobs:
+                logprob_data = summarize_logprobs(content_logprobs)
                 set_results['conditions'][condition] = {
                     'text': text,
                     'tokens': logprob_data['tokens'],
@@ -150,36 +154,45 @@ def run_experiment(stimuli_file="stimuli.json", output_file="experiment_results.
             else:
                 print(f"    → Failed to get logprobs")
 
-            # Rate limiting
-            time.sleep(0.5)
-
         results.append(set_results)
 
-        # Save intermediate results every 5 sets
-        if (idx + 1) % 5 == 0:
-            with open(output_file, 'w') as f:
-                json.dump(results, f, indent=2)
-            print(f"  Saved intermediate results\n")
-
     # Save final results
     with open(output_file, 'w') as f:
         json.dump(results, f, indent=2)
 
+    print()
+    client.print_report()
     print(f"\nExperiment complete! Results saved to {output_file}")
     return results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Morphosyntax constraint experiment (OpenAI logprobs)')
+    parser.add_argument('--stimuli', default='stimuli.json', help='Stimuli file (default: stimuli.json)')
+    parser.add_argument('--output', default='experiment_results.json',
+                        help='Output file (default: experiment_results.json)')
+    parser.add_argument('--model', default='gpt-3.5-turbo', help='Chat model (default: gpt-3.5-turbo)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Requests in flight at once (default: 8)')
+    parser.add_argument('--rpm', type=float, default=500,
+                        help='Requests per minute limit (default: 500)')
+    parser.add_argument('--base-url', default=None,
+                        help='OpenAI-compatible endpoint, e.g. fake_openai_server.py (default: OpenAI)')
+    args = parser.parse_args()
+
     # Check for API key
-    if not os.environ.get("OPENAI_API_KEY"):
+    if not os.environ.get("OPENAI_API_KEY") and not args.base_url:
         print("Error: OPENAI_API_KEY environment variable not set")
         print("Please set it with: export OPENAI_API_KEY='your-key-here'")
         exit(1)
 
     # Run experiment
     results = run_experiment(
-        stimuli_file="stimuli.json",
-        output_file="experiment_results.json",
-        model="gpt-3.5-turbo"
+        stimuli_file=args.stimuli,
+        output_file=args.output,
+        model=args.model,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        base_url=args.base_url
     )
 
     print("\nSummary statistics:")
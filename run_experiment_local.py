@@ -10,10 +10,12 @@ NOW WITH WORD-ALIGNED METRICS:
 import torch
 import numpy as np
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 from tqdm import tqdm
 import warnings
-from word_aligned_metrics import process_text_with_word_metrics
+from word_aligned_metrics import process_text_with_word_metrics, process_texts_with_word_metrics
+from result_writer import JsonlResultWriter, consolidate
+from precision import DTYPES, load_scoring_model, print_precision_report
 warnings.filterwarnings('ignore')
 
 def get_text_metrics(model, tokenizer, text, device='cpu'):
@@ -26,9 +28,17 @@ def get_text_metrics(model, tokenizer, text, device='cpu'):
     return process_text_with_word_metrics(model, tokenizer, text, device)
 
 def run_experiment(stimuli_file='stimuli.json', output_file='experiment_results_local.json',
-                   model_name='gpt2'):
+                   model_name='gpt2', batch_size=8, resume=False, dtype='fp32'):
     """
     Run the morphosyntax experiment using a local model.
+
+    All conditions of a stimulus set are scored together in padded batches
+    of up to batch_size texts (see process_texts_with_word_metrics).
+
+    Each finished set is appended to {output_file}.partial.jsonl; with
+    resume=True, sets already in that file are skipped. dtype ('fp32',
+    'bf16', 'int8-dynamic') sets the inference precision; metrics are always
+    computed in fp32.
     """
     print("=" * 80)
     print("MORPHOSYNTAX EXPERIMENT - LOCAL MODEL")
@@ -36,12 +46,11 @@ def run_experiment(stimuli_file='stimuli.json', output_file='experiment_results_
     print(f"\nLoading model: {model_name}")
 
     # Load model and tokenizer
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"Using device: {device}")
+    device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+    print(f"Using device: {device} ({dtype})")
 
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
-    model.eval()
+    model = load_scoring_model(model_name, dtype, device)
 
     print(f"Model loaded successfully!\n")
 
@@ -53,26 +62,31 @@ def run_experiment(stimuli_file='stimuli.json', output_file='experiment_results_
     print(f"Total items: {len(stimuli) * 4}")
     print()
 
-    # Results storage
-    results = []
+    # Stream finished sets to a JSONL sidecar
+    writer = JsonlResultWriter(f'{output_file}.partial.jsonl', key_fields=('set_id',), resume=resume)
+    pending = [s for s in stimuli if (s['set_id'],) not in writer.completed_keys]
+    if resume:
+        print(f"Resuming: {len(stimuli) - len(pending)} of {len(stimuli)} sets already complete\n")
 
     # Process each stimulus set
-    for stim_set in tqdm(stimuli, desc="Processing stimulus sets"):
+    for stim_set in tqdm(pending, desc="Processing stimulus sets"):
         set_results = {
             'set_id': stim_set['set_id'],
             'conditions': {}
         }
 
-        # Process each condition
-        for condition in ['sentence', 'jabberwocky', 'stripped', 'nonwords',
-                          'scrambled_jabberwocky', 'swapped_function_words']:
-            if condition not in stim_set:
-                continue
+        conditions = [c for c in ['sentence', 'jabberwocky', 'stripped', 'nonwords',
+                                  'scrambled_jabberwocky', 'swapped_function_words']
+                      if c in stim_set]
 
-            text = stim_set[condition]
+        # Get comprehensive metrics for every condition at once
+        all_metrics = process_texts_with_word_metrics(
+            model, tokenizer, [stim_set[c] for c in conditions], device, batch_size=batch_size
+        )
 
-            # Get comprehensive metrics
-            metrics = get_text_metrics(model, tokenizer, text, device)
+        # Process each condition
+        for condition, metrics in zip(conditions, all_metrics):
+            text = stim_set[condition]
 
             # Store results with both token-level and word-level metrics
             set_results['conditions'][condition] = {
@@ -91,16 +105,14 @@ def run_experiment(stimuli_file='stimuli.json', output_file='experiment_results_
                 'mean_word_surprisal_sum': metrics['mean_word_surprisal_sum'],
             }
 
-        results.append(set_results)
+        writer.write(set_results)
 
-        # Save intermediate results every 5 sets
-        if stim_set['set_id'] % 5 == 0:
-            with open(output_file, 'w') as f:
-                json.dump(results, f, indent=2)
+    writer.close()
 
-    # Save final results
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    # Save final results (same list-of-sets format, in stimulus order)
+    set_order = {s['set_id']: i for i, s in enumerate(stimuli)}
+    results = consolidate(writer.path, output_file,
+                          sort_key=lambda r: set_order.get(r['set_id'], len(stimuli)))
 
     print(f"\n\nExperiment complete!")
     print(f"Results saved to: {output_file}\n")
@@ -141,10 +153,12 @@ def run_experiment(stimuli_file='stimuli.json', output_file='experiment_results_
     print(f"\nNote: Both aggregation methods shown for robustness verification.")
     print(f"Word-Mean = average of mean entropy per word")
     print(f"Word-Sum  = average of summed entropy per word")
+    print()
+    print_precision_report(model)
 
     return results
 
-def diagnostic_single_example(stimuli_file='stimuli.json', set_id=1, model_name='gpt2'):
+def diagnostic_single_example(stimuli_file='stimuli.json', set_id=1, model_name='gpt2', dtype='fp32'):
     """
     Run detailed diagnostic on a single stimulus set.
     """
@@ -153,10 +167,9 @@ def diagnostic_single_example(stimuli_file='stimuli.json', set_id=1, model_name=
     print("=" * 80 + "\n")
 
     # Load model
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
-    model.eval()
+    model = load_scoring_model(model_name, dtype, device)
 
     # Load stimuli
     with open(stimuli_file, 'r') as f:
@@ -218,10 +231,17 @@ if __name__ == "__main__":
                        help='Run diagnostic analysis on first stimulus set')
     parser.add_argument('--set-id', type=int, default=1,
                        help='Stimulus set ID for diagnostic (default: 1)')
+    parser.add_argument('--batch-size', type=int, default=8,
+                       help='Texts per forward pass (default: 8)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip sets already streamed to the .partial.jsonl file of an interrupted run')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                       help='Inference precision; entropy and surprisal stay fp32 (default: fp32)')
 
     args = parser.parse_args()
 
     if args.diagnostic:
-        diagnostic_single_example(set_id=args.set_id, model_name=args.model)
+        diagnostic_single_example(set_id=args.set_id, model_name=args.model, dtype=args.dtype)
     else:
-        run_experiment(model_name=args.model)
+        run_experiment(model_name=args.model, batch_size=args.batch_size, resume=args.resume,
+                       dtype=args.dtype)
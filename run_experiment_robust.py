@@ -5,15 +5,22 @@ ROBUST version with fixed entropy calculation.
 import torch
 import numpy as np
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 from tqdm import tqdm
 import warnings
 warnings.filterwarnings('ignore')
 
+from batched_inference import guard_sequence_logits
+from precision import DTYPES, load_scoring_model, print_precision_report
+
 def calculate_entropy_robust(logits):
     """
-    Calculate Shannon entropy with numerical stability.
+    Calculate Shannon entropy with numerical stability (always in fp32).
+
+    Returns NaN, never 0.0, when the logits are not finite.
     """
+    logits = logits.float()
+
     # Convert logits to probabilities with numerical stability
     logits_max = logits.max()
     exp_logits = torch.exp(logits - logits_max)  # Subtract max for stability
@@ -24,9 +31,9 @@ def calculate_entropy_robust(logits):
     log_probs = torch.log2(probs + epsilon)
     entropy = -(probs * log_probs).sum().item()
 
-    # Sanity check
+    # Sanity check: a non-finite entropy stays visible instead of becoming 0.0
     if np.isnan(entropy) or np.isinf(entropy):
-        return 0.0
+        return float('nan')
 
     return entropy
 
@@ -39,7 +46,9 @@ def get_token_probabilities(model, tokenizer, text, device='cpu'):
     # Get model outputs
     with torch.no_grad():
         outputs = model(input_ids, labels=input_ids)
-        logits = outputs.logits
+
+    # fp32 logits; rows with inf/NaN are recomputed by the fp32 model
+    logits = guard_sequence_logits(model, outputs.logits, [input_ids[0].tolist()])
 
     token_data = []
 
@@ -95,19 +104,19 @@ def get_token_probabilities(model, tokenizer, text, device='cpu'):
 
 def run_experiment(stimuli_file='stimuli_controlled.json',
                    output_file='experiment_results.json',
-                   model_name='gpt2'):
-    """Run experiment."""
+                   model_name='gpt2',
+                   dtype='fp32'):
+    """Run experiment (dtype: 'fp32', 'bf16' or 'int8-dynamic')."""
     print("=" * 80)
     print("MORPHOSYNTAX EXPERIMENT - ROBUST VERSION")
     print("=" * 80)
     print(f"\nLoading model: {model_name}")
 
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"Using device: {device}")
+    device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+    print(f"Using device: {device} ({dtype})")
 
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
-    model.eval()
+    model = load_scoring_model(model_name, dtype, device)
 
     print(f"Model loaded successfully!\n")
 
@@ -171,15 +180,26 @@ def run_experiment(stimuli_file='stimuli_controlled.json',
             std = np.std(entropies)
             print(f"{condition:15s}: {mean:.3f} ± {std:.3f} bits")
 
+    print()
+    print_precision_report(model)
+
     return results
 
 if __name__ == "__main__":
-    import sys
-    model_name = sys.argv[1] if len(sys.argv) > 1 else 'gpt2'
-    output_file = f'experiment_results_{model_name.replace("-", "_")}_robust.json'
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run morphosyntax experiment (robust entropy)')
+    parser.add_argument('model', type=str, nargs='?', default='gpt2',
+                        help='Model name (default: gpt2)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                        help='Inference precision; entropy stays fp32 (default: fp32)')
+    args = parser.parse_args()
+
+    output_file = f'experiment_results_{args.model.replace("-", "_")}_robust.json'
 
     run_experiment(
         stimuli_file='stimuli_controlled.json',
         output_file=output_file,
-        model_name=model_name
+        model_name=args.model,
+        dtype=args.dtype
     )
@@ -11,18 +11,25 @@ import torch
 import numpy as np
 import json
 import matplotlib.pyplot as plt
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 from tqdm import tqdm
 from collections import defaultdict
-from word_aligned_metrics import process_text_with_word_metrics
+from word_aligned_metrics import process_texts_with_word_metrics
+from precision import DTYPES, load_scoring_model, print_precision_report
 import warnings
 warnings.filterwarnings('ignore')
 
 def run_full_experiment(stimuli_file='stimuli_context_matched.json',
                        output_file='experiment_results_final.json',
-                       model_name='gpt2'):
+                       model_name='gpt2',
+                       batch_size=8,
+                       dtype='fp32'):
     """
     Run complete experiment with word-aligned metrics.
+
+    All conditions of a stimulus set are scored together in padded batches
+    of up to batch_size texts. dtype ('fp32', 'bf16', 'int8-dynamic') sets
+    the inference precision; metrics are always computed in fp32.
     """
     print("=" * 80)
     print(f"MORPHOSYNTAX EXPERIMENT - FINAL ANALYSIS")
@@ -31,11 +38,10 @@ def run_full_experiment(stimuli_file='stimuli_context_matched.json',
     print(f"Stimuli: {stimuli_file}")
 
     # Load model
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"\nLoading model... (device: {device})")
+    device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+    print(f"\nLoading model... (device: {device}, {dtype})")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
-    model.eval()
+    model = load_scoring_model(model_name, dtype, device)
 
     # Load stimuli
     with open(stimuli_file, 'r') as f:
@@ -52,30 +58,34 @@ def run_full_experiment(stimuli_file='stimuli_context_matched.json',
             'conditions': {}
         }
 
-        for condition in ['sentence', 'jabberwocky_matched', 'scrambled_jabberwocky',
-                         'word_list_real', 'skeleton_function_words',
-                         'word_list_nonce_1tok', 'word_list_nonce_2tok']:
-            if condition in item:
-                text = item[condition]
-                metrics = process_text_with_word_metrics(model, tokenizer, text, device)
-
-                # Store comprehensive metrics
-                set_results['conditions'][condition] = {
-                    'text': text,
-                    # Token-level (secondary)
-                    'n_tokens': metrics['n_tokens'],
-                    'mean_token_entropy': metrics['mean_token_entropy'],
-                    'mean_token_surprisal': metrics['mean_token_surprisal'],
-                    # Word-level (primary)
-                    'n_words': metrics['n_words'],
-                    'mean_word_entropy': metrics['mean_word_entropy'],
-                    'mean_word_surprisal': metrics['mean_word_surprisal'],
-                    'mean_word_entropy_sum': metrics['mean_word_entropy_sum'],
-                    'mean_word_surprisal_sum': metrics['mean_word_surprisal_sum'],
-                    # Per-word details for position analysis
-                    'word_entropies': metrics.get('word_entropies_mean', []),
-                    'word_surprisals': metrics.get('word_surprisals_mean', []),
-                }
+        conditions = [c for c in ['sentence', 'jabberwocky_matched', 'scrambled_jabberwocky',
+                                  'word_list_real', 'skeleton_function_words',
+                                  'word_list_nonce_1tok', 'word_list_nonce_2tok']
+                      if c in item]
+        all_metrics = process_texts_with_word_metrics(
+            model, tokenizer, [item[c] for c in conditions], device, batch_size=batch_size
+        )
+
+        for condition, metrics in zip(conditions, all_metrics):
+            text = item[condition]
+
+            # Store comprehensive metrics
+            set_results['conditions'][condition] = {
+                'text': text,
+                # Token-level (secondary)
+                'n_tokens': metrics['n_tokens'],
+                'mean_token_entropy': metrics['mean_token_entropy'],
+                'mean_token_surprisal': metrics['mean_token_surprisal'],
+                # Word-level (primary)
+                'n_words': metrics['n_words'],
+                'mean_word_entropy': metrics['mean_word_entropy'],
+                'mean_word_surprisal': metrics['mean_word_surprisal'],
+                'mean_word_entropy_sum': metrics['mean_word_entropy_sum'],
+                'mean_word_surprisal_sum': metrics['mean_word_surprisal_sum'],
+                # Per-word details for position analysis
+                'word_entropies': metrics.get('word_entropies_mean', []),
+                'word_surprisals': metrics.get('word_surprisals_mean', []),
+            }
 
         results.append(set_results)
 
@@ -90,6 +100,7 @@ def run_full_experiment(stimuli_file='stimuli_context_matched.json',
 
     print(f"\n\nExperiment complete!")
     print(f"Results saved to: {output_file}\n")
+    print_precision_report(model)
 
     return results
 
@@ -308,6 +319,10 @@ if __name__ == "__main__":
                        help='Run experiment (otherwise just analyze existing results)')
     parser.add_argument('--results', type=str,
                        help='Results file to analyze (if not running experiment)')
+    parser.add_argument('--batch-size', type=int, default=8,
+                       help='Texts per forward pass (default: 8)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                       help='Inference precision; entropy and surprisal stay fp32 (default: fp32)')
 
     args = parser.parse_args()
 
@@ -322,7 +337,9 @@ if __name__ == "__main__":
         results = run_full_experiment(
             stimuli_file=args.stimuli,
             output_file=output_file,
-            model_name=args.model
+            model_name=args.model,
+            batch_size=args.batch_size,
+            dtype=args.dtype
         )
 
     # Analyze results
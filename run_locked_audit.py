@@ -19,16 +19,41 @@ Target Classes per Cue Family:
 Usage:
     python run_locked_audit.py --model gpt2
     python run_locked_audit.py --model EleutherAI/pythia-410m
+    python run_locked_audit.py --model gpt2 --batch-size 32
+    python run_locked_audit.py --model gpt2 --batch-size 4 --pack-tokens 64
+    python run_locked_audit.py --model gpt2 --workers 8 --threads-per-worker 4
+    python run_locked_audit.py --model gpt2 --server http://127.0.0.1:8765
 """
 
+import os
+import glob
 import json
+import time
 import argparse
-import torch
-import numpy as np
 from tqdm import tqdm
 from datetime import datetime
-from typing import Dict, List, Optional, Set, Tuple
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from batched_inference import (
+    dedup_report, get_pad_token_id, iter_token_id_probs, plan_unique_contexts, tokenize_contexts
+)
+from class_membership import ClassMembership
+from vocab_annotations import load_vocab_annotations
+from prefix_cache import PrefixKVCache
+from distribution_cache import make_dist_cache
+from distribution_store import make_store_writer
+from scoring_server import connect_remote_model
+from stimulus_bundle import load_stimulus_bundle
+from autotune import print_settings, resolve_settings
+from precision import DTYPES, load_scoring_model, precision_report, print_precision_report
+from result_writer import JsonlResultWriter, consolidate, read_records, truncate_partial_line
+from results_table import ResultsTable, table_path
+from parallel_scoring import (
+    model_size_mb, print_parallel_report, run_forked_workers, shard
+)
+
+if TYPE_CHECKING:
+    import torch
 
 # ============================================================================
 # TARGET CLASS DEFINITIONS (Expanded Word Sets)
@@ -163,6 +188,9 @@ TARGET_CLASSES = {
     },
 }
 
+# Fields identifying one result (set_ids repeat across cue families)
+RESULT_KEY = ('cue_family', 'set_id', 'condition', 'context_k')
+
 # ============================================================================
 # WORD-LEVEL ANALYZER
 # ============================================================================
@@ -172,41 +200,27 @@ class WordLevelAnalyzer:
 
     def __init__(self, tokenizer):
         self.tokenizer = tokenizer
-        self._token_cache = {}
+        self.annotations = load_vocab_annotations(tokenizer)
+        self._membership_cache = {}
 
     def is_word_start_token(self, token_id: int) -> bool:
         """Check if token represents start of a word (space-prefixed in GPT-2/Pythia)."""
-        if token_id in self._token_cache:
-            return self._token_cache[token_id][0]
-
-        token_str = self.tokenizer.decode([token_id])
-
-        # Skip special tokens
-        if token_str in ['<|endoftext|>', '<unk>', '<pad>', '']:
-            self._token_cache[token_id] = (False, None)
-            return False
-
-        # Word-start tokens begin with space or newline
-        is_start = token_str.startswith(' ') or token_str.startswith('\n')
-
-        # Extract word if it's a word-start token
-        if is_start:
-            word = token_str.strip().lower().strip('.,!?;:"\'-')
-            self._token_cache[token_id] = (True, word)
-        else:
-            self._token_cache[token_id] = (False, None)
-
-        return is_start
+        return self.annotations.word_start(token_id)
 
     def get_word_from_token(self, token_id: int) -> Optional[str]:
         """Get word from token (only for word-start tokens)."""
-        if token_id not in self._token_cache:
-            self.is_word_start_token(token_id)
-        return self._token_cache[token_id][1]
+        return self.annotations.word(token_id)
+
+    def get_membership(self, word_sets: Dict[str, Set[str]]) -> ClassMembership:
+        """Vocabulary × class membership matrix for these word sets (built once)."""
+        key = tuple((class_name, id(word_set)) for class_name, word_set in word_sets.items())
+        if key not in self._membership_cache:
+            self._membership_cache[key] = ClassMembership.from_word_sets(self.tokenizer, word_sets)
+        return self._membership_cache[key]
 
     def compute_class_mass(
         self,
-        probs: torch.Tensor,
+        probs: 'torch.Tensor',
         word_sets: Dict[str, Set[str]],
         top_k: int = 1000
     ) -> Dict[str, float]:
@@ -216,26 +230,12 @@ class WordLevelAnalyzer:
         Args:
             probs: Probability distribution over vocabulary
             word_sets: Dict mapping class names to word sets
-            top_k: Number of top tokens to consider
+            top_k: Number of top tokens to consider (0 = full vocabulary)
 
         Returns:
             Dict mapping class names to probability mass
         """
-        top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
-
-        class_mass = {class_name: 0.0 for class_name in word_sets}
-
-        for prob, token_id in zip(top_k_probs, top_k_ids):
-            word = self.get_word_from_token(token_id.item())
-
-            if word is None:
-                continue
-
-            for class_name, word_set in word_sets.items():
-                if word in word_set:
-                    class_mass[class_name] += prob.item()
-
-        return class_mass
+        return self.get_membership(word_sets).class_mass_dict(probs, top_k=top_k)
 
 
 # ============================================================================
@@ -265,6 +265,205 @@ def truncate_context(text: str, cue_position: int, k: int) -> str:
         return ' '.join(words[start_idx:cue_position + 1])
 
 
+# ============================================================================
+# SCORING
+# ============================================================================
+
+def score_contexts(
+    model,
+    tokenizer,
+    analyzer: 'WordLevelAnalyzer',
+    jobs: List[Tuple],
+    token_ids: List[List[int]],
+    indices: List[int],
+    writer: JsonlResultWriter,
+    top_k: int = 1000,
+    batch_size: int = 1,
+    device: str = 'cpu',
+    prefix_cache=None,
+    dist_cache=None,
+    store=None,
+    pbar=None,
+    pack_tokens: int = 0,
+):
+    """
+    Score jobs[i] for i in indices and stream one result record per context.
+
+    Contexts with the same token ids are evaluated once and the distribution
+    is fanned out to every job that shares them (see plan_unique_contexts).
+
+    Args:
+        jobs: (stimulus, condition, k_label, context) tuples
+        token_ids: Token ids of each job's context
+        indices: Which jobs to score
+        writer: Sink for result records
+        store: Optional DistributionStoreWriter for the full distributions
+        pbar: Optional tqdm bar advanced once per context
+        pack_tokens: Tokens per packed row (0 = padded batches; see sequence_packing)
+    """
+    unique_token_ids, groups = plan_unique_contexts([token_ids[i] for i in indices])
+
+    for unique_idx, probs, num_tokens in iter_token_id_probs(
+        model, unique_token_ids, get_pad_token_id(tokenizer), batch_size=batch_size, device=device,
+        prefix_cache=prefix_cache, dist_cache=dist_cache, pack_tokens=pack_tokens,
+    ):
+        # Class mass depends only on the distribution and the cue family
+        class_mass_by_family = {}
+
+        for pending_idx in groups[unique_idx]:
+            idx = indices[pending_idx]
+            stim, condition, k_label, context = jobs[idx]
+            cue_family = stim['cue_family']
+            target_config = TARGET_CLASSES[cue_family]
+            word_sets = target_config['word_sets']
+
+            # Compute class mass
+            if cue_family not in class_mass_by_family:
+                class_mass_by_family[cue_family] = analyzer.compute_class_mass(probs, word_sets, top_k=top_k)
+            class_mass = class_mass_by_family[cue_family]
+
+            # Compute total target mass
+            if cue_family == 'determiners':
+                # For determiners, report both NOUN and ADJ, plus combined
+                target_mass = class_mass.get('NOUN', 0) + class_mass.get('ADJ', 0)
+            else:
+                primary_class = target_config['primary']
+                target_mass = sum(class_mass.values())
+
+            writer.write({
+                'set_id': stim['set_id'],
+                'cue_family': cue_family,
+                'cue_word': stim['cue_word'],
+                'condition': condition.upper(),
+                'context_k': k_label,
+                'context': context,
+                'target_mass': target_mass,
+                'class_mass': dict(class_mass),
+                'num_tokens': num_tokens,
+            })
+
+            if store is not None:
+                store.add(probs, {
+                    'result_index': idx,
+                    'set_id': stim['set_id'],
+                    'cue_family': cue_family,
+                    'cue_word': stim['cue_word'],
+                    'cue_position': stim['cue_position'],
+                    'condition': condition.upper(),
+                    'context_k': k_label,
+                    'context': context,
+                })
+            if pbar is not None:
+                pbar.update(1)
+
+
+def run_parallel(
+    model,
+    tokenizer,
+    analyzer: 'WordLevelAnalyzer',
+    jobs: List[Tuple],
+    token_ids: List[List[int]],
+    pending: List[int],
+    writer: JsonlResultWriter,
+    shard_prefix: str,
+    workers: int,
+    threads_per_worker: int = 0,
+    top_k: int = 1000,
+    batch_size: int = 1,
+    device: str = 'cpu',
+    kv_cache_mb: int = 0,
+    dist_cache=None,
+    calibration: int = 32,
+    pack_tokens: int = 0,
+) -> Dict:
+    """
+    Score pending jobs with forked workers sharing the model copy-on-write.
+
+    The single-process baseline for the reported speedup is measured in this
+    process with all threads: one unique context is scored first as an
+    untimed warm-up, then `calibration` unique contexts sampled evenly across
+    the whole plan (so their lengths and conditions match the rest) are
+    timed. The rest are split round-robin across workers by unique context
+    (so no context is evaluated by two workers), each streaming to
+    {shard_prefix}.w{i}.jsonl; the shards are merged into writer afterwards.
+    Both rates count unique contexts (forward-pass work), so the speedup
+    does not depend on how many result rows each context fans out to.
+
+    Returns:
+        Report dict (workers, throughput, speedup, per-worker private memory)
+    """
+    _, groups = plan_unique_contexts([token_ids[i] for i in pending])
+    step = max(1, len(groups) // (calibration + 1))
+    sampled = list(range(0, len(groups), step))[:calibration + 1] if calibration else []
+    warmup_group, timed_groups = sampled[:1], sampled[1:]
+    in_sample = set(sampled)
+
+    warmup_jobs = [pending[i] for g in warmup_group for i in groups[g]]
+    calibration_jobs = [pending[i] for g in timed_groups for i in groups[g]]
+    rest = [pending[i] for g in range(len(groups)) if g not in in_sample for i in groups[g]]
+    _, rest_groups = plan_unique_contexts([token_ids[i] for i in rest])
+
+    with tqdm(total=len(warmup_jobs) + len(calibration_jobs), desc="Baseline (1 process)") as pbar:
+        # Only the second pass's time is kept: the first is the warm-up
+        for batch_jobs in (warmup_jobs, calibration_jobs):
+            start = time.time()
+            score_contexts(
+                model, tokenizer, analyzer, jobs, token_ids, batch_jobs, writer, top_k=top_k,
+                batch_size=batch_size, device=device, dist_cache=dist_cache, pbar=pbar,
+                pack_tokens=pack_tokens,
+            )
+            baseline_seconds = time.time() - start
+    writer.sync()
+
+    def work(worker_idx):
+        precision_before = dict(getattr(model, 'precision_stats', None) or {})
+        shard_writer = JsonlResultWriter(f'{shard_prefix}.w{worker_idx}.jsonl', writer.key_fields)
+        # Each worker gets its own prefix cache (nothing useful to inherit)
+        prefix_cache = PrefixKVCache(max_bytes=kv_cache_mb * 1024 ** 2) if kv_cache_mb > 0 else None
+        indices = [rest[i] for group in shard(rest_groups, workers, worker_idx) for i in group]
+        with tqdm(total=len(indices), desc=f"Worker {worker_idx}", position=worker_idx) as pbar:
+            score_contexts(
+                model, tokenizer, analyzer, jobs, token_ids, indices, shard_writer, top_k=top_k,
+                batch_size=batch_size, device=device, prefix_cache=prefix_cache,
+                dist_cache=dist_cache, pbar=pbar, pack_tokens=pack_tokens,
+            )
+        shard_writer.close()
+        precision = {name: model.precision_stats[name] - count for name, count in precision_before.items()}
+        return {'contexts': len(indices), 'precision': precision}
+
+    start = time.time()
+    stats = run_forked_workers(workers, work, threads_per_worker) if rest else []
+    parallel_seconds = time.time() - start
+
+    # Fold the workers' non-finite row counts into this process's
+    for worker_stats in stats:
+        for name, count in worker_stats.get('precision', {}).items():
+            model.precision_stats[name] += count
+
+    for worker_idx in range(workers):
+        shard_path = f'{shard_prefix}.w{worker_idx}.jsonl'
+        if os.path.exists(shard_path):
+            writer.absorb(shard_path)
+
+    baseline_rate = len(timed_groups) / baseline_seconds if timed_groups else None
+    parallel_rate = len(rest_groups) / parallel_seconds if rest else 0.0
+
+    report = {
+        'workers': workers,
+        'threads_per_worker': stats[0]['threads'] if stats else threads_per_worker,
+        'baseline_contexts': len(timed_groups),
+        'baseline_contexts_per_s': baseline_rate,
+        'parallel_contexts': len(rest_groups),
+        'parallel_contexts_per_s': parallel_rate,
+        'speedup': parallel_rate / baseline_rate if baseline_rate and rest else None,
+        'model_mb': model_size_mb(model),
+        'worker_private_mb': [s['private_mb'] for s in stats],
+    }
+    print()
+    print_parallel_report(report)
+    return report
+
+
 # ============================================================================
 # MAIN AUDIT FUNCTION
 # ============================================================================
@@ -275,6 +474,18 @@ def run_audit(
     output_file: str,
     context_lengths: List[int] = [1, 2, 4, 8, -1],  # -1 means full
     top_k: int = 1000,
+    batch_size: int = 1,
+    pack_tokens: int = 0,
+    kv_cache_mb: int = 0,
+    dist_cache_mb: int = 0,
+    dist_cache_topk: int = 0,
+    dump_distributions: Optional[str] = None,
+    resume: bool = False,
+    workers: int = 1,
+    threads_per_worker: int = 0,
+    server: Optional[str] = None,
+    dtype: str = 'fp32',
+    threads: int = 0,
 ):
     """
     Run comprehensive morphosyntax audit with context ablation.
@@ -284,8 +495,46 @@ def run_audit(
         stimuli_file: Path to locked stimuli JSON
         output_file: Path to save results
         context_lengths: List of k values for context ablation (-1 = full)
-        top_k: Number of top tokens for class mass computation
+        top_k: Number of top tokens for class mass computation (0 = full vocabulary)
+        batch_size: Contexts per forward pass (1 = one pass per context);
+            larger values run length-bucketed, right-padded batches
+        pack_tokens: Concatenate contexts into packed rows of up to this many
+            tokens with block-diagonal causal masks (0 = off; batch_size then
+            counts packed rows per forward pass; see sequence_packing)
+        kv_cache_mb: Memory budget (MB) for prefix KV-cache reuse across
+            contexts (0 = off; when on, contexts run one at a time)
+        dist_cache_mb: Disk budget (MB) for the persistent next-token
+            distribution cache (0 = off)
+        dist_cache_topk: Tokens stored per cached distribution (0 = full vector)
+        dump_distributions: Directory for a float16 distribution store of
+            every context (see distribution_store; None = off)
+        resume: Skip (cue_family, set_id, condition, context_k) results already in the
+            streaming sidecar ({output_file}.partial.jsonl) of an earlier run
+        workers: Forked worker processes sharing the model copy-on-write
+            (1 = single process; CPU only)
+        threads_per_worker: torch intra-op threads per worker (0 = split cores)
+        server: URL of a running scoring_server to score through instead of
+            loading the model here (None = load locally)
+        dtype: Inference precision, 'fp32', 'bf16' or 'int8-dynamic' (see
+            precision; metrics are always computed in fp32)
+        threads: torch intra-op threads in this process (0 = torch default;
+            forked workers use threads_per_worker)
     """
+    import torch
+
+    if resume and dump_distributions:
+        raise ValueError("--dump-distributions cannot be combined with --resume "
+                         "(the store would only cover the resumed contexts)")
+    if workers > 1 and dump_distributions:
+        raise ValueError("--dump-distributions is not supported with --workers > 1")
+    if server and (workers > 1 or kv_cache_mb > 0 or dist_cache_mb > 0):
+        raise ValueError("--server cannot be combined with --workers, --kv-cache-mb or --dist-cache-mb "
+                         "(batching and caching happen in the server)")
+    if pack_tokens > 0 and (kv_cache_mb > 0 or server):
+        raise ValueError("--pack-tokens cannot be combined with --kv-cache-mb or --server")
+    if server and dtype != 'fp32':
+        raise ValueError("--dtype is set on the scoring server (scoring_server.py --dtype), not with --server")
+
     print("=" * 80)
     print("LOCKED DESIGN MORPHOSYNTAX AUDIT")
     print("=" * 80)
@@ -293,18 +542,32 @@ def run_audit(
     print(f"Model: {model_name}")
     print(f"Stimuli: {stimuli_file}")
     print(f"Context lengths: {context_lengths}")
+    print(f"Batch size: {batch_size}")
+    print(f"Packing: {f'{pack_tokens} tokens per row' if pack_tokens > 0 else 'off'}")
+    print(f"KV-cache budget: {kv_cache_mb} MB")
+    print(f"Precision: {dtype}")
+    print(f"Threads: {threads or 'torch default'}")
     print(f"Output: {output_file}")
+    print(f"Resume: {resume}")
     print()
 
+    if threads > 0:
+        torch.set_num_threads(threads)
+
     # Load model
+    from transformers import AutoTokenizer
+
     print("Loading model...")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.eval()
-
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model = model.to(device)
-    print(f"  Device: {device}")
+    if server:
+        model, device = connect_remote_model(server, model_name), 'cpu'
+    else:
+        device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+        if workers > 1 and device == 'cuda':
+            raise ValueError("--workers > 1 forks CPU workers; CUDA cannot be used in forked processes")
+        model = load_scoring_model(model_name, dtype, device)
+        print(f"  Device: {device}")
+    dist_cache = make_dist_cache(model, model_name, dist_cache_mb, dist_cache_topk)
     print()
 
     # Load stimuli
@@ -323,77 +586,113 @@ def run_audit(
         'content_scrambled', 'function_scrambled', 'cue_deleted'
     ]
 
+    # Collect every (stimulus, condition, k) context up front, with its word span
+    jobs = []
+    spans = []
+    for stim_idx, stim in enumerate(stimuli):
+        cue_position = stim['cue_position']
+
+        for condition in conditions:
+            text = stim[condition]
+
+            for k in context_lengths:
+                # Get context (full or truncated)
+                if k == -1:
+                    context = ' '.join(text.split()[:cue_position + 1])
+                    k_label = 'full'
+                else:
+                    context = truncate_context(text, cue_position, k)
+                    k_label = str(k)
+
+                jobs.append((stim, condition, k_label, context))
+                start = 0 if k == -1 else max(0, cue_position + 1 - k)
+                spans.append((stim_idx, condition, start, cue_position))
+
+    # Stream results to a JSONL sidecar; on resume, skip completed keys
+    job_order = {
+        (stim['cue_family'], stim['set_id'], condition.upper(), k_label): i
+        for i, (stim, condition, k_label, _) in enumerate(jobs)
+    }
+    writer = JsonlResultWriter(f'{output_file}.partial.jsonl', key_fields=RESULT_KEY, resume=resume)
+    if resume:
+        # Fold in worker shards left behind by an interrupted parallel run
+        for shard_path in sorted(glob.glob(f'{glob.escape(output_file)}.partial.w*.jsonl')):
+            truncate_partial_line(shard_path)
+            writer.absorb(shard_path)
+    pending = [i for key, i in job_order.items() if key not in writer.completed_keys]
+
+    # Plan: token ids of every context from the compiled stimulus bundle (or
+    # the tokenizer, for spans the bundle cannot serve), deduplicated by ids
+    bundle = load_stimulus_bundle(stimuli_file, tokenizer, stimuli)
+    from_bundle = [
+        bundle.exact and start <= end < bundle.num_words(stim_idx, condition)
+        for stim_idx, condition, start, end in spans
+    ]
+    tokenized = iter(tokenize_contexts(tokenizer, [job[3] for job, ok in zip(jobs, from_bundle) if not ok]))
+    token_ids = [
+        bundle.context_token_ids(*span) if ok else next(tokenized)
+        for span, ok in zip(spans, from_bundle)
+    ]
+    dedup = dedup_report(plan_unique_contexts([token_ids[i] for i in pending])[1])
+
     # Run audit
     print("Running audit...")
-    results = []
+    if resume:
+        print(f"  Resuming: {len(jobs) - len(pending)} of {len(jobs)} contexts already complete")
+    print(f"  Contexts: {len(pending)} (batch size {batch_size})")
+    if dedup['unique_contexts']:
+        print(f"  Unique contexts: {dedup['unique_contexts']} (dedup ratio {dedup['dedup_ratio']:.2f}x)")
+    prefix_cache = PrefixKVCache(max_bytes=kv_cache_mb * 1024 ** 2) if kv_cache_mb > 0 else None
+    store = make_store_writer(dump_distributions, model_name, source='run_locked_audit',
+                              stimuli_file=stimuli_file)
+
+    parallel = None
+    if workers > 1:
+        parallel = run_parallel(
+            model, tokenizer, analyzer, jobs, token_ids, pending, writer, f'{output_file}.partial',
+            workers=workers, threads_per_worker=threads_per_worker, top_k=top_k,
+            batch_size=batch_size, device=device, kv_cache_mb=kv_cache_mb, dist_cache=dist_cache,
+            pack_tokens=pack_tokens,
+        )
+    else:
+        with tqdm(total=len(pending), desc="Progress") as pbar:
+            score_contexts(
+                model, tokenizer, analyzer, jobs, token_ids, pending, writer, top_k=top_k,
+                batch_size=batch_size, device=device, prefix_cache=prefix_cache,
+                dist_cache=dist_cache, store=store, pbar=pbar, pack_tokens=pack_tokens,
+            )
 
-    total_iters = len(stimuli) * len(conditions) * len(context_lengths)
+    writer.close()
+    if store is not None:
+        store.close()
 
-    with tqdm(total=total_iters, desc="Progress") as pbar:
-        for stim in stimuli:
-            cue_family = stim['cue_family']
-            cue_position = stim['cue_position']
-            target_config = TARGET_CLASSES[cue_family]
-            word_sets = target_config['word_sets']
+    def result_order(record):
+        return job_order.get(writer.key(record), len(jobs))
 
-            for condition in conditions:
-                text = stim[condition]
-
-                for k in context_lengths:
-                    # Get context (full or truncated)
-                    if k == -1:
-                        context = ' '.join(text.split()[:cue_position + 1])
-                        k_label = 'full'
-                    else:
-                        context = truncate_context(text, cue_position, k)
-                        k_label = str(k)
-
-                    # Tokenize and get predictions
-                    inputs = tokenizer(context, return_tensors='pt').to(device)
-
-                    with torch.no_grad():
-                        outputs = model(**inputs)
-
-                    logits = outputs.logits[0, -1, :]
-                    probs = torch.softmax(logits, dim=-1).cpu()
-
-                    # Compute class mass
-                    class_mass = analyzer.compute_class_mass(probs, word_sets, top_k=top_k)
-
-                    # Compute total target mass
-                    if cue_family == 'determiners':
-                        # For determiners, report both NOUN and ADJ, plus combined
-                        target_mass = class_mass.get('NOUN', 0) + class_mass.get('ADJ', 0)
-                    else:
-                        primary_class = target_config['primary']
-                        target_mass = sum(class_mass.values())
-
-                    result = {
-                        'set_id': stim['set_id'],
-                        'cue_family': cue_family,
-                        'cue_word': stim['cue_word'],
-                        'condition': condition.upper(),
-                        'context_k': k_label,
-                        'context': context,
-                        'target_mass': target_mass,
-                        'class_mass': class_mass,
-                        'num_tokens': len(inputs['input_ids'][0]),
-                    }
-
-                    results.append(result)
-                    pbar.update(1)
+    results = sorted(read_records(writer.path), key=result_order)
 
     print()
     print("Audit complete!")
     print()
 
+    if prefix_cache is not None:
+        prefix_cache.print_report()
+        print()
+
+    if dist_cache is not None:
+        dist_cache.print_report()
+        print()
+
     # Summary
     print("=" * 80)
     print("SUMMARY")
     print("=" * 80)
     print()
 
-    # Group results for summary
+    # Group results for summary: one pass over the rows for every cell
+    table = ResultsTable.from_records(results)
+    mean_mass = table.group_mean('target_mass', ('cue_family', 'condition', 'context_k')) if results else {}
+
     print("Target mass by cue family × condition (k=full):")
     print()
     print(f"{'Family':<18} {'SENT':>8} {'JAB':>8} {'FULL_S':>8} {'CONT_S':>8} {'FUNC_S':>8} {'CUE_D':>8}")
@@ -402,10 +701,9 @@ def run_audit(
     for family in TARGET_CLASSES.keys():
         row = [family]
         for cond in ['SENTENCE', 'JABBERWOCKY', 'FULL_SCRAMBLED', 'CONTENT_SCRAMBLED', 'FUNCTION_SCRAMBLED', 'CUE_DELETED']:
-            masses = [r['target_mass'] for r in results
-                     if r['cue_family'] == family and r['condition'] == cond and r['context_k'] == 'full']
-            if masses:
-                row.append(f"{np.mean(masses):.3f}")
+            mass = mean_mass.get((family, cond, 'full'))
+            if mass is not None:
+                row.append(f"{mass:.3f}")
             else:
                 row.append("N/A")
         print(f"{row[0]:<18} {row[1]:>8} {row[2]:>8} {row[3]:>8} {row[4]:>8} {row[5]:>8} {row[6]:>8}")
@@ -421,10 +719,9 @@ def run_audit(
     for family in TARGET_CLASSES.keys():
         row = [family]
         for k in ['1', '2', '4', '8', 'full']:
-            masses = [r['target_mass'] for r in results
-                     if r['cue_family'] == family and r['condition'] == 'JABBERWOCKY' and r['context_k'] == k]
-            if masses:
-                row.append(f"{np.mean(masses):.3f}")
+            mass = mean_mass.get((family, 'JABBERWOCKY', k))
+            if mass is not None:
+                row.append(f"{mass:.3f}")
             else:
                 row.append("N/A")
         print(f"{row[0]:<18} {row[1]:>8} {row[2]:>8} {row[3]:>8} {row[4]:>8} {row[5]:>8}")
@@ -434,21 +731,38 @@ def run_audit(
     # Save results
     print(f"Saving results to: {output_file}")
 
-    output_data = {
-        'metadata': {
-            'model': model_name,
-            'stimuli_file': stimuli_file,
-            'timestamp': datetime.now().isoformat(),
-            'context_lengths': context_lengths,
-            'top_k': top_k,
-            'num_stimuli': len(stimuli),
-            'num_results': len(results),
-        },
-        'results': results,
+    metadata = {
+        'model': model_name,
+        'stimuli_file': stimuli_file,
+        'timestamp': datetime.now().isoformat(),
+        'context_lengths': context_lengths,
+        'top_k': top_k,
+        'batch_size': batch_size,
+        'pack_tokens': pack_tokens,
+        'dedup': dedup,
+        'stimulus_bundle': {'exact': bundle.exact, 'contexts': sum(from_bundle)},
+        'kv_cache': prefix_cache.report() if prefix_cache is not None else None,
+        'dist_cache': dist_cache.report() if dist_cache is not None else None,
+        'distribution_store': dump_distributions,
+        'num_stimuli': len(stimuli),
+        'num_results': len(results),
+        'resumed_results': len(results) - writer.n_written,
+        'parallel': parallel,
+        'dtype': dtype,
+        'threads': torch.get_num_threads(),
+        'precision': precision_report(model),
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+    consolidate(writer.path, output_file, metadata=metadata, sort_key=result_order)
+
+    # Columnar copy for the analyses (loads without parsing the JSON)
+    table.metadata = metadata
+    table.save(table_path(output_file), source=output_file)
+    print(f"Columnar table: {table_path(output_file)}")
+
+    if not server:
+        print_precision_report(model)
+        print()
 
     print("Done!")
     print()
@@ -497,7 +811,99 @@ def main():
         '--top-k',
         type=int,
         default=1000,
-        help='Number of top tokens for class mass (default: 1000)'
+        help='Number of top tokens for class mass, 0 = full vocabulary (default: 1000)'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='Contexts per forward pass, grouped into length buckets (default: autotuned, else 1)'
+    )
+
+    parser.add_argument(
+        '--pack-tokens',
+        type=int,
+        default=None,
+        help='Pack contexts into rows of up to this many tokens with block-diagonal masks; '
+             '--batch-size then counts packed rows (default: autotuned, else 0 = off)'
+    )
+
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=None,
+        help='torch intra-op threads (default: autotuned, else 0 = torch default)'
+    )
+
+    parser.add_argument(
+        '--no-autotune',
+        action='store_true',
+        help='Ignore the settings saved by autotune.py for this host and model'
+    )
+
+    parser.add_argument(
+        '--kv-cache-mb',
+        type=int,
+        default=0,
+        help='Reuse KV caches of shared token prefixes within this memory budget in MB (default: 0 = off)'
+    )
+
+    parser.add_argument(
+        '--dist-cache-mb',
+        type=int,
+        default=0,
+        help='Cache next-token distributions on disk within this budget in MB (default: 0 = off)'
+    )
+
+    parser.add_argument(
+        '--dist-cache-topk',
+        type=int,
+        default=0,
+        help='Store only the top-k log-probs (float16) plus residual mass per cached distribution (default: 0 = full vector)'
+    )
+
+    parser.add_argument(
+        '--dump-distributions',
+        type=str,
+        default=None,
+        help='Directory to dump every next-token distribution to, for distribution_store reanalysis (default: off)'
+    )
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Skip results already streamed to {output}.partial.jsonl by an interrupted run'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Forked CPU worker processes sharing the model weights copy-on-write (default: 1)'
+    )
+
+    parser.add_argument(
+        '--threads-per-worker',
+        type=int,
+        default=0,
+        help='torch intra-op threads per worker (default: 0 = cores / workers)'
+    )
+
+    parser.add_argument(
+        '--dtype',
+        type=str,
+        choices=DTYPES,
+        default=None,
+        help='Inference precision; softmax, entropy and class mass stay fp32 (default: autotuned, else fp32)'
+    )
+
+    parser.add_argument(
+        '--server',
+        type=str,
+        default=None,
+        help='Score through a running scoring_server at this URL, e.g. http://127.0.0.1:8765 '
+             '(default: load the model locally)'
     )
 
     args = parser.parse_args()
@@ -510,12 +916,33 @@ def main():
         model_slug = args.model.replace('/', '_')
         args.output = f'locked_audit_{model_slug}.json'
 
+    # Unset batch size / threads / packing / dtype come from autotune.py's
+    # config for this host and model (not for --server, which batches itself)
+    settings = resolve_settings(
+        args.model, batch_size=args.batch_size, threads=args.threads, pack_tokens=args.pack_tokens,
+        dtype=args.dtype, autotune=not args.no_autotune and not args.server,
+        allow_packing=args.kv_cache_mb == 0,
+    )
+    print_settings(args.model, settings)
+
     run_audit(
         model_name=args.model,
         stimuli_file=args.stimuli,
         output_file=args.output,
         context_lengths=context_lengths,
         top_k=args.top_k,
+        batch_size=settings['batch_size'],
+        pack_tokens=settings['pack_tokens'],
+        kv_cache_mb=args.kv_cache_mb,
+        dist_cache_mb=args.dist_cache_mb,
+        dist_cache_topk=args.dist_cache_topk,
+        dump_distributions=args.dump_distributions,
+        resume=args.resume,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        server=args.server,
+        dtype=settings['dtype'],
+        threads=settings['threads'],
     )
 
 
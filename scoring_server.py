@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Warm-Model Local Scoring Daemon
+
+Every audit script pays 5-40 s for from_pretrained before it scores
+anything. This daemon keeps models loaded and serves next-token
+distributions, class mass and word-aligned token metrics over localhost
+HTTP. Scripts started with --server then load only the tokenizer.
+
+Method:
+- One scoring thread per model owns the model; HTTP handler threads only
+  enqueue requests and wait for their results
+- The scoring thread takes the first queued request, then keeps collecting
+  requests (from any client) for up to --max-wait-ms or until --max-batch
+  contexts, plus any already waiting, and scores them together through the
+  usual length-bucketed batched forward pass (dynamic batching)
+- Clients send at most --max-batch contexts per request (read from
+  /health), so one client's request never fills a batch on its own
+- Requests carry token ids, so the client's tokenizer decides the
+  tokenization exactly as it would in-process
+- Distributions go back as base64 float32 log-probabilities; class mass and
+  token metrics go back as JSON
+
+Endpoints (JSON in, JSON out):
+    GET  /health          loaded models, queue depths, batches served
+    POST /next_token      {model, token_ids: [[...], ...]}
+    POST /class_mass      {model, token_ids, word_sets: {name: [words]}, top_k}
+    POST /token_metrics   {model, texts: [...]}
+
+Usage:
+    # Start the daemon (models not listed are loaded on first request)
+    python scoring_server.py --model gpt2-large --model EleutherAI/pythia-410m
+
+    # Use it from the scripts
+    python run_locked_audit.py --model gpt2-large --server http://127.0.0.1:8765
+    python modal_diagnostics.py --model gpt2-large --server http://127.0.0.1:8765
+
+    # Check that concurrent clients' requests get merged into shared batches
+    python scoring_server.py --check-merging gpt2 --port 0
+
+    # Or directly
+    from scoring_server import connect_remote_model
+    model = connect_remote_model('http://127.0.0.1:8765', 'gpt2-large')
+    for idx, probs, num_tokens in iter_next_token_probs(model, tokenizer, contexts): ...
+"""
+
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+import urllib.error
+import urllib.request
+import queue as queue_module
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from precision import DTYPES, load_scoring_model
+
+if TYPE_CHECKING:
+    import torch
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_URL = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+# Contexts sent per HTTP request by RemoteModel
+CLIENT_CHUNK_SIZE = 64
+
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+
+def encode_array(array: np.ndarray) -> Dict:
+    """float32 array → {'shape', 'data' (base64)} for JSON transport."""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return {'shape': list(array.shape), 'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def decode_array(payload: Dict) -> np.ndarray:
+    """Inverse of encode_array."""
+    data = base64.b64decode(payload['data'])
+    return np.frombuffer(data, dtype=np.float32).reshape(payload['shape']).copy()
+
+
+def _json_default(obj):
+    """Serialize numpy scalars and arrays in metric dicts."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+
+class _Request:
+    """One client request waiting in a model's queue."""
+
+    def __init__(self, kind: str, items: List):
+        self.kind = kind
+        self.items = items
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ModelWorker:
+    """
+    Owns one loaded model and scores queued requests in dynamic batches.
+
+    Attributes:
+        stats: Counters for requests, contexts and batches served
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str = 'cpu',
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        dist_cache_mb: int = 0,
+        dtype: str = 'fp32',
+    ):
+        from transformers import AutoTokenizer
+        from batched_inference import get_pad_token_id
+        from distribution_cache import make_dist_cache
+
+        print(f"Loading {model_name} ({dtype})...")
+        start = time.time()
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = load_scoring_model(model_name, dtype, device)
+        self.device = device
+        self.pad_token_id = get_pad_token_id(self.tokenizer)
+        self.dist_cache = make_dist_cache(self.model, model_name, dist_cache_mb)
+        print(f"  Loaded {model_name} in {time.time() - start:.1f}s")
+
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests: 'queue_module.Queue[_Request]' = queue_module.Queue()
+        self._memberships: Dict[str, object] = {}
+        self.stats = {'requests': 0, 'contexts': 0, 'batches': 0, 'merged_requests': 0}
+
+        self._thread = threading.Thread(target=self._loop, name=f'scorer-{model_name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, items: List) -> List:
+        """Queue items ('next' token-id lists or 'metrics' texts) and wait for their results."""
+        request = _Request(kind, items)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def membership(self, word_sets: Dict[str, Sequence[str]]):
+        """ClassMembership for word_sets (built once per distinct word-set dict)."""
+        from class_membership import ClassMembership
+
+        key = json.dumps({name: sorted(words) for name, words in word_sets.items()}, sort_keys=True)
+        if key not in self._memberships:
+            self._memberships[key] = ClassMembership.from_word_sets(
+                self.tokenizer, {name: set(words) for name, words in word_sets.items()}
+            )
+        return self._memberships[key]
+
+    # ------------------------------------------------------------------
+    # Scoring loop
+    # ------------------------------------------------------------------
+
+    def _collect(self) -> List[_Request]:
+        """
+        Block for one request, then gather more for up to max_wait or max_batch
+        contexts, plus whatever other clients queued while the last batch ran.
+
+        Requests that are already waiting are always taken, even past
+        max_batch: they would be scored next anyway, and scoring them together
+        lets length bucketing fill forward passes across clients.
+        """
+        batch = [self.requests.get()]
+        n_items = len(batch[0].items)
+        deadline = time.monotonic() + self.max_wait
+
+        while n_items < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue_module.Empty:
+                break
+            batch.append(request)
+            n_items += len(request.items)
+
+        while True:
+            try:
+                batch.append(self.requests.get_nowait())
+            except queue_module.Empty:
+                return batch
+
+    def _loop(self):
+        import torch
+
+        while True:
+            batch = self._collect()
+            for kind in ('next', 'metrics'):
+                requests = [r for r in batch if r.kind == kind]
+                if not requests:
+                    continue
+                try:
+                    with torch.no_grad():
+                        results = self._score(kind, [item for r in requests for item in r.items])
+                    offset = 0
+                    for request in requests:
+                        request.result = results[offset:offset + len(request.items)]
+                        offset += len(request.items)
+                except Exception as e:
+                    for request in requests:
+                        request.error = e
+                finally:
+                    for request in requests:
+                        request.done.set()
+
+                self.stats['requests'] += len(requests)
+                self.stats['contexts'] += sum(len(r.items) for r in requests)
+                self.stats['batches'] += 1
+                self.stats['merged_requests'] += len(requests) > 1
+
+    def _score(self, kind: str, items: List) -> List:
+        import torch
+
+        if kind == 'metrics':
+            from word_aligned_metrics import process_texts_with_word_metrics
+            return process_texts_with_word_metrics(self.model, self.tokenizer, items,
+                                                   device=self.device, batch_size=self.max_batch)
+
+        from batched_inference import iter_token_id_probs
+        log_probs = [None] * len(items)
+        for idx, probs, _ in iter_token_id_probs(
+            self.model, items, self.pad_token_id, batch_size=self.max_batch,
+            device=self.device, dist_cache=self.dist_cache,
+        ):
+            log_probs[idx] = torch.log(probs.float().clamp_min(1e-45))
+        return log_probs
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """HTTP front end over one ModelWorker per model."""
+
+    daemon_threads = True
+
+    def __init__(self, address, device='cpu', max_batch=32, max_wait_ms=5.0, dist_cache_mb=0,
+                 dtype='fp32'):
+        super().__init__(address, ScoringHandler)
+        self.device = device
+        self.dtype = dtype
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.dist_cache_mb = dist_cache_mb
+        self.workers: Dict[str, ModelWorker] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def worker(self, model_name: str) -> ModelWorker:
+        """
+        The worker for model_name, loading the model on first use.
+
+        Loads are serialized per model only: requests for warm models never
+        wait on another model's from_pretrained.
+        """
+        worker = self.workers.get(model_name)
+        if worker is not None:
+            return worker
+
+        with self._locks_lock:
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+        with load_lock:
+            if model_name not in self.workers:
+                self.workers[model_name] = ModelWorker(
+                    model_name, device=self.device, max_batch=self.max_batch,
+                    max_wait_ms=self.max_wait_ms, dist_cache_mb=self.dist_cache_mb,
+                    dtype=self.dtype,
+                )
+            return self.workers[model_name]
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """Routes /health, /next_token, /class_mass and /token_metrics."""
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the batching log
+
+    def _send(self, status: int, payload: Dict):
+        body = json.dumps(payload, default=_json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send(404, {'error': f'Unknown endpoint: {self.path}'})
+            return
+        self._send(200, {
+            'max_batch': self.server.max_batch,
+            'models': {
+                name: {**worker.stats, 'queued': worker.requests.qsize(),
+                       'precision': worker.model.precision_stats}
+                for name, worker in list(self.server.workers.items())
+            },
+        })
+
+    def do_POST(self):
+        import torch
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            worker = self.server.worker(request['model'])
+
+            if self.path == '/next_token':
+                log_probs = worker.submit('next', request['token_ids'])
+                self._send(200, {'log_probs': encode_array(torch.stack(log_probs).numpy())})
+
+            elif self.path == '/class_mass':
+                membership = worker.membership(request['word_sets'])
+                log_probs = worker.submit('next', request['token_ids'])
+                mass = membership.class_mass(torch.stack(log_probs).exp(), top_k=request.get('top_k'))
+                self._send(200, {
+                    'class_names': membership.class_names,
+                    'class_mass': mass.tolist(),
+                })
+
+            elif self.path == '/token_metrics':
+                self._send(200, {'metrics': worker.submit('metrics', request['texts'])})
+
+            else:
+                self._send(404, {'error': f'Unknown endpoint: {self.path}'})
+
+        except (KeyError, ValueError) as e:
+            self._send(400, {'error': f'{type(e).__name__}: {e}'})
+        except Exception as e:
+            self._send(500, {'error': f'{type(e).__name__}: {e}'})
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+class ScoringClient:
+    """Thin JSON/HTTP client for a running scoring server."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 600.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, path: str, payload: Optional[Dict] = None) -> Dict:
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            detail = json.loads(e.read()).get('error', e.reason)
+            raise RuntimeError(f"Scoring server error ({e.code}): {detail}") from None
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"No scoring server at {self.url} ({e.reason}); "
+                                  f"start one with: python scoring_server.py") from None
+
+    def health(self) -> Dict:
+        return self._call('/health')
+
+    def next_token_log_probs(self, model_name: str, token_ids: List[List[int]]) -> np.ndarray:
+        """float32 next-token log-probabilities [len(token_ids), vocab_size]."""
+        response = self._call('/next_token', {'model': model_name, 'token_ids': token_ids})
+        return decode_array(response['log_probs'])
+
+    def class_mass(
+        self,
+        model_name: str,
+        token_ids: List[List[int]],
+        word_sets: Dict[str, Sequence[str]],
+        top_k: Optional[int] = None,
+    ) -> List[Dict[str, float]]:
+        """Class mass per context, as {class_name: mass} dicts."""
+        response = self._call('/class_mass', {
+            'model': model_name,
+            'token_ids': token_ids,
+            'word_sets': {name: sorted(words) for name, words in word_sets.items()},
+            'top_k': top_k,
+        })
+        return [dict(zip(response['class_names'], row)) for row in response['class_mass']]
+
+    def token_metrics(self, model_name: str, texts: List[str]) -> List[Dict]:
+        """process_texts_with_word_metrics results, one dict per text."""
+        return self._call('/token_metrics', {'model': model_name, 'texts': texts})['metrics']
+
+
+class RemoteModel:
+    """
+    Stand-in for a loaded causal LM that scores through a scoring server.
+
+    batched_inference.next_token_logits and iter_next_token_probs detect it
+    (is_remote) and forward token ids to the server, so scripts keep their
+    code paths and only swap what they pass as `model`.
+    """
+
+    is_remote = True
+
+    def __init__(self, client: ScoringClient, model_name: str, chunk_size: int = CLIENT_CHUNK_SIZE):
+        self.client = client
+        self.name_or_path = model_name
+        self.chunk_size = chunk_size
+
+    def next_token_logits(self, token_ids: List[int]) -> 'torch.Tensor':
+        """Next-token log-probabilities [vocab_size] (same softmax as the logits)."""
+        import torch
+
+        return torch.from_numpy(self.client.next_token_log_probs(self.name_or_path, [list(token_ids)])[0])
+
+    def iter_next_token_probs(
+        self,
+        token_ids: List[List[int]],
+        batch_size: int = 1,
+    ) -> Iterator[Tuple[int, 'torch.Tensor', int]]:
+        """
+        (index, probs, num_tokens) in input order, chunk_size contexts per request.
+
+        batch_size is accepted for signature compatibility only: the server
+        sets the forward batch, and requests no larger than its max_batch are
+        what lets it merge concurrent clients into one batch.
+        """
+        import torch
+
+        for start in range(0, len(token_ids), self.chunk_size):
+            chunk = [list(ids) for ids in token_ids[start:start + self.chunk_size]]
+            log_probs = torch.from_numpy(self.client.next_token_log_probs(self.name_or_path, chunk))
+            probs = torch.softmax(log_probs, dim=-1)
+            for row, ids in enumerate(chunk):
+                yield start + row, probs[row], len(ids)
+
+
+def connect_remote_model(url: str, model_name: str) -> RemoteModel:
+    """RemoteModel for model_name on the server at url (checks that the server is up)."""
+    client = ScoringClient(url)
+    health = client.health()
+    status = 'loaded' if model_name in health['models'] else 'will be loaded on first request'
+    print(f"Scoring server: {url} ({model_name} {status})")
+    # Servers predating max_batch in /health keep the default chunk
+    chunk_size = min(CLIENT_CHUNK_SIZE, health.get('max_batch', CLIENT_CHUNK_SIZE))
+    return RemoteModel(client, model_name, chunk_size=chunk_size)
+
+
+def check_merging(url: str, model_name: str, clients: int = 4, contexts: int = 256) -> Dict:
+    """
+    Score from several client threads at once and report how the server batched them.
+
+    Returns the model's /health stats accumulated during the check; merging
+    works if merged_requests > 0.
+    """
+    client = ScoringClient(url)
+    before = client.health()['models'].get(model_name, {})
+    model = connect_remote_model(url, model_name)
+    token_ids = [[(11 * i + 3 * j) % 1000 + 1 for j in range(4 + i % 12)] for i in range(contexts)]
+    errors = []
+
+    def score():
+        try:
+            for _ in model.iter_next_token_probs(token_ids):
+                pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=score) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    after = client.health()['models'][model_name]
+    return {key: after[key] - before.get(key, 0)
+            for key in ('requests', 'contexts', 'batches', 'merged_requests')}
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Long-lived local scoring daemon that keeps models warm'
+    )
+    parser.add_argument('--model', action='append', default=None,
+                        help='Model to preload (repeatable; others load on first request)')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST,
+                        help=f'Bind address (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port (default: {DEFAULT_PORT})')
+    parser.add_argument('--max-batch', type=int, default=32,
+                        help='Contexts per merged batch; clients send requests no larger (default: 32)')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='How long a batch waits for other clients\' requests (default: 5)')
+    parser.add_argument('--dist-cache-mb', type=int, default=0,
+                        help='Disk budget for the distribution cache, 0 = off (default: 0)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                        help='Inference precision of every loaded model; metrics stay fp32 (default: fp32)')
+    parser.add_argument('--check-merging', type=str, default=None, metavar='MODEL',
+                        help='Start the server, score MODEL from concurrent clients and exit '
+                             'non-zero unless their requests were merged')
+    args = parser.parse_args()
+
+    import torch
+
+    device = 'cuda' if torch.cuda.is_available() and args.dtype != 'int8-dynamic' else 'cpu'
+    server = ScoringServer((args.host, args.port), device=device, max_batch=args.max_batch,
+                           max_wait_ms=args.max_wait_ms, dist_cache_mb=args.dist_cache_mb,
+                           dtype=args.dtype)
+    for model_name in args.model or []:
+        server.worker(model_name)
+
+    if args.check_merging:
+        server.worker(args.check_merging)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            stats = check_merging(f'http://{args.host}:{server.server_port}', args.check_merging)
+        finally:
+            server.shutdown()
+            server.server_close()
+        print(f"  requests={stats['requests']} contexts={stats['contexts']} "
+              f"batches={stats['batches']} merged_requests={stats['merged_requests']}")
+        if not stats['merged_requests']:
+            print("FAIL: no requests from concurrent clients were merged")
+            return 1
+        print("OK: concurrent clients' requests were merged")
+        return 0
+
+    print(f"Scoring server listening on http://{args.host}:{args.port} (device: {device}, {args.dtype})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
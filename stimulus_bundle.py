@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Precompiled Tokenized Stimulus Bundles
+
+Every audit used to re-tokenize the same stimulus strings for every context
+and re-locate cue words by string splitting. This module compiles a stimulus
+file once per tokenizer into flat arrays, stores them as plain .npy files,
+and memory-maps them on later runs.
+
+Per word of every (stimulus, condition) text:
+- initial ids       the word tokenized as the first word of a context
+                    (tokenizer(word)['input_ids'])
+- continuation ids  the word tokenized after a space (' ' + word, no special
+                    tokens); consecutive words are contiguous, so the
+                    continuation offsets are the word boundaries in token space
+
+The context of words [start, end] is initial(start) followed by one slice of
+continuation ids, so no string is joined or tokenized at audit time.
+
+Per text:
+- cue word index    first word matching the stimulus's cue_word after
+                    stripping punctuation (modal_diagnostics.find_cue_position
+                    rule), -1 if missing; ambiguous matches are kept as well
+- cue token index   last token of that word in the full text's tokenization
+
+Compiling checks every word span of every text against direct tokenization.
+A tokenizer that does not split on spaces this way gets a bundle marked
+inexact, and callers fall back to tokenizing.
+
+Staleness: bundles are keyed by the SHA-256 of the stimulus file's bytes and
+the tokenizer's vocabulary hash, so an edited stimulus file never loads an
+old bundle.
+
+Cache location: $MORPHOSYNTAX_CACHE/stimuli (default ~/.cache/morphosyntax/stimuli)
+
+Usage:
+    from stimulus_bundle import load_stimulus_bundle
+
+    bundle = load_stimulus_bundle('stimuli_locked.json', tokenizer)
+    token_ids = bundle.context_token_ids(stim_idx, 'jabberwocky', start_word, end_word)
+    cue_index, status, message = bundle.find_cue(stim_idx, 'sentence')
+
+    python stimulus_bundle.py --stimuli stimuli_locked.json --model gpt2 --model EleutherAI/pythia-410m
+"""
+
+import os
+import json
+import time
+import hashlib
+import weakref
+import argparse
+import tempfile
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from vocab_annotations import get_cache_root, tokenizer_hash
+
+CONDITIONS = ('sentence', 'jabberwocky', 'full_scrambled',
+              'content_scrambled', 'function_scrambled', 'cue_deleted')
+
+# Same as modal_diagnostics.find_cue_position
+CUE_STRIP_CHARS = '.,!?;:"\'-()[]{}'
+
+# cue_status codes
+CUE_STATUSES = ['ok', 'missing', 'ambiguous']
+CUE_OK, CUE_MISSING, CUE_AMBIGUOUS = range(3)
+
+FORMAT_VERSION = 1
+
+# Bundles already loaded in this process: tokenizer object -> {stimuli hash: bundle}.
+# Weak keys: an id() key could be reused by a new tokenizer once the old one is collected.
+_LOADED: 'weakref.WeakKeyDictionary[object, Dict[str, StimulusBundle]]' = weakref.WeakKeyDictionary()
+
+
+# ============================================================================
+# BUNDLE
+# ============================================================================
+
+def _flatten(rows: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate int rows into (int32 values, int64 offsets of length n+1)."""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    values = np.fromiter((v for row in rows for v in row), dtype=np.int32, count=int(offsets[-1]))
+    return values, offsets
+
+
+class StimulusBundle:
+    """
+    Read-only tokenized stimulus set (arrays are memory-mapped when loaded).
+
+    Text t is stimulus t // len(conditions), condition t % len(conditions).
+
+    Attributes:
+        conditions: Condition keys, in text order
+        cue_words: Each stimulus's cue_word
+        exact: Whether every word span matched direct tokenization
+        text_word_offsets: int64 [n_texts + 1], global word range per text
+        initial_ids / initial_offsets: Per-word ids as a context's first word
+        continuation_ids / continuation_offsets: Per-word ids after a space
+        cue_word_index / cue_token_index: int32 [n_texts], -1 if missing
+        cue_status: uint8 [n_texts], index into CUE_STATUSES
+        cue_matches / cue_match_offsets: Every matching word index per text
+    """
+
+    ARRAYS = ['text_word_offsets', 'initial_ids', 'initial_offsets',
+              'continuation_ids', 'continuation_offsets',
+              'cue_word_index', 'cue_token_index', 'cue_status',
+              'cue_matches', 'cue_match_offsets']
+
+    def __init__(self, arrays: Dict[str, np.ndarray], conditions: List[str], cue_words: List[str], exact: bool):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.conditions = list(conditions)
+        self.cue_words = list(cue_words)
+        self.exact = exact
+        self._condition_index = {condition: i for i, condition in enumerate(self.conditions)}
+
+    def __len__(self) -> int:
+        return len(self.cue_words)
+
+    @classmethod
+    def build(cls, stimuli: List[Dict], tokenizer) -> 'StimulusBundle':
+        """Tokenize every word of every condition once and resolve the cues."""
+        conditions = [c for c in CONDITIONS if c in stimuli[0]] if stimuli else list(CONDITIONS)
+
+        texts_words = [stim[condition].split() for stim in stimuli for condition in conditions]
+        words = [word for text_words in texts_words for word in text_words]
+        unique_words = sorted(set(words))
+        initial = dict(zip(unique_words, tokenizer(unique_words)['input_ids']))
+        continuation = dict(zip(unique_words, tokenizer([' ' + w for w in unique_words],
+                                                        add_special_tokens=False)['input_ids']))
+
+        text_word_offsets = np.zeros(len(texts_words) + 1, dtype=np.int64)
+        text_word_offsets[1:] = np.cumsum([len(text_words) for text_words in texts_words])
+        initial_ids, initial_offsets = _flatten([initial[w] for w in words])
+        continuation_ids, continuation_offsets = _flatten([continuation[w] for w in words])
+
+        cue_word_index, cue_token_index, cue_status, cue_matches = [], [], [], []
+        for t, text_words in enumerate(texts_words):
+            cue = stimuli[t // len(conditions)]['cue_word'].lower()
+            matches = [i for i, w in enumerate(text_words) if w.lower().strip(CUE_STRIP_CHARS) == cue]
+            cue_matches.append(matches)
+            if not matches:
+                cue_word_index.append(-1)
+                cue_token_index.append(-1)
+                cue_status.append(CUE_MISSING)
+                continue
+            first = int(text_word_offsets[t])
+            cue_g = first + matches[0]
+            n_first = initial_offsets[first + 1] - initial_offsets[first]
+            cue_word_index.append(matches[0])
+            cue_token_index.append(int(n_first + continuation_offsets[cue_g + 1]
+                                       - continuation_offsets[first + 1] - 1))
+            cue_status.append(CUE_OK if len(matches) == 1 else CUE_AMBIGUOUS)
+        cue_matches, cue_match_offsets = _flatten(cue_matches)
+
+        bundle = cls({
+            'text_word_offsets': text_word_offsets,
+            'initial_ids': initial_ids,
+            'initial_offsets': initial_offsets,
+            'continuation_ids': continuation_ids,
+            'continuation_offsets': continuation_offsets,
+            'cue_word_index': np.array(cue_word_index, dtype=np.int32),
+            'cue_token_index': np.array(cue_token_index, dtype=np.int32),
+            'cue_status': np.array(cue_status, dtype=np.uint8),
+            'cue_matches': cue_matches,
+            'cue_match_offsets': cue_match_offsets,
+        }, conditions, [stim['cue_word'] for stim in stimuli], exact=True)
+        bundle.exact = bundle.verify(stimuli, tokenizer)
+        return bundle
+
+    def verify(self, stimuli: List[Dict], tokenizer) -> bool:
+        """Check every word span of every text against tokenizer(' '.join(span))."""
+        spans, contexts = [], []
+        for stim_idx, stim in enumerate(stimuli):
+            for condition in self.conditions:
+                text_words = stim[condition].split()
+                for end in range(len(text_words)):
+                    for start in range(end + 1):
+                        spans.append((stim_idx, condition, start, end))
+                        contexts.append(' '.join(text_words[start:end + 1]))
+
+        expected = tokenizer(contexts)['input_ids'] if contexts else []
+        return all(self.context_token_ids(*span) == ids for span, ids in zip(spans, expected))
+
+    @classmethod
+    def load(cls, directory: str) -> 'StimulusBundle':
+        """Memory-map a saved bundle."""
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+        return cls({
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in cls.ARRAYS
+        }, metadata['conditions'], metadata['cue_words'], metadata['exact'])
+
+    def save(self, directory: str, metadata: Dict):
+        """Write the bundle atomically (temp dir + rename) so readers never see half a bundle."""
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(getattr(self, name)))
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+            json.dump({**metadata, 'conditions': self.conditions, 'exact': self.exact,
+                       'cue_words': self.cue_words}, f, indent=2)
+
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another process finished first; keep its copy
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+            os.rmdir(tmp_dir)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def text_index(self, stim_idx: int, condition: str) -> int:
+        return stim_idx * len(self.conditions) + self._condition_index[condition]
+
+    def num_words(self, stim_idx: int, condition: str) -> int:
+        t = self.text_index(stim_idx, condition)
+        return int(self.text_word_offsets[t + 1] - self.text_word_offsets[t])
+
+    def context_token_ids(self, stim_idx: int, condition: str, start: int, end: int) -> List[int]:
+        """
+        Token ids of words start..end (inclusive) of a text, as tokenizer(context) gives them.
+
+        Args:
+            stim_idx: Stimulus index in the stimulus file
+            condition: Condition key (e.g. 'jabberwocky')
+            start: First word index (0-indexed)
+            end: Last word index, e.g. the cue position
+        """
+        g = int(self.text_word_offsets[self.text_index(stim_idx, condition)])
+        ids = self.initial_ids[self.initial_offsets[g + start]:self.initial_offsets[g + start + 1]].tolist()
+        ids += self.continuation_ids[self.continuation_offsets[g + start + 1]:
+                                     self.continuation_offsets[g + end + 1]].tolist()
+        return ids
+
+    def find_cue(self, stim_idx: int, condition: str,
+                 cue_word: Optional[str] = None) -> Tuple[Optional[int], str, str]:
+        """
+        (cue_index, status, message) exactly as modal_diagnostics.find_cue_position returns them.
+
+        cue_word only changes how the cue is spelled in the message (default:
+        the stimulus's cue_word); matching always uses the compiled cue.
+        """
+        t = self.text_index(stim_idx, condition)
+        status = CUE_STATUSES[self.cue_status[t]]
+        matches = self.cue_matches[self.cue_match_offsets[t]:self.cue_match_offsets[t + 1]].tolist()
+        cue_word = self.cue_words[stim_idx] if cue_word is None else cue_word
+        if status == 'missing':
+            return None, status, f"Cue '{cue_word}' not found in text"
+        if status == 'ok':
+            return matches[0], status, f"Cue '{cue_word}' found at position {matches[0]}"
+        return matches[0], status, (f"Cue '{cue_word}' found {len(matches)} times at positions {matches}, "
+                                    f"using first")
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+def get_cache_dir() -> str:
+    """Root directory for stimulus bundles."""
+    return os.path.join(get_cache_root(), 'stimuli')
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's bytes (the bundle's staleness key)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bundle_directory(stimuli_hash: str, tokenizer, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or get_cache_dir(),
+                        f'{stimuli_hash[:16]}-{tokenizer_hash(tokenizer)}-v{FORMAT_VERSION}')
+
+
+def load_stimulus_bundle(stimuli_file: str, tokenizer, stimuli: Optional[List[Dict]] = None,
+                         cache_dir: Optional[str] = None) -> StimulusBundle:
+    """
+    Load (memory-mapped) or compile-and-save the bundle for a stimulus file and tokenizer.
+
+    Args:
+        stimuli_file: Stimulus JSON the bundle is compiled from
+        tokenizer: HuggingFace tokenizer
+        stimuli: The file's already-parsed contents (optional; saves a re-read)
+        cache_dir: Override for the bundle root (default: get_cache_dir())
+
+    Returns:
+        StimulusBundle (check .exact before using its token ids)
+    """
+    stimuli_hash = file_hash(stimuli_file)
+    loaded = _LOADED.setdefault(tokenizer, {})
+    if stimuli_hash in loaded:
+        return loaded[stimuli_hash]
+
+    directory = bundle_directory(stimuli_hash, tokenizer, cache_dir)
+    if os.path.exists(os.path.join(directory, 'metadata.json')):
+        bundle = StimulusBundle.load(directory)
+    else:
+        if stimuli is None:
+            with open(stimuli_file) as f:
+                stimuli = json.load(f)
+        bundle = StimulusBundle.build(stimuli, tokenizer)
+        try:
+            bundle.save(directory, {
+                'format_version': FORMAT_VERSION,
+                'stimuli_file': os.path.abspath(stimuli_file),
+                'stimuli_sha256': stimuli_hash,
+                'tokenizer': getattr(tokenizer, 'name_or_path', ''),
+                'tokenizer_class': type(tokenizer).__name__,
+                'num_stimuli': len(stimuli),
+                'num_tokens': int(len(bundle.continuation_ids) + len(bundle.initial_ids)),
+                'cue_statuses': CUE_STATUSES,
+            })
+        except OSError as e:
+            print(f"  Warning: could not save stimulus bundle to {directory}: {e}")
+
+    loaded[stimuli_hash] = bundle
+    return bundle
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compile (or verify) tokenized stimulus bundles'
+    )
+    parser.add_argument('--stimuli', type=str, default='stimuli_locked.json',
+                        help='Stimulus JSON (default: stimuli_locked.json)')
+    parser.add_argument('--model', action='append', default=None,
+                        help='HuggingFace model/tokenizer name (repeatable, default: gpt2)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Bundle root (default: $MORPHOSYNTAX_CACHE/stimuli)')
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    for model_name in args.model or ['gpt2']:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        start = time.time()
+        bundle = load_stimulus_bundle(args.stimuli, tokenizer, cache_dir=args.cache_dir)
+        seconds = time.time() - start
+        directory = bundle_directory(file_hash(args.stimuli), tokenizer, args.cache_dir)
+        statuses = np.bincount(np.asarray(bundle.cue_status), minlength=len(CUE_STATUSES))
+        print(f"{model_name}: {len(bundle)} stimuli × {len(bundle.conditions)} conditions, "
+              f"{len(bundle.continuation_ids)} tokens, exact={bundle.exact}, "
+              f"cues {dict(zip(CUE_STATUSES, statuses.tolist()))} ({seconds:.2f}s) → {directory}")
+
+
+if __name__ == '__main__':
+    main()
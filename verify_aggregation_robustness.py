@@ -17,15 +17,21 @@ robustness to aggregation methodology.
 import torch
 import numpy as np
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from word_aligned_metrics import process_text_with_word_metrics
+from transformers import AutoTokenizer
+from word_aligned_metrics import process_texts_with_word_metrics
+from precision import DTYPES, load_scoring_model, print_precision_report
 from collections import defaultdict
 
 def run_verification_experiment(stimuli_file='stimuli_tokenization_matched_normalized.json',
                                 model_name='gpt2',
-                                n_items=5):
+                                n_items=5,
+                                batch_size=8,
+                                dtype='fp32'):
     """
     Run experiment on subset of stimuli and verify aggregation robustness.
+
+    All texts are scored in padded batches of up to batch_size texts, at
+    inference precision dtype (metrics are always computed in fp32).
     """
     print("=" * 80)
     print("AGGREGATION ROBUSTNESS VERIFICATION")
@@ -34,11 +40,10 @@ def run_verification_experiment(stimuli_file='stimuli_tokenization_matched_norma
     print(f"Testing on first {n_items} stimulus sets\n")
 
     # Load model
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"Loading model... (device: {device})")
+    device = 'cuda' if torch.cuda.is_available() and dtype != 'int8-dynamic' else 'cpu'
+    print(f"Loading model... (device: {device}, {dtype})")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
-    model.eval()
+    model = load_scoring_model(model_name, dtype, device)
 
     # Load stimuli
     with open(stimuli_file, 'r') as f:
@@ -53,26 +58,29 @@ def run_verification_experiment(stimuli_file='stimuli_tokenization_matched_norma
         'word_sum': defaultdict(list)
     }
 
-    # Process each stimulus set
-    print("\nProcessing stimulus sets...")
+    # Collect every (condition, text) pair in stimulus order
+    jobs = []
     for item in stimuli:
-        set_id = item['set_id']
-        print(f"  Set {set_id}...", end='\r')
-
         for condition in ['sentence', 'jabberwocky_matched',
                          'word_list_real', 'skeleton_function_words',
                          'scrambled_jabberwocky', 'swapped_function_words']:
             if condition not in item:
                 continue
+            jobs.append((condition, item[condition]))
 
-            text = item[condition]
-            metrics = process_text_with_word_metrics(model, tokenizer, text, device)
+    # Process all texts in batches
+    print(f"\nProcessing {len(jobs)} texts from {len(stimuli)} stimulus sets...")
+    all_metrics = process_texts_with_word_metrics(
+        model, tokenizer, [text for _, text in jobs], device, batch_size=batch_size
+    )
 
-            # Store both aggregation methods
-            results['word_mean'][condition].append(metrics['mean_word_entropy'])
-            results['word_sum'][condition].append(metrics['mean_word_entropy_sum'])
+    for (condition, _), metrics in zip(jobs, all_metrics):
+        # Store both aggregation methods
+        results['word_mean'][condition].append(metrics['mean_word_entropy'])
+        results['word_sum'][condition].append(metrics['mean_word_entropy_sum'])
 
     print("\nProcessing complete!\n")
+    print_precision_report(model)
 
     # Compute means for each condition under both methods
     print("=" * 80)
@@ -201,6 +209,10 @@ if __name__ == "__main__":
                        help='Number of stimulus sets to test (default: 5 for quick check)')
     parser.add_argument('--stimuli', type=str, default='stimuli_tokenization_matched_normalized.json',
                        help='Stimuli file to use')
+    parser.add_argument('--batch-size', type=int, default=8,
+                       help='Texts per forward pass (default: 8)')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='fp32',
+                       help='Inference precision; entropy and surprisal stay fp32 (default: fp32)')
     parser.add_argument('--analyze-results', type=str,
                        help='Analyze existing results file instead of running new experiment')
 
@@ -212,5 +224,7 @@ if __name__ == "__main__":
         run_verification_experiment(
             stimuli_file=args.stimuli,
             model_name=args.model,
-            n_items=args.n_items
+            n_items=args.n_items,
+            batch_size=args.batch_size,
+            dtype=args.dtype
         )
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Persistent Per-Tokenizer Vocabulary Annotations
+
+Every analysis script re-derives the same facts about each token id by calling
+tokenizer.decode in its hot loops. This module computes them once per
+tokenizer, stores them on disk as plain .npy files, and memory-maps them on
+later runs (milliseconds instead of ~50k decode calls).
+
+Per token id:
+- token string     decoded string (tokenizer.decode([token_id]))
+- is_word_start    space/newline-prefixed, non-special (WordLevelAnalyzer rule)
+- word             token.strip().lower().strip('.,!?;:"\'-') for word-start tokens
+- token_class      word_start / punctuation / fragment
+                   (word_class_constraint_audit.classify_token rule)
+- has_negation     modal_diagnostics.contains_negation rule
+
+Tables are keyed by a SHA-256 hash of the tokenizer's vocabulary, so gpt2,
+gpt2-medium and gpt2-large share one table while Pythia gets its own.
+
+Cache location: $MORPHOSYNTAX_CACHE/vocab (default ~/.cache/morphosyntax/vocab)
+
+Usage:
+    from vocab_annotations import load_vocab_annotations
+
+    annotations = load_vocab_annotations(tokenizer)
+    annotations.is_word_start[token_id], annotations.word(token_id)
+
+    python vocab_annotations.py --model gpt2 --model EleutherAI/pythia-410m
+"""
+
+import os
+import json
+import hashlib
+import weakref
+import argparse
+import tempfile
+import numpy as np
+from typing import Dict, List, Optional
+
+SPECIAL_TOKEN_STRINGS = {'<|endoftext|>', '<unk>', '<pad>', ''}
+WORD_STRIP_CHARS = '.,!?;:"\'-'
+
+# Same as modal_diagnostics.NEG_SET
+NEG_SET = {'not', "n't", "nt"}
+
+# token_class codes
+TOKEN_CLASSES = ['word_start', 'punctuation', 'fragment']
+WORD_START, PUNCTUATION, FRAGMENT = range(3)
+
+FORMAT_VERSION = 1
+
+# Tables already loaded in this process, by tokenizer object. Weak keys: an
+# id() key could be reused by a new tokenizer once the old one is collected.
+_LOADED: 'weakref.WeakKeyDictionary[object, VocabAnnotations]' = weakref.WeakKeyDictionary()
+
+
+# ============================================================================
+# ANNOTATION RULES
+# ============================================================================
+
+def token_to_word(token_str: str) -> Optional[str]:
+    """Normalized word for a decoded token string, or None if not word-start."""
+    if token_str in SPECIAL_TOKEN_STRINGS:
+        return None
+    if token_str.startswith(' ') or token_str.startswith('\n'):
+        return token_str.strip().lower().strip(WORD_STRIP_CHARS)
+    return None
+
+
+def classify_token_string(token_str: str) -> int:
+    """word_start / punctuation / fragment code (word_class_constraint_audit rule)."""
+    if not token_str:
+        return FRAGMENT
+    if token_str[0] == ' ' and len(token_str) > 1 and token_str[1].isalpha():
+        return WORD_START
+    if token_str.strip() in '.,!?;:"\'-':
+        return PUNCTUATION
+    return FRAGMENT
+
+
+def contains_negation(token_str: str) -> bool:
+    """Check if token contains negation (modal_diagnostics rule, incl. n't)."""
+    token_lower = token_str.lower().strip()
+    if token_lower in NEG_SET:
+        return True
+    return "n't" in token_lower or "nt" in token_lower
+
+
+# ============================================================================
+# TABLE
+# ============================================================================
+
+def _pack_strings(strings: List[str]):
+    """Pack strings into (uint8 UTF-8 blob, int64 offsets of length n+1)."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    return blob, offsets
+
+
+class VocabAnnotations:
+    """
+    Read-only per-token annotation table (arrays are memory-mapped when loaded).
+
+    Attributes:
+        is_word_start: bool [vocab_size]
+        token_class: uint8 [vocab_size], index into TOKEN_CLASSES
+        has_negation: bool [vocab_size]
+    """
+
+    ARRAYS = ['is_word_start', 'token_class', 'has_negation',
+              'token_bytes', 'token_offsets', 'word_bytes', 'word_offsets']
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self._token_strs = None
+        self._words = None
+
+    def __len__(self) -> int:
+        return len(self.is_word_start)
+
+    @classmethod
+    def build(cls, tokenizer) -> 'VocabAnnotations':
+        """Decode the whole vocabulary once and derive every annotation."""
+        token_strs = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+        words = [token_to_word(token_str) for token_str in token_strs]
+
+        token_bytes, token_offsets = _pack_strings(token_strs)
+        word_bytes, word_offsets = _pack_strings([w if w is not None else '' for w in words])
+
+        return cls({
+            'is_word_start': np.array([w is not None for w in words], dtype=bool),
+            'token_class': np.array([classify_token_string(t) for t in token_strs], dtype=np.uint8),
+            'has_negation': np.array([contains_negation(t) for t in token_strs], dtype=bool),
+            'token_bytes': token_bytes,
+            'token_offsets': token_offsets,
+            'word_bytes': word_bytes,
+            'word_offsets': word_offsets,
+        })
+
+    @classmethod
+    def load(cls, directory: str) -> 'VocabAnnotations':
+        """Memory-map a saved table."""
+        return cls({
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in cls.ARRAYS
+        })
+
+    def save(self, directory: str, metadata: Dict):
+        """Write the table atomically (temp dir + rename) so readers never see half a table."""
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(getattr(self, name)))
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another process finished first; keep its copy
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+            os.rmdir(tmp_dir)
+
+    def word_start(self, token_id: int) -> bool:
+        """Word-start flag; ids past the tokenizer (padded LM-head rows) are never word-start."""
+        return token_id < len(self) and bool(self.is_word_start[token_id])
+
+    def token_str(self, token_id: int) -> str:
+        """Decoded token string (same as tokenizer.decode([token_id]))."""
+        if token_id >= len(self):
+            return ''
+        start, end = self.token_offsets[token_id], self.token_offsets[token_id + 1]
+        return bytes(self.token_bytes[start:end]).decode('utf-8')
+
+    def word(self, token_id: int) -> Optional[str]:
+        """Normalized word, or None if the token is not word-start."""
+        if not self.word_start(token_id):
+            return None
+        start, end = self.word_offsets[token_id], self.word_offsets[token_id + 1]
+        return bytes(self.word_bytes[start:end]).decode('utf-8')
+
+    def token_strs(self) -> List[str]:
+        """All decoded token strings (materialized once)."""
+        if self._token_strs is None:
+            blob = bytes(self.token_bytes)
+            offsets = self.token_offsets.tolist()
+            self._token_strs = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(self))]
+        return self._token_strs
+
+    def words(self) -> List[Optional[str]]:
+        """All normalized words, None for non-word-start tokens (materialized once)."""
+        if self._words is None:
+            blob = bytes(self.word_bytes)
+            offsets = self.word_offsets.tolist()
+            flags = self.is_word_start.tolist()
+            self._words = [
+                blob[offsets[i]:offsets[i + 1]].decode('utf-8') if flags[i] else None
+                for i in range(len(self))
+            ]
+        return self._words
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+def get_cache_root() -> str:
+    """Root of all on-disk morphosyntax caches ($MORPHOSYNTAX_CACHE)."""
+    return os.environ.get('MORPHOSYNTAX_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'morphosyntax'))
+
+
+def get_cache_dir() -> str:
+    """Root directory for annotation tables."""
+    return os.path.join(get_cache_root(), 'vocab')
+
+
+def tokenizer_hash(tokenizer) -> str:
+    """Content hash of the tokenizer's vocabulary (token → id, incl. added tokens)."""
+    vocab = sorted(tokenizer.get_vocab().items(), key=lambda item: item[1])
+    payload = json.dumps([FORMAT_VERSION, type(tokenizer).__name__, vocab], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def load_vocab_annotations(tokenizer, cache_dir: Optional[str] = None) -> VocabAnnotations:
+    """
+    Load (memory-mapped) or build-and-save the annotation table for a tokenizer.
+
+    Args:
+        tokenizer: HuggingFace tokenizer
+        cache_dir: Override for the table root (default: get_cache_dir())
+
+    Returns:
+        VocabAnnotations
+    """
+    if tokenizer in _LOADED:
+        return _LOADED[tokenizer]
+
+    directory = os.path.join(cache_dir or get_cache_dir(), tokenizer_hash(tokenizer))
+
+    if os.path.exists(os.path.join(directory, 'metadata.json')):
+        annotations = VocabAnnotations.load(directory)
+    else:
+        annotations = VocabAnnotations.build(tokenizer)
+        try:
+            annotations.save(directory, {
+                'format_version': FORMAT_VERSION,
+                'tokenizer': getattr(tokenizer, 'name_or_path', ''),
+                'tokenizer_class': type(tokenizer).__name__,
+                'vocab_size': len(annotations),
+                'token_classes': TOKEN_CLASSES,
+            })
+        except OSError as e:
+            print(f"  Warning: could not save vocab annotations to {directory}: {e}")
+
+    _LOADED[tokenizer] = annotations
+    return annotations
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build (or verify) cached vocabulary annotation tables'
+    )
+    parser.add_argument('--model', action='append', default=None,
+                        help='HuggingFace model/tokenizer name (repeatable, default: gpt2)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Table root (default: $MORPHOSYNTAX_CACHE/vocab)')
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    for model_name in args.model or ['gpt2']:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        annotations = load_vocab_annotations(tokenizer, cache_dir=args.cache_dir)
+        directory = os.path.join(args.cache_dir or get_cache_dir(), tokenizer_hash(tokenizer))
+        print(f"{model_name}: {len(annotations)} tokens, "
+              f"{int(np.sum(annotations.is_word_start))} word-start → {directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,13 @@ This is NECESSARY but does not eliminate all tokenization confounds -
 we still need normalization and tokenization matching.
 """
 
-import torch
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from batched_inference import get_pad_token_id, guard_sequence_logits, make_length_buckets, pad_batch
+
+if TYPE_CHECKING:
+    import torch
 
 def map_tokens_to_words(text: str, token_offsets: List[Tuple[int, int]]) -> List[List[int]]:
     """
@@ -46,19 +50,24 @@ def map_tokens_to_words(text: str, token_offsets: List[Tuple[int, int]]) -> List
         word_starts.append(current_word_start)
         word_ends.append(len(text))
 
-    # Map tokens to words based on overlap
+    # Map tokens to words based on overlap. Offsets are sorted by start, so a
+    # single word pointer sweeps forward instead of rescanning every word
     word_to_tokens = [[] for _ in range(len(word_starts))]
 
+    word_idx = 0
+    prev_start = 0
     for token_idx, (tok_start, tok_end) in enumerate(token_offsets):
-        # Find which word(s) this token overlaps with
-        for word_idx in range(len(word_starts)):
-            word_start = word_starts[word_idx]
-            word_end = word_ends[word_idx]
+        if tok_start < prev_start:
+            word_idx = 0  # Out-of-order offsets: restart the sweep
+        prev_start = tok_start
+
+        # Skip words that end before this token starts
+        while word_idx < len(word_starts) and word_ends[word_idx] <= tok_start:
+            word_idx += 1
 
-            # Check for overlap
-            if tok_start < word_end and tok_end > word_start:
-                word_to_tokens[word_idx].append(token_idx)
-                break  # Assign to first matching word
+        # Check for overlap with the first remaining word
+        if word_idx < len(word_starts) and tok_end > word_starts[word_idx]:
+            word_to_tokens[word_idx].append(token_idx)
 
     return word_to_tokens
 
@@ -111,7 +120,7 @@ def compute_word_aligned_metrics(text: str,
         'mean_word_surprisal_sum': np.mean(word_surprisals_sum) if word_surprisals_sum else 0,
     }
 
-def calculate_entropy_and_surprisal(logits: torch.Tensor,
+def calculate_entropy_and_surprisal(logits: 'torch.Tensor',
                                     actual_token_id: int) -> Tuple[float, float]:
     """
     Calculate both entropy and surprisal from logits.
@@ -123,6 +132,8 @@ def calculate_entropy_and_surprisal(logits: torch.Tensor,
     Returns:
         (entropy, surprisal) tuple
     """
+    import torch
+
     # Convert logits to probabilities
     probs = torch.softmax(logits, dim=-1)
 
@@ -149,6 +160,8 @@ def process_text_with_word_metrics(model, tokenizer, text: str, device='cpu') ->
     Returns:
         Dict with comprehensive metrics at both token and word levels
     """
+    import torch
+
     # Tokenize with offset mapping
     encoding = tokenizer(text, return_tensors="pt", return_offsets_mapping=True,
                         add_special_tokens=False)
@@ -191,6 +204,142 @@ def process_text_with_word_metrics(model, tokenizer, text: str, device='cpu') ->
         **word_metrics
     }
 
+# ============================================================================
+# BATCHED ENGINE
+# ============================================================================
+
+def segment_word_metrics(text: str,
+                         token_entropies: np.ndarray,
+                         token_surprisals: np.ndarray,
+                         token_offsets: List[Tuple[int, int]]) -> Dict:
+    """
+    Word-level aggregation with segment reductions (same output as
+    compute_word_aligned_metrics).
+
+    Each token gets the index of the word it overlaps (-1 for none); per-word
+    sums and counts then come from np.bincount instead of Python lists.
+    """
+    word_to_tokens = map_tokens_to_words(text, token_offsets)
+    n_words = len(word_to_tokens)
+
+    token_word = np.full(len(token_offsets), -1, dtype=np.int64)
+    for word_idx, token_indices in enumerate(word_to_tokens):
+        token_word[token_indices] = word_idx
+
+    valid = token_word >= 0
+    counts = np.bincount(token_word[valid], minlength=n_words)
+    ent_sum = np.bincount(token_word[valid], weights=token_entropies[valid], minlength=n_words)
+    surp_sum = np.bincount(token_word[valid], weights=token_surprisals[valid], minlength=n_words)
+
+    has_tokens = counts > 0
+    word_entropies_sum = ent_sum[has_tokens]
+    word_surprisals_sum = surp_sum[has_tokens]
+    word_entropies_mean = word_entropies_sum / counts[has_tokens]
+    word_surprisals_mean = word_surprisals_sum / counts[has_tokens]
+
+    return {
+        'n_words': n_words,
+        'word_entropies_mean': word_entropies_mean.tolist(),
+        'word_entropies_sum': word_entropies_sum.tolist(),
+        'word_surprisals_mean': word_surprisals_mean.tolist(),
+        'word_surprisals_sum': word_surprisals_sum.tolist(),
+        'mean_word_entropy': np.mean(word_entropies_mean) if has_tokens.any() else 0,
+        'mean_word_entropy_sum': np.mean(word_entropies_sum) if has_tokens.any() else 0,
+        'mean_word_surprisal': np.mean(word_surprisals_mean) if has_tokens.any() else 0,
+        'mean_word_surprisal_sum': np.mean(word_surprisals_sum) if has_tokens.any() else 0,
+    }
+
+def batch_entropy_and_surprisal(logits: 'torch.Tensor',
+                                input_ids: 'torch.Tensor') -> Tuple['torch.Tensor', 'torch.Tensor']:
+    """
+    Entropy and surprisal at every position of a padded batch from one log_softmax.
+
+    Uses the same 1e-10 smoothing as calculate_entropy_and_surprisal.
+
+    Args:
+        logits: [batch, seq_len, vocab] model logits
+        input_ids: [batch, seq_len] token ids
+
+    Returns:
+        (entropy, actual_prob): [batch, seq_len - 1] tensors for predicting
+        token t+1 from position t (padding positions are garbage; mask them)
+    """
+    import torch
+
+    log_probs = torch.log_softmax(logits[:, :-1, :].float(), dim=-1)
+    probs = log_probs.exp()
+
+    entropy = -(probs * torch.log2(probs + 1e-10)).sum(dim=-1)
+    actual_prob = probs.gather(-1, input_ids[:, 1:].unsqueeze(-1)).squeeze(-1)
+
+    return entropy, actual_prob
+
+def process_texts_with_word_metrics(model, tokenizer, texts: List[str], device='cpu',
+                                    batch_size: int = 16) -> List[Dict]:
+    """
+    Batched version of process_text_with_word_metrics for many texts.
+
+    Texts are sorted by token length into right-padded batches with an
+    attention mask; entropy and surprisal for all positions come from a
+    single log_softmax per batch, and word-level aggregation uses a linear
+    offset sweep plus segment reductions.
+
+    Args:
+        model: The language model
+        tokenizer: The tokenizer (fast tokenizer, for offset mappings)
+        texts: Input texts
+        device: Device to run on
+        batch_size: Texts per forward pass
+
+    Returns:
+        List of metric dicts, one per text, in input order (same keys and
+        values as process_text_with_word_metrics)
+    """
+    import torch
+
+    encodings = [tokenizer(text, return_offsets_mapping=True, add_special_tokens=False)
+                 for text in texts]
+    token_ids = [encoding['input_ids'] for encoding in encodings]
+    pad_token_id = get_pad_token_id(tokenizer)
+    results = [None] * len(texts)
+
+    for bucket in make_length_buckets(token_ids, batch_size):
+        # Empty texts still need one (padding) column to run
+        rows = [token_ids[i] or [pad_token_id] for i in bucket]
+        input_ids, attention_mask, _ = pad_batch(rows, pad_token_id, device)
+
+        with torch.no_grad():
+            logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+        logits = guard_sequence_logits(model, logits, rows)
+
+        entropy, actual_prob = batch_entropy_and_surprisal(logits, input_ids)
+        entropy = entropy.cpu().numpy()
+        actual_prob = actual_prob.cpu().numpy()
+
+        for row, i in enumerate(bucket):
+            n = max(len(token_ids[i]) - 1, 0)
+            token_entropies = entropy[row, :n].astype(np.float64)
+            token_surprisals = -np.log2(actual_prob[row, :n].astype(np.float64) + 1e-10)
+
+            word_metrics = segment_word_metrics(
+                texts[i], token_entropies, token_surprisals,
+                encodings[i]['offset_mapping'][:n]  # Exclude last offset
+            )
+
+            results[i] = {
+                # Token-level metrics (secondary)
+                'n_tokens': n,
+                'token_entropies': token_entropies.tolist(),
+                'token_surprisals': token_surprisals.tolist(),
+                'mean_token_entropy': np.mean(token_entropies) if n else 0,
+                'mean_token_surprisal': np.mean(token_surprisals) if n else 0,
+
+                # Word-level metrics (primary)
+                **word_metrics
+            }
+
+    return results
+
 if __name__ == "__main__":
     # Test the word-aligned metrics
     from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -13,6 +13,8 @@ import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import numpy as np
 
+from vocab_annotations import TOKEN_CLASSES, load_vocab_annotations
+
 def classify_token(token_str, tokenizer_vocab):
     """
     Classify token as:
@@ -58,13 +60,14 @@ def analyze_position(model, tokenizer, text, target_position, k=100):
         probs = torch.softmax(next_token_logits, dim=-1)
         top_k_probs, top_k_ids = torch.topk(probs, k)
 
-    # Classify and accumulate probabilities
+    # Classify and accumulate probabilities (precomputed per-token classes)
+    annotations = load_vocab_annotations(tokenizer)
     class_probs = {'word_start': 0.0, 'punctuation': 0.0, 'fragment': 0.0}
     candidates = []
 
     for prob, token_id in zip(top_k_probs, top_k_ids):
-        token_str = tokenizer.decode([token_id])
-        token_class = classify_token(token_str, tokenizer.get_vocab())
+        token_str = annotations.token_str(token_id.item())
+        token_class = TOKEN_CLASSES[annotations.token_class[token_id.item()]]
 
         class_probs[token_class] += prob.item()
         candidates.append({
@@ -10,9 +10,16 @@ Handles BPE tokenization issues by:
 This avoids artifacts from multi-token nonce words in Jabberwocky conditions.
 """
 
-import torch
+import re
 import numpy as np
-from typing import Dict, Set, List, Tuple, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from batched_inference import guard_sequence_logits, next_token_logits
+from class_membership import ClassMembership
+from vocab_annotations import load_vocab_annotations
+
+if TYPE_CHECKING:
+    import torch
 
 
 class WordLevelAnalyzer:
@@ -25,23 +32,29 @@ class WordLevelAnalyzer:
     - Aggregates probability mass by word class
     """
 
-    def __init__(self, tokenizer, cue_families: Dict):
+    def __init__(self, tokenizer, cue_families: Dict, dist_cache=None):
         """
         Initialize analyzer.
 
         Args:
             tokenizer: HuggingFace tokenizer (GPT-2, Pythia, etc.)
             cue_families: Dictionary of cue family definitions from cue_families.py
+            dist_cache: Optional distribution_cache.DistributionCache consulted
+                before every forward pass
         """
         self.tokenizer = tokenizer
         self.cue_families = cue_families
+        self.dist_cache = dist_cache
 
-        # Cache for token → word mappings
-        self._token_to_word_cache = {}
+        # Cached per-tokenizer token annotations (word-start flags, words)
+        self.annotations = load_vocab_annotations(tokenizer)
 
         # Cache for word → class memberships
         self._word_class_cache = {}
 
+        # Cache for vocabulary × class membership matrices (per family)
+        self._membership_cache = {}
+
     def is_word_start_token(self, token_id: int) -> bool:
         """
         Check if token represents start of a word.
@@ -55,14 +68,7 @@ class WordLevelAnalyzer:
         Returns:
             Boolean indicating if token is word-start
         """
-        token_str = self.tokenizer.decode([token_id])
-
-        # Special case: single-token special tokens
-        if token_str in ['<|endoftext|>', '<unk>', '<pad>']:
-            return False
-
-        # Word-start tokens begin with space in GPT-2/Pythia
-        return token_str.startswith(' ') or token_str.startswith('\n')
+        return self.annotations.word_start(token_id)
 
     def get_word_from_token(self, token_id: int) -> Optional[str]:
         """
@@ -74,19 +80,7 @@ class WordLevelAnalyzer:
         Returns:
             Word string (lowercase) or None if not a word-start token
         """
-        if token_id in self._token_to_word_cache:
-            return self._token_to_word_cache[token_id]
-
-        if not self.is_word_start_token(token_id):
-            self._token_to_word_cache[token_id] = None
-            return None
-
-        token_str = self.tokenizer.decode([token_id])
-        # Remove leading space/newline, lowercase, strip punctuation
-        word = token_str.strip().lower().strip('.,!?;:"\'-')
-
-        self._token_to_word_cache[token_id] = word
-        return word
+        return self.annotations.word(token_id)
 
     def get_word_classes(self, word: str, family_name: str) -> Set[str]:
         """
@@ -115,7 +109,7 @@ class WordLevelAnalyzer:
 
     def compute_class_mass(
         self,
-        probs: torch.Tensor,
+        probs: 'torch.Tensor',
         family_name: str,
         top_k: int = 1000
     ) -> Dict[str, float]:
@@ -127,34 +121,27 @@ class WordLevelAnalyzer:
         Args:
             probs: Probability distribution over vocabulary (shape: [vocab_size])
             family_name: Cue family name
-            top_k: Number of top tokens to consider (default: 1000)
+            top_k: Number of top tokens to consider (default: 1000; 0 = full vocabulary)
 
         Returns:
             Dictionary mapping class names to probability mass
             Example: {'VERB': 0.42, 'NOUN': 0.18}
         """
-        # Get top-k predictions
-        top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
+        # One matrix product over the (top-k masked) distribution
+        return self.get_membership(family_name).class_mass_dict(probs, top_k=top_k)
 
-        # Initialize class mass
-        family = self.cue_families[family_name]
-        class_mass = {class_name: 0.0 for class_name in family['expected_classes'].keys()}
-
-        # Aggregate probability by word class
-        for prob, token_id in zip(top_k_probs, top_k_ids):
-            word = self.get_word_from_token(token_id.item())
-
-            if word is None:
-                continue  # Skip non-word-start tokens
-
-            # Check which classes this word belongs to
-            word_classes = self.get_word_classes(word, family_name)
-
-            # Add probability to each class
-            for class_name in word_classes:
-                class_mass[class_name] += prob.item()
+    def get_membership(self, family_name: str) -> ClassMembership:
+        """
+        Vocabulary × class membership matrix for a cue family's expected classes.
 
-        return class_mass
+        Built once per family from the tokenizer's full vocabulary.
+        """
+        if family_name not in self._membership_cache:
+            family = self.cue_families[family_name]
+            self._membership_cache[family_name] = ClassMembership.from_word_sets(
+                self.tokenizer, family['expected_classes']
+            )
+        return self._membership_cache[family_name]
 
     def find_cue_positions(
         self,
@@ -191,7 +178,9 @@ class WordLevelAnalyzer:
         text: str,
         family_name: str,
         model,
-        top_k: int = 1000
+        top_k: int = 1000,
+        full_context: bool = False,
+        return_probs: bool = False
     ) -> List[Dict]:
         """
         Analyze model predictions after each cue word in text.
@@ -201,6 +190,10 @@ class WordLevelAnalyzer:
             family_name: Cue family name
             model: Language model (HuggingFace)
             top_k: Number of top tokens to consider
+            full_context: If True, score every cue from one forward pass over
+                the full text (see analyze_all_cue_predictions)
+            return_probs: If True, each result also carries the full
+                next-token distribution under 'probs' (CPU tensor)
 
         Returns:
             List of dictionaries, one per cue occurrence:
@@ -215,6 +208,13 @@ class WordLevelAnalyzer:
                 ...
             ]
         """
+        import torch
+
+        if full_context:
+            return self.analyze_all_cue_predictions(
+                text, [family_name], model, top_k=top_k, return_probs=return_probs
+            )[family_name]
+
         # Find cue positions
         cue_positions = self.find_cue_positions(text, family_name)
 
@@ -225,17 +225,10 @@ class WordLevelAnalyzer:
 
         for word_idx, cue_word, context in cue_positions:
             # Tokenize context
-            inputs = self.tokenizer(context, return_tensors='pt')
-
-            # Move inputs to same device as model
-            device = next(model.parameters()).device
-            inputs = {k: v.to(device) for k, v in inputs.items()}
+            token_ids = self.tokenizer(context)['input_ids']
 
-            # Get model predictions
-            with torch.no_grad():
-                outputs = model(**inputs)
-
-            logits = outputs.logits[0, -1, :]  # Last token position
+            # Get model predictions (LM head at the last token position only)
+            logits = next_token_logits(model, token_ids, dist_cache=self.dist_cache)
             probs = torch.softmax(logits, dim=-1)
 
             # Compute class mass
@@ -246,8 +239,157 @@ class WordLevelAnalyzer:
                 'word_index': word_idx,
                 'context': context,
                 'class_mass': class_mass,
-                'num_tokens': len(inputs['input_ids'][0]),
+                'num_tokens': len(token_ids),
             })
+            if return_probs:
+                results[-1]['probs'] = probs.cpu()
+
+        return results
+
+    def get_full_text_logits(
+        self,
+        text: str,
+        model
+    ) -> Tuple['torch.Tensor', List[Tuple[int, int]]]:
+        """
+        Run one forward pass over the full text.
+
+        Under causal attention the logits at token t only depend on tokens
+        0..t, so row t equals the last-position logits of the prefix that
+        ends at token t.
+
+        Args:
+            text: Sentence text
+            model: Language model (HuggingFace)
+
+        Returns:
+            (logits of shape [num_tokens, vocab_size], per-token character offsets)
+        """
+        import torch
+
+        encoding = self.encode_with_offsets(text)
+        offsets = [tuple(span) for span in encoding.pop('offset_mapping')[0].tolist()]
+
+        device = next(model.parameters()).device
+        inputs = {k: v.to(device) for k, v in encoding.items()}
+
+        with torch.no_grad():
+            outputs = model(**inputs)
+
+        logits = guard_sequence_logits(model, outputs.logits, [encoding['input_ids'][0].tolist()])
+        return logits[0], offsets
+
+    def encode_with_offsets(self, text: str):
+        """Tokenize text (as tensors) with character offsets; needs a fast tokenizer."""
+        if not getattr(self.tokenizer, 'is_fast', False):
+            raise ValueError("Full-context mode requires a fast tokenizer (offset mappings)")
+
+        return self.tokenizer(text, return_tensors='pt', return_offsets_mapping=True)
+
+    @staticmethod
+    def find_last_subtoken(offsets: List[Tuple[int, int]], word_end: int) -> int:
+        """
+        Index of the final subtoken of the word ending at character word_end.
+
+        Args:
+            offsets: Per-token (start, end) character offsets
+            word_end: Character offset one past the word's last character
+
+        Returns:
+            Token index (the logit row predicting the next word)
+        """
+        last = -1
+        for i, (start, end) in enumerate(offsets):
+            if end > start and start < word_end:
+                last = i
+        return last
+
+    def analyze_all_cue_predictions(
+        self,
+        text: str,
+        family_names: List[str],
+        model,
+        top_k: int = 1000,
+        return_probs: bool = False
+    ) -> Dict[str, List[Dict]]:
+        """
+        Analyze predictions after every cue of every family from one forward pass.
+
+        Equivalent to calling analyze_cue_predictions(text, family, model) for
+        each family, as long as the text is single-space separated (the
+        per-cue mode re-joins words with single spaces).
+
+        Args:
+            text: Sentence text
+            family_names: Cue family names to score
+            model: Language model (HuggingFace)
+            top_k: Number of top tokens to consider
+            return_probs: If True, results also carry 'probs' (see
+                analyze_cue_predictions)
+
+        Returns:
+            Dictionary mapping family name to the list of per-cue results
+            (same entries as analyze_cue_predictions)
+        """
+        import torch
+
+        cue_positions = {
+            family_name: self.find_cue_positions(text, family_name)
+            for family_name in family_names
+        }
+
+        if not any(cue_positions.values()):
+            return {family_name: [] for family_name in family_names}
+
+        encoding = self.encode_with_offsets(text)
+        token_ids = encoding['input_ids'][0].tolist()
+        offsets = [tuple(span) for span in encoding['offset_mapping'][0].tolist()]
+        word_ends = [m.end() for m in re.finditer(r'\S+', text)]
+
+        cue_tokens = {
+            family_name: [self.find_last_subtoken(offsets, word_ends[word_idx])
+                          for word_idx, _, _ in cue_positions[family_name]]
+            for family_name in family_names
+        }
+        needed = sorted({t for tokens in cue_tokens.values() for t in tokens})
+
+        # One softmax per distinct cue token, shared across families
+        probs_cache = {}
+        if self.dist_cache is not None:
+            for token_idx in needed:
+                log_probs = self.dist_cache.get(token_ids, token_idx) if token_idx >= 0 else None
+                if log_probs is not None:
+                    probs_cache[token_idx] = torch.softmax(log_probs, dim=-1)
+
+        # Forward pass only if some cue position is not cached
+        missing = [t for t in needed if t not in probs_cache]
+        if missing:
+            logits, _ = self.get_full_text_logits(text, model)
+            for token_idx in missing:
+                probs_cache[token_idx] = torch.softmax(logits[token_idx], dim=-1)
+                if self.dist_cache is not None and token_idx >= 0:
+                    self.dist_cache.put(token_ids, logits[token_idx], position=token_idx)
+
+        results = {}
+
+        for family_name in family_names:
+            results[family_name] = []
+
+            for (word_idx, cue_word, context), token_idx in zip(cue_positions[family_name],
+                                                                cue_tokens[family_name]):
+                probs = probs_cache[token_idx]
+
+                class_mass = self.compute_class_mass(probs, family_name, top_k=top_k)
+
+                results[family_name].append({
+                    'cue_word': cue_word,
+                    'word_index': word_idx,
+                    'context': context,
+                    'class_mass': class_mass,
+                    'num_tokens': token_idx + 1,
+                })
+                if return_probs:
+                    results[family_name][-1]['probs'] = probs.cpu()
 
         return results
 
@@ -275,6 +417,7 @@ class POSTaggerAnalyzer:
         self.tokenizer = tokenizer
         self.nlp = nlp
         self.cue_families = cue_families
+        self.annotations = load_vocab_annotations(tokenizer)
 
         # Mapping from spaCy POS tags to our word classes
         self.pos_to_class = {
@@ -289,17 +432,11 @@ class POSTaggerAnalyzer:
 
     def is_word_start_token(self, token_id: int) -> bool:
         """Check if token is word-start."""
-        token_str = self.tokenizer.decode([token_id])
-        if token_str in ['<|endoftext|>', '<unk>', '<pad>']:
-            return False
-        return token_str.startswith(' ') or token_str.startswith('\n')
+        return self.annotations.word_start(token_id)
 
     def get_word_from_token(self, token_id: int) -> Optional[str]:
         """Extract word from token."""
-        if not self.is_word_start_token(token_id):
-            return None
-        token_str = self.tokenizer.decode([token_id])
-        return token_str.strip().lower().strip('.,!?;:"\'-')
+        return self.annotations.word(token_id)
 
     def classify_word(self, word: str, family_name: str) -> Set[str]:
         """
@@ -341,11 +478,13 @@ class POSTaggerAnalyzer:
 
     def compute_class_mass(
         self,
-        probs: torch.Tensor,
+        probs: 'torch.Tensor',
         family_name: str,
         top_k: int = 1000
     ) -> Dict[str, float]:
         """Compute class mass using POS tagger."""
+        import torch
+
         top_k_probs, top_k_ids = torch.topk(probs, min(top_k, len(probs)))
 
         family = self.cue_families[family_name]
@@ -392,7 +531,7 @@ class ClassifierBasedAnalyzer:
 
     def compute_class_mass(
         self,
-        probs: torch.Tensor,
+        probs: 'torch.Tensor',
         family_name: str,
         top_k: int = 1000
     ) -> Dict[str, float]: